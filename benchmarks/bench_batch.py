@@ -0,0 +1,136 @@
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2013, Jose F. Maldonado
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+#
+#    - Redistributions of source code must retain the above copyright notice, this 
+#    list of conditions and the following disclaimer.
+#    - Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation and/or 
+#    other materials provided with the distribution.
+#    - Neither the name of the author nor the names of its contributors may be used 
+#    to endorse or promote products derived from this software without specific prior 
+#    written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+# SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+# DAMAGE.
+#
+# -------------------------------------------------------------------------------------
+#
+# Benchmark of the read-ahead of the batch engine.
+#
+# The stages of a batch that call GIMP (decode, filter and encode) are serialised by
+# the lock of the procedural database, so within one plug-in the only work which can
+# overlap with them is reading the next input files before they are decoded. This
+# benchmark runs the same batch with and without that read-ahead: the decode stage
+# reads each file and calculates a checksum of his contents (in place of the decoder
+# of the format) and the encode stage writes it in the output folder, both while 
+# holding the lock.
+#
+# The read-ahead only pays off when the files are not in the cache of the operating
+# system (for example, in a network file system or in a slow disk); otherwise it is a
+# second read of each file. The files generated by the benchmark are in the cache, so
+# use --input for measuring a real folder. The results are printed as JSON, for example:
+#
+#   python2 benchmarks/bench_batch.py --input /mnt/photos --workers 4
+
+import json
+import optparse
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+def make_files(folder, files, size):
+    ''' Creates the input files of the benchmark, filled with random bytes. '''
+    for i in range(files):
+        with open(os.path.join(folder, "file%05d.bin" % i), "wb") as output:
+            output.write(os.urandom(size))
+
+def decode(item):
+    ''' Reads a file, like the loader of a format. '''
+    with open(item.inputPath, "rb") as source:
+        item.data = source.read()
+    item.checksum = zlib.crc32(item.data)
+
+def encode(item):
+    ''' Writes the contents of a file in the output folder. '''
+    with open(item.outputPath, "wb") as output:
+        output.write(item.data)
+    item.data = None
+
+def run_case(inputFolder, outputFolder, workers, readAhead, repeat):
+    ''' Executes one case, and returns his results (the best time of several repetitions). '''
+    from fusamples.batch import BatchPipeline, Stage, scan_folder
+    best = None
+    for i in range(repeat):
+        pipeline = BatchPipeline([Stage("decode", decode), Stage("encode", encode)], workers, 0, None, None, readAhead)
+        stats = pipeline.run(scan_folder(inputFolder, outputFolder))
+        best = stats if best is None or stats.seconds < best.seconds else best
+    return {
+        "read_ahead": readAhead,
+        "workers": workers,
+        "files": best.processed,
+        "megabytes": best.bytesIn / (1024.0 * 1024.0),
+        "seconds": best.seconds,
+        "files_per_second": best.processed / best.seconds if best.seconds > 0 else None,
+    }
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("--input", default="", help="folder of the input files [default: generated files]")
+    parser.add_option("--files", type="int", default=200, help="number of generated files [default: %default]")
+    parser.add_option("--size", type="int", default=1048576, help="size of the generated files [default: %default]")
+    parser.add_option("--workers", type="int", default=4, help="number of workers [default: %default]")
+    parser.add_option("--repeat", type="int", default=3, help="repetitions of each case [default: %default]")
+    options, args = parser.parse_args()
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+    
+    # Generate the input files, if no folder is given.
+    tempFolder = tempfile.mkdtemp(prefix="bench-batch-")
+    try:
+        inputFolder = options.input
+        if(not inputFolder):
+            inputFolder = os.path.join(tempFolder, "input")
+            os.makedirs(inputFolder)
+            make_files(inputFolder, options.files, options.size)
+        outputFolder = os.path.join(tempFolder, "output")
+        os.makedirs(outputFolder)
+        
+        results = []
+        for readAhead in (False, True):
+            result = run_case(inputFolder, outputFolder, options.workers, readAhead, options.repeat)
+            results.append(result)
+            sys.stderr.write("read-ahead %-5s: %.3f s, %.1f files/s\n" % (readAhead, result["seconds"], result["files_per_second"] or 0))
+    finally:
+        shutil.rmtree(tempFolder, True)
+    
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    json.dump(report, sys.stdout, indent=2, sort_keys=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
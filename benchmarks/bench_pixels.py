@@ -0,0 +1,244 @@
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2013, Jose F. Maldonado
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+#
+#    - Redistributions of source code must retain the above copyright notice, this 
+#    list of conditions and the following disclaimer.
+#    - Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation and/or 
+#    other materials provided with the distribution.
+#    - Neither the name of the author nor the names of its contributors may be used 
+#    to endorse or promote products derived from this software without specific prior 
+#    written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+# SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+# DAMAGE.
+#
+# -------------------------------------------------------------------------------------
+#
+# Benchmark of the pixel level plug-ins (discolour layer v1 to v5 and split channels).
+#
+# The plug-ins are executed outside of GIMP, using the stand-in of the 'gimpfu' module
+# defined in 'fakegimp.py', over RGB and RGBA images of several sizes. Each case is
+# executed in a new process, so the peak memory of one case is not affected by the
+# others. The results are printed (or saved) as JSON, for example:
+#
+#   python2 benchmarks/bench_pixels.py --sizes 256,512 --variants v3,v4 --output results.json
+#
+# For each case the following values are reported: the total time, the pixels per
+# second, the time spent in each phase ('read', 'write' and 'flush' are measured inside
+# the stand-in, 'setup' is the time spent creating and clearing layers, and 'compute' is
+# the remaining time), the peak memory of the process (in KB), a CRC32 of the resulting
+# layers and the messages displayed by the plug-in.
+#
+# Note that the plug-ins are written for the Python 2 interpreter of GIMP, so this
+# script must also be executed with Python 2.
+
+import json
+import optparse
+import os
+import platform
+import subprocess
+import sys
+import time
+import zlib
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+# Plug-ins that can be measured: name -> (script, procedure, extra arguments).
+VARIANTS = {
+    "v1": ("test-discolour-layer-v1.py", "python_fu_test_discolour_layer_v1", ()),
+    "v2": ("test-discolour-layer-v2.py", "python_fu_test_discolour_layer_v2_options", (True,)),
+    "v2-new-layer": ("test-discolour-layer-v2.py", "python_fu_test_discolour_layer_v2_options", (False,)),
+    "v3": ("test-discolour-layer-v3.py", "python_fu_test_discolour_layer_v3_options", (True, 0)),
+    "v3-new-layer": ("test-discolour-layer-v3.py", "python_fu_test_discolour_layer_v3_options", (False, 0)),
+    "v3-bands": ("test-discolour-layer-v3.py", "python_fu_test_discolour_layer_v3_options", (True, 16)),
+    "v4": ("test-discolour-layer-v4.py", "python_fu_test_discolour_layer_v4_options", (True,)),
+    "v4-new-layer": ("test-discolour-layer-v4.py", "python_fu_test_discolour_layer_v4_options", (False,)),
+    "v4-parallel": ("test-discolour-layer-v4.py", "python_fu_test_discolour_layer_v4_parallel", (0, 0, 4)),
+    "layers": ("test-discolour-layers.py", "python_fu_test_discolour_layers", (False, "", True, 0, 0, 4)),
+    "v5": ("test-discolour-layer-v5.py", "python_fu_test_discolour_layer_v5", (True, 0)),
+    "v5-rec709": ("test-discolour-layer-v5.py", "python_fu_test_discolour_layer_v5", (True, 2)),
+    "v5-linear": ("test-discolour-layer-v5.py", "python_fu_test_discolour_layer_v5", (True, 3)),
+    "v5-array": ("test-discolour-layer-v5.py", "python_fu_test_discolour_layer_v5", (False, 0)),
+    "split": ("test-split-channels.py", "python_fu_test_split_channels_options", ("R,G,B",)),
+    "lut": ("test-point-operation.py", "python_fu_test_point_operation", (0,)),
+    "pipeline": ("test-filter-pipeline.py", "python_fu_test_filter_pipeline", ("discolour|invert|channel:R",)),
+}
+
+DEFAULT_VARIANTS = "v1,v2,v2-new-layer,v3,v3-new-layer,v3-bands,v4,v4-new-layer,v4-parallel,v5,v5-array,split,lut,pipeline"
+DEFAULT_SIZES = "256,512,1024,2048,4096,8192"
+DEFAULT_MODES = "RGB,RGBA"
+
+def install_fakegimp():
+    ''' Installs the stand-in of 'gimpfu' and returns it. '''
+    if BENCH_DIR not in sys.path:
+        sys.path.insert(0, BENCH_DIR)
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+    import fakegimp
+    sys.modules["gimpfu"] = fakegimp
+    return fakegimp
+
+def load_plugin(script):
+    ''' Executes a plug-in script, so his procedures are registered in the stand-in.
+    
+    Parameters:
+    script : string The file name of the script (relative to the root folder).
+    '''
+    path = os.path.join(ROOT_DIR, script)
+    namespace = { "__name__": os.path.splitext(script)[0].replace("-", "_"), "__file__": path }
+    with open(path) as source:
+        code = compile(source.read(), path, "exec")
+    exec(code, namespace)
+
+def peak_memory():
+    ''' Returns the peak resident memory of the process, in KB (or None if it is unknown). '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak = peak // 1024
+    return peak
+
+def run_case(variant, size, mode):
+    ''' Executes one case in the current process, and returns his results.
+    
+    Parameters:
+    variant : string The name of the plug-in (one of the keys of VARIANTS).
+    size : int The width and height of the image.
+    mode : string The mode of the image ('RGB' or 'RGBA').
+    '''
+    fakegimp = install_fakegimp()
+    script, procName, extraArgs = VARIANTS[variant]
+    load_plugin(script)
+    procedure = fakegimp.procedures[procName]
+    
+    # Create the image.
+    imageType = fakegimp.RGBA_IMAGE if mode == "RGBA" else fakegimp.RGB_IMAGE
+    img = fakegimp.new_image(size, size, imageType)
+    baseMemory = peak_memory()
+    
+    # Execute the plug-in.
+    fakegimp.stats.reset()
+    start = time.time()
+    procedure(img, img.layers[0], *extraArgs)
+    total = time.time() - start
+    
+    # Calculate the phases and the checksum of the result.
+    phases = dict(fakegimp.stats.phases)
+    phases["compute"] = max(0.0, total - sum(phases.values()))
+    checksum = 0
+    for layer in img.layers:
+        checksum = zlib.crc32(bytes(layer.data), checksum)
+    
+    return {
+        "variant": variant,
+        "mode": mode,
+        "width": size,
+        "height": size,
+        "pixels": size * size,
+        "status": "ok" if not fakegimp.stats.messages else "error",
+        "seconds": total,
+        "pixels_per_second": (size * size) / total if total > 0 else None,
+        "phases": phases,
+        "base_memory_kb": baseMemory,
+        "peak_memory_kb": peak_memory(),
+        "checksum": "%08x" % (checksum & 0xffffffff),
+        "messages": fakegimp.stats.messages,
+    }
+
+def spawn_case(variant, size, mode, timeout):
+    ''' Executes one case in a new process, and returns his results.
+    
+    Parameters:
+    variant : string The name of the plug-in (one of the keys of VARIANTS).
+    size : int The width and height of the image.
+    mode : string The mode of the image ('RGB' or 'RGBA').
+    timeout : float The maximum number of seconds that the case can take (0 for no limit).
+    '''
+    args = [sys.executable, os.path.abspath(__file__), "--case", "%s:%d:%s" % (variant, size, mode)]
+    child = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    
+    # Wait for the process (Python 2 does not support timeouts in communicate()).
+    start = time.time()
+    while child.poll() is None:
+        if timeout > 0 and time.time() - start > timeout:
+            child.kill()
+            child.wait()
+            return { "variant": variant, "mode": mode, "width": size, "height": size, "status": "timeout", "seconds": time.time() - start }
+        time.sleep(0.05)
+    
+    out, err = child.communicate()
+    if child.returncode != 0:
+        return { "variant": variant, "mode": mode, "width": size, "height": size, "status": "crash", "error": err.decode("utf-8", "replace") }
+    return json.loads(out.decode("utf-8"))
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("--variants", default=DEFAULT_VARIANTS, help="comma separated list of plug-ins (%s)" % ",".join(sorted(VARIANTS)))
+    parser.add_option("--sizes", default=DEFAULT_SIZES, help="comma separated list of image sizes [default: %default]")
+    parser.add_option("--modes", default=DEFAULT_MODES, help="comma separated list of image modes [default: %default]")
+    parser.add_option("--timeout", type="float", default=600, help="maximum seconds per case, 0 for no limit [default: %default]")
+    parser.add_option("--output", help="file in which to save the results (by default they are printed)")
+    parser.add_option("--case", help=optparse.SUPPRESS_HELP)
+    options, args = parser.parse_args()
+    
+    # Execute a single case (used by the child processes).
+    if options.case:
+        variant, size, mode = options.case.split(":")
+        json.dump(run_case(variant, int(size), mode), sys.stdout)
+        return 0
+    
+    variants = options.variants.split(",")
+    for variant in variants:
+        if variant not in VARIANTS:
+            parser.error("unknown variant: " + variant)
+    
+    # Execute the cases, skipping the larger sizes of a variant once it has timed out.
+    results = []
+    for mode in options.modes.split(","):
+        for variant in variants:
+            timedOut = False
+            for size in [int(s) for s in options.sizes.split(",")]:
+                if timedOut:
+                    results.append({ "variant": variant, "mode": mode, "width": size, "height": size, "status": "skipped" })
+                    continue
+                result = spawn_case(variant, size, mode, options.timeout)
+                timedOut = result["status"] == "timeout"
+                results.append(result)
+                sys.stderr.write("%-9s %-4s %5d: %s\n" % (variant, mode, size, result["status"]))
+    
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    if options.output:
+        with open(options.output, "w") as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2013, Jose F. Maldonado
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+#
+#    - Redistributions of source code must retain the above copyright notice, this 
+#    list of conditions and the following disclaimer.
+#    - Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation and/or 
+#    other materials provided with the distribution.
+#    - Neither the name of the author nor the names of its contributors may be used 
+#    to endorse or promote products derived from this software without specific prior 
+#    written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+# SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+# DAMAGE.
+#
+# -------------------------------------------------------------------------------------
+#
+# Benchmark of the order in which the pixels of a layer are walked.
+#
+# The same per-pixel computation (the gray value of each pixel) is executed over the
+# buffer of a wide layer and of a tall layer with the same number of pixels, walking
+# the buffer in row-major order (as the pixel level plug-ins do with the scanlines of
+# 'fusamples/scan.py') and in column-major order (as the first versions of the plug-ins
+# did). Both walks index the buffer in the same way, so they only differ in the order
+# of the accesses. The pixels are stored by rows, so the column-major walk jumps a whole
+# row of the layer in each step and each access falls in a different cache line.
+#
+# Note that the time of the interpreter dominates the time of the memory accesses, so
+# over a buffer in memory both orders have nearly the same speed (within a few percent).
+# The order matters when the pixels are read from GIMP, where each access of the 
+# column-major walk falls in a different tile. The results are printed as JSON, for 
+# example:
+#
+#   python2 benchmarks/bench_scan.py --pixels 8000000 --ratio 256
+
+import json
+import optparse
+import os
+import platform
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+def walk_rows(data, width, height, pixelSize):
+    ''' Calculates the sum of the gray values of a buffer, walking it by rows. '''
+    total = 0
+    rowSize = width * pixelSize
+    for y in range(height):
+        for pos in range(y * rowSize, (y + 1) * rowSize, pixelSize):
+            total += (data[pos] + data[pos + 1] + data[pos + 2]) // 3
+    return total
+
+def walk_columns(data, width, height, pixelSize):
+    ''' Calculates the sum of the gray values of a buffer, walking it by columns. '''
+    total = 0
+    rowSize = width * pixelSize
+    for x in range(width):
+        for pos in range(x * pixelSize, len(data), rowSize):
+            total += (data[pos] + data[pos + 1] + data[pos + 2]) // 3
+    return total
+
+def run_case(order, width, height, pixelSize, repeat):
+    ''' Executes one case, and returns his results (the best time of several repetitions). '''
+    data = bytearray(os.urandom(width * height * pixelSize))
+    function = walk_rows if order == "rows" else walk_columns
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        checksum = function(data, width, height, pixelSize)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {
+        "order": order,
+        "width": width,
+        "height": height,
+        "pixels": width * height,
+        "seconds": best,
+        "pixels_per_second": (width * height) / best if best > 0 else None,
+        "checksum": checksum,
+    }
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("--pixels", type="int", default=4194304, help="number of pixels of the layers [default: %default]")
+    parser.add_option("--ratio", type="int", default=64, help="width / height of the wide layer (and height / width of the tall one) [default: %default]")
+    parser.add_option("--bpp", type="int", default=4, help="bytes per pixel [default: %default]")
+    parser.add_option("--repeat", type="int", default=3, help="repetitions of each case [default: %default]")
+    options, args = parser.parse_args()
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+    
+    # Calculate the sizes of the wide and tall layers.
+    side = int(round((options.pixels // options.ratio) ** 0.5))
+    shapes = { "wide": (side * options.ratio, side), "tall": (side, side * options.ratio) }
+    
+    results = []
+    for shape in ("wide", "tall"):
+        width, height = shapes[shape]
+        for order in ("rows", "columns"):
+            result = run_case(order, width, height, options.bpp, options.repeat)
+            result["shape"] = shape
+            results.append(result)
+            sys.stderr.write("%-4s %-7s %6dx%-6d: %.3f s\n" % (shape, order, width, height, result["seconds"]))
+    
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    json.dump(report, sys.stdout, indent=2, sort_keys=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,611 @@
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2013, Jose F. Maldonado
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+#
+#    - Redistributions of source code must retain the above copyright notice, this 
+#    list of conditions and the following disclaimer.
+#    - Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation and/or 
+#    other materials provided with the distribution.
+#    - Neither the name of the author nor the names of its contributors may be used 
+#    to endorse or promote products derived from this software without specific prior 
+#    written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+# SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+# DAMAGE.
+#
+# -------------------------------------------------------------------------------------
+#
+# Local stand-in of the 'gimpfu' module, which allows to execute the plug-ins outside
+# of GIMP (for example, for measuring their performance).
+#
+# Only the subset of the API used by the samples is implemented. The layers keep their
+# pixels in memory, and the time spent inside the pixel access methods is accumulated
+# by phase ('read', 'write', 'flush' and 'setup') in the 'stats' object.
+#
+# Usage:
+# >>> import sys, fakegimp
+# >>> sys.modules["gimpfu"] = fakegimp
+# >>> # Now the plug-ins can be imported, and their functions are in fakegimp.procedures.
+
+import re
+import time
+import zlib
+
+# Image types.
+RGB_IMAGE = 0
+RGBA_IMAGE = 1
+GRAY_IMAGE = 2
+GRAYA_IMAGE = 3
+INDEXED_IMAGE = 4
+INDEXEDA_IMAGE = 5
+
+# Image base types.
+RGB, GRAY, INDEXED = range(3)
+
+# Layer modes.
+NORMAL_MODE = 0
+
+# Fill types.
+FOREGROUND_FILL, BACKGROUND_FILL, WHITE_FILL, TRANSPARENT_FILL, PATTERN_FILL = range(5)
+
+# Parameter types used in the 'register' calls.
+PF_INT8, PF_INT16, PF_INT32, PF_INT, PF_FLOAT, PF_STRING, PF_VALUE = range(7)
+PF_COLOR, PF_COLOUR, PF_REGION, PF_DISPLAY, PF_IMAGE, PF_LAYER, PF_CHANNEL, PF_DRAWABLE = range(7, 15)
+PF_TOGGLE, PF_BOOL, PF_RADIO, PF_SLIDER, PF_SPINNER, PF_ADJUSTMENT, PF_FONT, PF_FILE = range(15, 23)
+PF_BRUSH, PF_PATTERN, PF_GRADIENT, PF_PALETTE, PF_FILENAME, PF_DIRNAME, PF_OPTION, PF_TEXT = range(23, 31)
+
+# Bytes per pixel of each image type.
+_BPP = { RGB_IMAGE: 3, RGBA_IMAGE: 4, GRAY_IMAGE: 1, GRAYA_IMAGE: 2, INDEXED_IMAGE: 1, INDEXEDA_IMAGE: 2 }
+
+# Base type of the images of each image type.
+_BASE_TYPE = { RGB_IMAGE: RGB, RGBA_IMAGE: RGB, GRAY_IMAGE: GRAY, GRAYA_IMAGE: GRAY, INDEXED_IMAGE: INDEXED, INDEXEDA_IMAGE: INDEXED }
+
+# Size of the tiles.
+TILE_WIDTH = 64
+TILE_HEIGHT = 64
+
+class Stats(object):
+    ''' Accumulates the time spent in each phase, and the messages displayed. '''
+    def __init__(self):
+        self.reset()
+    
+    def reset(self):
+        self.phases = { "read": 0.0, "write": 0.0, "flush": 0.0, "setup": 0.0 }
+        self.calls = {}
+        self.messages = []
+        self.progress = []
+    
+    def add(self, phase, start):
+        self.phases[phase] += time.time() - start
+    
+    def count(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+stats = Stats()
+
+# Procedures registered by the plug-ins, indexed by his name.
+procedures = {}
+
+class Image(object):
+    ''' Stand-in of gimp.Image. '''
+    def __init__(self, width, height, type=RGB):
+        self.width = width
+        self.height = height
+        self.base_type = type
+        self.layers = []
+        self.filename = None
+        self.selection = Channel(self, "Selection", width, height)
+    
+    def add_layer(self, layer, position=-1):
+        pdb.gimp_image_insert_layer(self, layer, None, position)
+    
+    def remove_layer(self, layer):
+        _container(layer).remove(layer)
+    
+    @property
+    def active_layer(self):
+        return self.layers[0] if self.layers else None
+    
+    def select_rectangle(self, x, y, width, height, value=255):
+        ''' Adds a rectangle to the selection (it is not part of the real API). '''
+        sel = self.selection
+        for row in range(max(0, y), min(y + height, self.height)):
+            start = row * self.width
+            sel.data[start + max(0, x) : start + min(x + width, self.width)] = bytearray([value]) * (min(x + width, self.width) - max(0, x))
+    
+    def select_none(self):
+        self.selection.data[:] = bytearray(len(self.selection.data))
+
+class Layer(object):
+    ''' Stand-in of gimp.Layer, which keeps his pixels in memory. '''
+    def __init__(self, img, name, width, height, type=RGB_IMAGE, opacity=100, mode=NORMAL_MODE):
+        start = time.time()
+        self.image = img
+        self.name = name
+        self.width = width
+        self.height = height
+        self.type = type
+        self.opacity = opacity
+        self.mode = mode
+        self.offsets = (0, 0)
+        self.parent = None
+        self.bpp = _BPP[type]
+        self.has_alpha = type in (RGBA_IMAGE, GRAYA_IMAGE, INDEXEDA_IMAGE)
+        self.is_rgb = type in (RGB_IMAGE, RGBA_IMAGE)
+        self.is_gray = type in (GRAY_IMAGE, GRAYA_IMAGE)
+        self.is_indexed = type in (INDEXED_IMAGE, INDEXEDA_IMAGE)
+        self.data = bytearray(width * height * self.bpp)
+        self.shadow = None
+        stats.add("setup", start)
+    
+    def _buffer(self, shadow):
+        if(not shadow):
+            return self.data
+        if(self.shadow is None):
+            self.shadow = bytearray(self.data)
+        return self.shadow
+    
+    def _selection(self):
+        ''' Returns the selection of the image if it is not empty, or None. '''
+        if(self.image is None or self is self.image.selection or not any(self.image.selection.data)):
+            return None
+        return self.image.selection
+    
+    @property
+    def mask_bounds(self):
+        nonEmpty, x, y, width, height = _mask_intersect(self)
+        return (x, y, x + width, y + height)
+    
+    def set_offsets(self, x, y):
+        self.offsets = (x, y)
+    
+    def get_pixel(self, x, y):
+        start = time.time()
+        pos = (y * self.width + x) * self.bpp
+        pixel = tuple(self.data[pos : pos + self.bpp])
+        stats.add("read", start)
+        return pixel
+    
+    def set_pixel(self, x, y, pixel):
+        start = time.time()
+        pos = (y * self.width + x) * self.bpp
+        self.data[pos : pos + self.bpp] = bytearray(pixel)
+        stats.add("write", start)
+    
+    def get_pixel_rgn(self, x, y, width, height, dirty=True, shadow=False):
+        return PixelRgn(self, x, y, width, height, dirty, shadow)
+    
+    def get_tile(self, shadow, row, col):
+        return Tile(self, shadow, row, col)
+    
+    def flush(self):
+        stats.count("flush")
+    
+    def merge_shadow(self, undo=False):
+        start = time.time()
+        if(self.shadow is not None):
+            # Like in GIMP, the shadow tiles are blended according to the selection mask.
+            selection = self._selection()
+            if(selection is None):
+                self.data[:] = self.shadow
+            else:
+                ox, oy = self.offsets
+                for y in range(self.height):
+                    for x in range(self.width):
+                        sx, sy = x + ox, y + oy
+                        m = selection.data[sy * selection.width + sx] if 0 <= sx < selection.width and 0 <= sy < selection.height else 0
+                        pos = (y * self.width + x) * self.bpp
+                        for k in range(pos, pos + self.bpp):
+                            self.data[k] = (self.shadow[k] * m + self.data[k] * (255 - m) + 127) // 255
+            self.shadow = None
+        stats.add("flush", start)
+    
+    def update(self, x, y, width, height):
+        stats.count("update")
+    
+    def copy(self, alpha=False):
+        other = Layer(self.image, self.name + " copy", self.width, self.height, self.type, self.opacity, self.mode)
+        other.data[:] = self.data
+        other.offsets = self.offsets
+        return other
+
+class GroupLayer(object):
+    ''' Stand-in of gimp.GroupLayer (a layer without pixels which contains other layers). '''
+    def __init__(self, img, name="Layer group"):
+        self.image = img
+        self.name = name
+        self.parent = None
+        self.layers = []
+
+def _container(layer):
+    ''' Returns the list of layers which contains a layer (the layers of his group, or the
+    layers of his image).
+    '''
+    return layer.image.layers if layer.parent is None else layer.parent.layers
+
+class Channel(Layer):
+    ''' Stand-in of gimp.Channel (a drawable with one byte per pixel). '''
+    def __init__(self, img, name, width, height, opacity=100, color=(0, 0, 0)):
+        Layer.__init__(self, img, name, width, height, GRAY_IMAGE, opacity)
+        self.color = color
+
+def _check_not_indexed(name, drawable):
+    ''' Raises the error of the procedures which do not accept indexed drawables. '''
+    if(drawable.is_indexed):
+        raise RuntimeError("Procedure '" + name + "' has been called with an indexed drawable")
+
+def _convert(layer, type, function):
+    ''' Changes the type of a layer, converting each pixel with a function. '''
+    bpp = _BPP[type]
+    data = bytearray(layer.width * layer.height * bpp)
+    for i in range(layer.width * layer.height):
+        data[i * bpp : (i + 1) * bpp] = function(layer.data[i * layer.bpp : (i + 1) * layer.bpp])
+    layer.type, layer.bpp, layer.data, layer.shadow = type, bpp, data, None
+    layer.has_alpha = type in (RGBA_IMAGE, GRAYA_IMAGE, INDEXEDA_IMAGE)
+    layer.is_rgb = type in (RGB_IMAGE, RGBA_IMAGE)
+    layer.is_gray = type in (GRAY_IMAGE, GRAYA_IMAGE)
+    layer.is_indexed = type in (INDEXED_IMAGE, INDEXEDA_IMAGE)
+
+def _mask_intersect(drawable):
+    ''' Implementation of gimp_drawable_mask_intersect. '''
+    selection = drawable._selection()
+    if(selection is None):
+        return (True, 0, 0, drawable.width, drawable.height)
+    ox, oy = drawable.offsets
+    xs = []
+    ys = []
+    for y in range(max(0, oy), min(oy + drawable.height, selection.height)):
+        row = selection.data[y * selection.width + max(0, ox) : y * selection.width + min(ox + drawable.width, selection.width)]
+        if(any(row)):
+            ys.append(y)
+            values = [i for i in range(len(row)) if row[i]]
+            xs.extend([values[0] + max(0, ox), values[-1] + max(0, ox)])
+    if(not ys):
+        return (False, 0, 0, 0, 0)
+    return (True, min(xs) - ox, ys[0] - oy, max(xs) - min(xs) + 1, ys[-1] - ys[0] + 1)
+
+class PixelRgn(object):
+    ''' Stand-in of gimp.PixelRgn, which supports the same indexing than the real one:
+    rgn[x,y] for a pixel and rgn[x1:x2, y1:y2] for a rectangle (in row-major order).
+    '''
+    def __init__(self, drawable, x, y, width, height, dirty, shadow):
+        self.drawable = drawable
+        self.x = x
+        self.y = y
+        self.w = width
+        self.h = height
+        self.dirty = dirty
+        self.shadow = shadow
+        self.bpp = drawable.bpp
+    
+    def _bounds(self, key):
+        kx, ky = key
+        if(isinstance(kx, slice)):
+            x1 = self.x if kx.start is None else kx.start
+            x2 = self.x + self.w if kx.stop is None else kx.stop
+        else:
+            x1, x2 = kx, kx + 1
+        if(isinstance(ky, slice)):
+            y1 = self.y if ky.start is None else ky.start
+            y2 = self.y + self.h if ky.stop is None else ky.stop
+        else:
+            y1, y2 = ky, ky + 1
+        return x1, y1, x2, y2
+    
+    def __getitem__(self, key):
+        start = time.time()
+        x1, y1, x2, y2 = self._bounds(key)
+        buf = self.drawable._buffer(self.shadow)
+        stride = self.drawable.width * self.bpp
+        if(x1 == 0 and x2 == self.drawable.width):
+            data = bytes(buf[y1 * stride : y2 * stride])
+        else:
+            data = b"".join([bytes(buf[y * stride + x1 * self.bpp : y * stride + x2 * self.bpp]) for y in range(y1, y2)])
+        stats.add("read", start)
+        return data
+    
+    def __setitem__(self, key, data):
+        start = time.time()
+        x1, y1, x2, y2 = self._bounds(key)
+        if(len(data) != (x2 - x1) * (y2 - y1) * self.bpp):
+            raise TypeError("the data has an invalid size")
+        buf = self.drawable._buffer(self.shadow)
+        stride = self.drawable.width * self.bpp
+        rowSize = (x2 - x1) * self.bpp
+        if(x1 == 0 and x2 == self.drawable.width):
+            buf[y1 * stride : y2 * stride] = data
+        else:
+            for y in range(y1, y2):
+                offset = (y - y1) * rowSize
+                buf[y * stride + x1 * self.bpp : y * stride + x2 * self.bpp] = data[offset : offset + rowSize]
+        stats.add("write", start)
+
+class Tile(object):
+    ''' Stand-in of gimp.Tile. The pixels are accessed with tile[x,y], where (x,y) are 
+    relative to the origin of the tile.
+    '''
+    def __init__(self, drawable, shadow, row, col):
+        self.drawable = drawable
+        self.shadow = shadow
+        self.bpp = drawable.bpp
+        self.x = col * TILE_WIDTH
+        self.y = row * TILE_HEIGHT
+        if(self.x >= drawable.width or self.y >= drawable.height):
+            raise IndexError("the tile is out of the drawable")
+        self.ewidth = min(TILE_WIDTH, drawable.width - self.x)
+        self.eheight = min(TILE_HEIGHT, drawable.height - self.y)
+        self.dirty = False
+    
+    def _pos(self, key):
+        x, y = key
+        return ((self.y + y) * self.drawable.width + self.x + x) * self.bpp
+    
+    def __getitem__(self, key):
+        start = time.time()
+        pos = self._pos(key)
+        pixel = bytes(self.drawable._buffer(self.shadow)[pos : pos + self.bpp])
+        stats.add("read", start)
+        return pixel
+    
+    def __setitem__(self, key, pixel):
+        start = time.time()
+        pos = self._pos(key)
+        self.drawable._buffer(self.shadow)[pos : pos + self.bpp] = pixel
+        self.dirty = True
+        stats.add("write", start)
+    
+    def flush(self):
+        stats.count("flush")
+
+class _Pdb(object):
+    ''' Stand-in of the procedural database. Only the procedures used by the samples are
+    implemented, the others raise an AttributeError.
+    '''
+    def gimp_image_undo_group_start(self, img):
+        stats.count("gimp_image_undo_group_start")
+    
+    def gimp_image_undo_group_end(self, img):
+        stats.count("gimp_image_undo_group_end")
+    
+    def gimp_image_insert_layer(self, image, layer, parent, position):
+        layer.image = image
+        layer.parent = parent
+        container = _container(layer)
+        if(position < 0):
+            position = len(container)
+        container.insert(position, layer)
+    
+    def gimp_image_get_item_position(self, image, item):
+        return _container(item).index(item)
+    
+    def gimp_item_get_parent(self, item):
+        return item.parent
+    
+    def gimp_progress_end(self):
+        pass
+    
+    def gimp_drawable_mask_intersect(self, drawable):
+        return _mask_intersect(drawable)
+    
+    def gimp_drawable_mask_bounds(self, drawable):
+        nonEmpty, x, y, width, height = _mask_intersect(drawable)
+        return (drawable._selection() is not None, x, y, x + width, y + height)
+    
+    def gimp_selection_is_empty(self, image):
+        return not any(image.selection.data)
+    
+    def gimp_drawable_fill(self, drawable, fill_type):
+        value = 255 if fill_type == WHITE_FILL else 0
+        drawable.data[:] = bytearray([value]) * len(drawable.data)
+    
+    def gimp_edit_clear(self, drawable):
+        start = time.time()
+        drawable.data[:] = bytearray(len(drawable.data))
+        stats.add("setup", start)
+    
+    def gimp_invert(self, drawable):
+        # Like in GIMP, the indexed drawables can not be inverted.
+        _check_not_indexed("gimp-invert", drawable)
+        
+        # The alpha channel is not inverted.
+        data = drawable.data
+        colors = drawable.bpp - 1 if drawable.has_alpha else drawable.bpp
+        for c in range(colors):
+            data[c::drawable.bpp] = bytearray(255 - v for v in data[c::drawable.bpp])
+    
+    def gimp_layer_new_from_drawable(self, drawable, image):
+        layer = Layer(image, drawable.name, drawable.width, drawable.height, drawable.type, drawable.opacity, drawable.mode)
+        layer.data[:] = drawable.data
+        return layer
+    
+    def gimp_edit_copy(self, drawable):
+        self.clipboard = drawable
+        return True
+    
+    def gimp_edit_paste(self, drawable, paste_into):
+        # The clipboard is pasted directly in the drawable, at his top left corner.
+        source = self.clipboard
+        width = min(source.width, drawable.width)
+        height = min(source.height, drawable.height)
+        data = source.get_pixel_rgn(0, 0, width, height, False, False)[0:width, 0:height]
+        if(source.bpp == drawable.bpp):
+            drawable.get_pixel_rgn(0, 0, width, height, True, False)[0:width, 0:height] = data
+        return drawable
+    
+    def plug_in_cartoon(self, image, drawable, maskRadius, blackPct):
+        _check_not_indexed("plug-in-cartoon", drawable)
+        drawable.data[:] = bytearray(v // 2 for v in drawable.data)
+    
+    def gimp_image_scale(self, image, width, height):
+        # The layers are scaled with the nearest neighbour.
+        for layer in image.layers:
+            data = bytearray(width * height * layer.bpp)
+            for y in range(height):
+                row = (y * layer.height // height) * layer.width
+                for x in range(width):
+                    src = (row + x * layer.width // width) * layer.bpp
+                    dst = (y * width + x) * layer.bpp
+                    data[dst : dst + layer.bpp] = layer.data[src : src + layer.bpp]
+            layer.width, layer.height, layer.data, layer.shadow = width, height, data, None
+        image.width, image.height = width, height
+        image.selection = Channel(image, "Selection", width, height)
+        stats.count("gimp_image_scale")
+    
+    def gimp_image_base_type(self, image):
+        return image.base_type
+    
+    def gimp_image_convert_rgb(self, image):
+        # The color map is a gray ramp, so each index is converted to a gray pixel.
+        for layer in image.layers:
+            if(layer.is_indexed):
+                _convert(layer, RGBA_IMAGE if layer.has_alpha else RGB_IMAGE, lambda pixel: pixel[0:1] * 3 + pixel[1:])
+        image.base_type = RGB
+        stats.count("gimp_image_convert_rgb")
+    
+    def gimp_image_convert_indexed(self, image, dither_type, palette_type, num_cols, alpha_dither, remove_unused, palette):
+        # The index of each pixel is his first channel (see gimp_image_convert_rgb).
+        for layer in image.layers:
+            if(not layer.is_indexed):
+                colors = layer.bpp - 1 if layer.has_alpha else layer.bpp
+                _convert(layer, INDEXEDA_IMAGE if layer.has_alpha else INDEXED_IMAGE, lambda pixel: pixel[0:1] + pixel[colors:])
+        image.base_type = INDEXED
+        stats.count("gimp_image_convert_indexed")
+    
+    def gimp_image_duplicate(self, image):
+        copy = Image(image.width, image.height, image.base_type)
+        for layer in image.layers:
+            copy.add_layer(self.gimp_layer_new_from_drawable(layer, copy))
+        copy.filename = image.filename
+        gimp.images.append(copy)
+        return copy
+    
+    def gimp_image_delete(self, image):
+        stats.count("gimp_image_delete")
+        if(image in gimp.images):
+            gimp.images.remove(image)
+    
+    def gimp_file_load(self, filename, raw_filename):
+        return load_file(filename)
+    
+    def gimp_file_save(self, image, drawable, filename, raw_filename):
+        save_file(image, drawable, filename)
+    
+    def __getattr__(self, name):
+        # The file procedures (file_png_load, file_jpeg_save, ...) use the format of save_file().
+        match = re.match(r"file_\w+_(load|save)$", name)
+        if(match is None):
+            raise AttributeError(name)
+        def procedure(*args):
+            stats.count(name)
+            if(match.group(1) == "load"):
+                return load_file(args[0])
+            save_file(args[0], args[1], args[2])
+        return procedure
+    
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+pdb = _Pdb()
+
+class _Gimp(object):
+    ''' Stand-in of the 'gimp' module. '''
+    Image = Image
+    Layer = Layer
+    GroupLayer = GroupLayer
+    PixelRgn = PixelRgn
+    Tile = Tile
+    pdb = pdb
+    
+    def __init__(self):
+        self.images = []
+    
+    def tile_width(self):
+        return TILE_WIDTH
+    
+    def tile_height(self):
+        return TILE_HEIGHT
+    
+    def image_list(self):
+        return list(self.images)
+    
+    def message(self, text):
+        stats.messages.append(text)
+    
+    def progress_init(self, text=""):
+        stats.progress = []
+    
+    def progress_update(self, value):
+        stats.progress.append(value)
+
+gimp = _Gimp()
+
+def register(proc_name, blurb, help, author, copyright, date, label, imagetypes, params, results, function, **kwargs):
+    ''' Stores the function of the plug-in in the 'procedures' dictionary. '''
+    procedures[proc_name] = function
+
+def main():
+    pass
+
+def new_image(width, height, type=RGB_IMAGE, seed=1):
+    ''' Creates an image with one layer filled with a deterministic pattern.
+    
+    Parameters:
+    width : int The width of the image.
+    height : int The height of the image.
+    type : int The type of the image (RGB_IMAGE, RGBA_IMAGE, ...).
+    seed : int The seed used for generating the pattern.
+    '''
+    import random
+    img = Image(width, height, _BASE_TYPE[type])
+    layer = Layer(img, "Background", width, height, type)
+    
+    # Repeat a random block, whose size is not a multiple of the pixel size nor of the width.
+    rnd = random.Random(seed)
+    block = bytearray(rnd.randint(0, 255) for i in range(4099))
+    size = len(layer.data)
+    layer.data[:] = (block * (size // len(block) + 1))[:size]
+    
+    img.add_layer(layer, 0)
+    gimp.images.append(img)
+    return img
+
+# Signature of the files written by save_file().
+FILE_MAGIC = b"FAKEGIMP"
+
+def save_file(image, drawable, filename):
+    ''' Saves the pixels of a drawable in a file, with a header and without compression. '''
+    with open(filename, "wb") as output:
+        output.write(FILE_MAGIC + ("%d %d %d\n" % (drawable.width, drawable.height, drawable.type)).encode("ascii"))
+        output.write(bytes(drawable.data))
+
+def load_file(filename):
+    ''' Opens a file written by save_file(). Other files are opened as a 32x32 image
+    filled with a pattern which depends on the contents of the file.
+    '''
+    with open(filename, "rb") as source:
+        content = source.read()
+    if(content.startswith(FILE_MAGIC)):
+        end = content.index(b"\n")
+        width, height, type = [int(v) for v in content[len(FILE_MAGIC) : end].split()]
+        img = Image(width, height, _BASE_TYPE[type])
+        layer = Layer(img, "Background", width, height, type)
+        layer.data[:] = content[end + 1 :]
+        img.add_layer(layer, 0)
+        gimp.images.append(img)
+    else:
+        img = new_image(32, 32, RGB_IMAGE, zlib.crc32(content))
+    img.filename = filename
+    return img
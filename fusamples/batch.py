@@ -0,0 +1,561 @@
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2013, Jose F. Maldonado
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+#
+#    - Redistributions of source code must retain the above copyright notice, this 
+#    list of conditions and the following disclaimer.
+#    - Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation and/or 
+#    other materials provided with the distribution.
+#    - Neither the name of the author nor the names of its contributors may be used 
+#    to endorse or promote products derived from this software without specific prior 
+#    written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+# SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+# DAMAGE.
+#
+# -------------------------------------------------------------------------------------
+#
+# Engine for processing the images of a folder.
+#
+# A batch is defined by a list of stages (for example 'decode', 'filter' and 'encode'),
+# which are executed in order over each file by a bounded pool of worker threads. The
+# folder is streamed (the list of files is never materialised), and the number of
+# images that are open at the same time is limited by the number of workers and by a
+# memory budget.
+#
+# The procedural database of GIMP can only execute one call at a time from a plug-in,
+# so the stages that call it (decode, filter and encode) are marked as exclusive and
+# are serialised with a lock: within one plug-in the images are processed one after
+# the other. What overlaps with them is the work that does not need GIMP: the non 
+# exclusive stages (like the checks of the manifest), walking the folder and, if it is
+# enabled, reading ahead the next input files. The throughput scales with several GIMP
+# processes (see 'fusamples/runner.py' and 'fusamples/daemon.py'), not with workers.
+
+import errno
+import fnmatch
+import hashlib
+import os
+import threading
+import time
+
+from fusamples.instrument import count, error, span
+
+try:
+    scandir = os.scandir
+except AttributeError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+# Size of the blocks used for reading ahead the input files.
+READ_AHEAD_BLOCK = 1024 * 1024
+
+# Error numbers of the I/O errors which can disappear when the operation is repeated 
+# (for example, in network file systems).
+TRANSIENT_ERRNOS = set([getattr(errno, name) for name in ("EAGAIN", "EBUSY", "EINTR", "EIO", "ETIMEDOUT", "ESTALE", "ENETDOWN", "ENETRESET", "ECONNRESET") if hasattr(errno, name)])
+
+class BatchItem(object):
+    ''' A file processed by a batch. The stages can store the image being processed in 
+    the 'image' attribute.
+    '''
+    def __init__(self, name, inputPath, outputPath, size):
+        self.name = name
+        self.inputPath = inputPath
+        self.outputPath = outputPath
+        self.size = size
+        self.image = None
+        self.retries = 0
+
+def parse_patterns(text):
+    ''' Parses a list of glob patterns separated by commas (like "*.png, *.jpg"). '''
+    return [pattern.strip() for pattern in (text or "").split(",") if pattern.strip()]
+
+def parse_shard(text):
+    ''' Parses a shard specification (like "2/8", the second of eight shards).
+    
+    Returns:
+    tuple The number of the shard (from 1 to N) and the number of shards, or None if the text is empty.
+    '''
+    if(not text or not text.strip()):
+        return None
+    try:
+        index, count = [int(part) for part in text.split("/")]
+    except ValueError:
+        raise ValueError("invalid shard '" + text + "' (the format is k/N)")
+    if(count < 1 or index < 1 or index > count):
+        raise ValueError("invalid shard '" + text + "' (k must be between 1 and N)")
+    return (index, count)
+
+def in_shard(relativePath, shard):
+    ''' Indicates if a file belongs to a shard. The shard of a file depends only on the 
+    hash of his relative path, so several machines can split a folder without coordination.
+    '''
+    if(shard is None):
+        return True
+    # The names returned by os.listdir in Python 2 are already bytes (in the encoding of 
+    # the file system), so only the unicode names are encoded.
+    if(not isinstance(relativePath, bytes)):
+        relativePath = relativePath.encode("utf-8")
+    digest = hashlib.md5(relativePath).hexdigest()
+    return int(digest[:8], 16) % shard[1] == shard[0] - 1
+
+def _matches(relativePath, patterns):
+    name = relativePath.rsplit("/", 1)[-1]
+    for pattern in patterns:
+        if(fnmatch.fnmatch(relativePath, pattern) or fnmatch.fnmatch(name, pattern)):
+            return True
+    return False
+
+def _entries(folder):
+    ''' Generates the name, path and kind (True for folders) of the entries of a folder. '''
+    if(scandir is not None):
+        for entry in scandir(folder):
+            yield entry.name, entry.path, entry.is_dir()
+    else:
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            yield name, path, os.path.isdir(path)
+
+def scan_folder(inputFolder, outputFolder, recursive=False, include=None, exclude=None, shard=None):
+    ''' Generates a BatchItem for each file of a folder, without building the list of files.
+    In recursive mode the tree of folders is mirrored in the output folder.
+    
+    Parameters:
+    inputFolder : string The folder to scan.
+    outputFolder : string The folder in which the results are saved.
+    recursive : bool Indicates if the subfolders must be scanned.
+    include : list The glob patterns of the files to process (None or empty for all the files). The patterns are matched against the name and the relative path (with '/' as separator) of each file.
+    exclude : list The glob patterns of the files and folders to ignore.
+    shard : tuple The shard to process (as returned by parse_shard), or None for all the files.
+    '''
+    include = include or []
+    exclude = exclude or []
+    outputReal = os.path.realpath(outputFolder)
+    
+    # Walk the folders with a stack, so the files are generated while the tree is walked.
+    pending = [("", inputFolder)]
+    while(pending):
+        prefix, folder = pending.pop()
+        for name, path, isFolder in _entries(folder):
+            relativePath = prefix + name
+            if(exclude and _matches(relativePath, exclude)):
+                continue
+            if(isFolder):
+                # The output folder is not scanned (it can be inside of the input folder).
+                if(recursive and os.path.realpath(path) != outputReal):
+                    pending.append((relativePath + "/", path))
+                continue
+            if(not os.path.isfile(path) or (include and not _matches(relativePath, include)) or not in_shard(relativePath, shard)):
+                continue
+            outputPath = os.path.join(outputFolder, *relativePath.split("/"))
+            yield BatchItem(relativePath, path, outputPath, os.path.getsize(path))
+
+def make_output_folder(item):
+    ''' Creates the folder of the output file of an item (if it does not exist). '''
+    folder = os.path.dirname(item.outputPath)
+    if(folder and not os.path.isdir(folder)):
+        try:
+            os.makedirs(folder)
+        except OSError:
+            # The folder can be created at the same time by another worker.
+            if(not os.path.isdir(folder)):
+                raise
+
+def image_bytes(image):
+    ''' Estimates the memory used by the pixels of an image. '''
+    return sum([layer.width * layer.height * layer.bpp for layer in image.layers])
+
+class Stage(object):
+    ''' A step of a batch. The function receives a BatchItem, and can return False for
+    skipping the rest of the stages (for example, when the file is not an image).
+    '''
+    def __init__(self, name, function, exclusive=True):
+        ''' Creates the stage.
+        
+        Parameters:
+        name : string The name of the stage.
+        function : function The function to execute for each file.
+        exclusive : bool Indicates if the function calls the procedural database of GIMP.
+        '''
+        self.name = name
+        self.function = function
+        self.exclusive = exclusive
+
+class BatchStats(object):
+    ''' Counters of a batch. '''
+    def __init__(self, stageNames):
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.retries = 0
+        self.bytesIn = 0
+        self.bytesOut = 0
+        self.seconds = 0.0
+        self.stageSeconds = dict([(name, 0.0) for name in stageNames])
+    
+    def files_per_second(self):
+        return self.processed / self.seconds if self.seconds > 0 else 0.0
+    
+    def megabytes_per_second(self):
+        return self.bytesIn / 1e6 / self.seconds if self.seconds > 0 else 0.0
+    
+    def as_dict(self):
+        return {
+            "processed": self.processed,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "retries": self.retries,
+            "bytes_in": self.bytesIn,
+            "bytes_out": self.bytesOut,
+            "seconds": self.seconds,
+            "files_per_second": self.files_per_second(),
+            "mb_per_second": self.megabytes_per_second(),
+            "stage_seconds": dict(self.stageSeconds),
+        }
+    
+    def summary(self):
+        ''' Returns a line of text describing the results of the batch. '''
+        return "%d files processed (%d skipped, %d failed) in %.1f s: %.2f files/s, %.2f MB/s" % (
+            self.processed, self.skipped, self.failed, self.seconds, self.files_per_second(), self.megabytes_per_second())
+
+class RetryPolicy(object):
+    ''' Policy for repeating the stages which fail with transient I/O errors. '''
+    def __init__(self, attempts=3, delay=0.1, backoff=2.0, maxDelay=5.0):
+        ''' Creates the policy.
+        
+        Parameters:
+        attempts : int The maximum number of times that a stage is executed.
+        delay : float The seconds to wait before the first retry.
+        backoff : float The factor by which the delay is multiplied after each retry.
+        maxDelay : float The maximum seconds to wait before a retry.
+        '''
+        self.attempts = max(1, attempts)
+        self.delay = delay
+        self.backoff = backoff
+        self.maxDelay = maxDelay
+    
+    def is_transient(self, err):
+        ''' Indicates if an error can disappear when the operation is repeated. '''
+        return isinstance(err, EnvironmentError) and getattr(err, "errno", None) in TRANSIENT_ERRNOS
+    
+    def wait_time(self, attempt):
+        ''' Returns the seconds to wait after the given attempt (1 for the first one). '''
+        return min(self.maxDelay, self.delay * self.backoff ** (attempt - 1))
+
+class _MemoryBudget(object):
+    ''' Limits the memory used by the open images. '''
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.condition = threading.Condition()
+    
+    def wait(self):
+        ''' Waits until there is free memory (the limit is ignored when no image is open). '''
+        with self.condition:
+            while(self.limit > 0 and self.used > 0 and self.used >= self.limit):
+                self.condition.wait()
+    
+    def add(self, size):
+        with self.condition:
+            self.used += size
+    
+    def release(self, size):
+        with self.condition:
+            self.used -= size
+            self.condition.notify_all()
+
+class BatchPipeline(object):
+    ''' Executes a list of stages over a stream of files. '''
+    def __init__(self, stages, workers=2, memoryBudget=0, close=None, onError=None, readAhead=False, retry=None):
+        ''' Creates the pipeline.
+        
+        Parameters:
+        stages : list The stages (Stage objects) to execute for each file.
+        workers : int The maximum number of files being processed at the same time.
+        memoryBudget : int The maximum number of bytes used by the open images (0 for no limit).
+        close : function A function that receives a BatchItem and closes his image (for example, with gimp_image_delete).
+        onError : function A function that receives the BatchItem, the name of the stage and the exception of each failure.
+        readAhead : bool Indicates if the input files must be read before decoding them, outside of the lock (it only pays off when the files are not in the cache of the operating system, see 'benchmarks/bench_batch.py').
+        retry : RetryPolicy The policy for repeating the stages which fail with transient errors (None for not repeating them).
+        '''
+        self.stages = stages
+        self.workers = max(1, workers)
+        self.budget = _MemoryBudget(memoryBudget)
+        self.close = close
+        self.onError = onError
+        self.readAhead = readAhead
+        self.retry = retry
+        self.pdbLock = threading.Lock()
+    
+    def run(self, items):
+        ''' Processes the files, and returns a BatchStats object.
+        
+        Parameters:
+        items : iterable The BatchItem objects to process (for example, the generator returned by scan_folder).
+        '''
+        stats = BatchStats([stage.name for stage in self.stages])
+        iterator = iter(items)
+        iteratorLock = threading.Lock()
+        errors = []
+        start = time.time()
+        
+        def worker():
+            try:
+                while(True):
+                    with iteratorLock:
+                        try:
+                            item = next(iterator)
+                        except StopIteration:
+                            return
+                    self._process(item, stats)
+            except Exception as err:
+                errors.append(err)
+        
+        if(self.workers == 1):
+            worker()
+        else:
+            threads = [threading.Thread(target=worker) for i in range(self.workers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        
+        stats.seconds = time.time() - start
+        count("files_processed", stats.processed)
+        count("files_skipped", stats.skipped)
+        count("files_failed", stats.failed)
+        count("retries", stats.retries)
+        if(errors):
+            raise errors[0]
+        return stats
+    
+    def _call(self, stage, item):
+        ''' Executes a stage, holding the lock if it is exclusive. '''
+        if(stage.exclusive):
+            with self.pdbLock:
+                with span(stage.name):
+                    return stage.function(item)
+        with span(stage.name):
+            return stage.function(item)
+    
+    def _call_with_retry(self, stage, item, stats):
+        ''' Executes a stage, repeating it (after a growing delay) while it fails with 
+        transient errors.
+        '''
+        attempt = 1
+        while(True):
+            try:
+                return self._call(stage, item)
+            except Exception as err:
+                if(self.retry is None or attempt >= self.retry.attempts or not self.retry.is_transient(err)):
+                    raise
+                time.sleep(self.retry.wait_time(attempt))
+                attempt += 1
+                item.retries += 1
+                with stats.lock:
+                    stats.retries += 1
+    
+    def _process(self, item, stats):
+        ''' Executes the stages over a file. '''
+        if(self.readAhead):
+            self._read_ahead(item)
+        
+        self.budget.wait()
+        reserved = 0
+        stage = None
+        try:
+            for stage in self.stages:
+                start = time.time()
+                result = self._call_with_retry(stage, item, stats)
+                with stats.lock:
+                    stats.stageSeconds[stage.name] += time.time() - start
+                
+                # Account the memory of the image once it has been opened.
+                if(item.image is not None and reserved == 0):
+                    reserved = image_bytes(item.image)
+                    self.budget.add(reserved)
+                
+                if(result is False):
+                    with stats.lock:
+                        stats.skipped += 1
+                    return
+            
+            outputSize = os.path.getsize(item.outputPath) if os.path.isfile(item.outputPath) else 0
+            with stats.lock:
+                stats.processed += 1
+                stats.bytesIn += item.size
+                stats.bytesOut += outputSize
+        except Exception as err:
+            with stats.lock:
+                stats.failed += 1
+            error(err)
+            if(self.onError is not None):
+                self.onError(item, stage.name if stage is not None else None, err)
+        finally:
+            if(item.image is not None and self.close is not None):
+                try:
+                    with self.pdbLock:
+                        self.close(item)
+                except Exception as err:
+                    if(self.onError is not None):
+                        self.onError(item, "close", err)
+            item.image = None
+            self.budget.release(reserved)
+    
+    def _read_ahead(self, item):
+        ''' Reads a file, so it is in the cache of the operating system when it is decoded. '''
+        try:
+            with open(item.inputPath, "rb") as source:
+                while(source.read(READ_AHEAD_BLOCK)):
+                    pass
+        except (IOError, OSError):
+            pass
+
+def decode_item(item, cache=None):
+    ''' Opens a file if it is an image of a known format (the format is identified by 
+    his extension or, if the extension is unknown, by his first bytes).
+    
+    Parameters:
+    item : BatchItem The file to open.
+    cache : PixelCache The cache of decoded pixels, or None for always decoding the file.
+    '''
+    from gimpfu import INDEXED, pdb
+    from fusamples import formats
+    item.format = formats.resolve(item.inputPath, True)
+    if(item.format is None or not item.format.can_load() or not item.format.can_save()):
+        return False
+    if(cache is None):
+        item.image = item.format.load(item.inputPath)
+    else:
+        item.image = cache.load(item.format, item.inputPath, getattr(item, "hash", None))
+    
+    # Verify if the image has layers.
+    if(len(item.image.layers) == 0):
+        return False
+    
+    # Convert the indexed images (like the GIF files) to RGB, since most filters do not 
+    # accept indexed drawables (the formats which need it convert them back when saving).
+    if(item.image.base_type == INDEXED):
+        pdb.gimp_image_convert_rgb(item.image)
+    return True
+
+def hash_item(item):
+    ''' Calculates the hash of the contents of a file, if the manifest has not done it. 
+    It is a non exclusive stage, so the pixel cache does not read the whole file while
+    the lock of GIMP is held.
+    '''
+    from fusamples.manifest import file_hash
+    if(getattr(item, "hash", None) is None):
+        item.hash = file_hash(item.inputPath)
+
+def encode_item(item):
+    ''' Saves the image of a file in the same format than the original file. '''
+    make_output_folder(item)
+    item.format.save(item.image, item.image.layers[0], item.outputPath)
+
+def close_item(item):
+    ''' Closes the image of a file. '''
+    from gimpfu import pdb
+    pdb.gimp_image_delete(item.image)
+
+def run_batch(inputFolder, outputFolder, filterFunction, params, workers=2, memoryBudget=1024, incremental=False, pruneOutputs=False, recursive=False, include="", exclude="", shard="", maxSize=0, cacheFolder="", cacheSize=0, encode=encode_item, readAhead=False):
+    ''' Processes the images of a folder with the stages of the batch plug-ins (decode, 
+    scale, filter and encode), and displays the throughput and a summary of the errors. 
+    The parameters are the ones of the plug-ins, so each plug-in only has to provide his
+    filter.
+    
+    Parameters:
+    inputFolder : string The folder of the images.
+    outputFolder : string The folder in which save the results.
+    filterFunction : function The function which receives a BatchItem and modifies his image (None for no filter).
+    params : dict The name and the parameters of the filter, which are saved in the manifest (so the files are processed again when they change).
+    workers : int The maximum number of images being processed at the same time.
+    memoryBudget : int The maximum memory (in MB) used by the open images.
+    incremental : bool Indicates if the files that have not changed since the previous batch must be skipped.
+    pruneOutputs : bool Indicates if the outputs of the files that no longer exist must be removed (only in incremental mode).
+    recursive : bool Indicates if the subfolders must be processed (the tree of folders is mirrored in the output folder).
+    include : string The glob patterns of the files to process, separated by commas (empty for all the files).
+    exclude : string The glob patterns of the files and folders to ignore, separated by commas.
+    shard : string The part of the files to process, as "k/N", or empty for all the files.
+    maxSize : int The maximum width and height of the images, which are scaled down right after being opened (0 for keeping their size).
+    cacheFolder : string The folder in which the decoded pixels of the images are cached (empty for no cache).
+    cacheSize : int The maximum size (in MB) of the cache of decoded pixels.
+    encode : function The function which receives a BatchItem and saves his image (by default, in the format of the input file).
+    readAhead : bool Indicates if the input files must be read before decoding them (see BatchPipeline).
+    '''
+    # These modules import this one, so they are imported when a batch is executed.
+    from gimpfu import gimp
+    from fusamples.cache import PixelCache
+    from fusamples.manifest import Manifest
+    from fusamples.report import ErrorCollector
+    from fusamples.resize import scale_to_fit
+    
+    # Open the images from the cache of decoded pixels, if there is one.
+    cache = None
+    if(cacheFolder):
+        cache = PixelCache(cacheFolder, int(cacheSize) * 1024 * 1024)
+    
+    # Open the images, scale them, filter them and save them.
+    stages = [Stage("decode", lambda item: decode_item(item, cache))]
+    if(cache is not None):
+        stages.insert(0, Stage("hash", hash_item, False))
+    
+    # Scale down the images before filtering them, so the filter only processes the 
+    # pixels which are saved.
+    if(maxSize > 0):
+        def scale(item):
+            scale_to_fit(item.image, int(maxSize))
+        stages.append(Stage("scale", scale))
+    if(filterFunction is not None):
+        stages.append(Stage("filter", filterFunction))
+    stages.append(Stage("encode", encode))
+    
+    # In incremental mode, skip the files that have not changed since the previous batch.
+    shard = parse_shard(shard)
+    manifest = None
+    if(incremental):
+        manifestParams = dict(params)
+        manifestParams["maxSize"] = int(maxSize)
+        manifest = Manifest(outputFolder, manifestParams, shard)
+        stages = [Stage("check", manifest.check, False)] + stages + [Stage("record", manifest.record, False)]
+    
+    # Collect the errors in a report (instead of displaying them), skip the files which 
+    # have failed in previous batches, and repeat the stages which fail with transient
+    # I/O errors.
+    errors = ErrorCollector(outputFolder, 2, shard)
+    stages = errors.stages(stages)
+    
+    pipeline = BatchPipeline(stages, int(workers), int(memoryBudget) * 1024 * 1024, close_item, errors.add, readAhead, RetryPolicy())
+    try:
+        items = scan_folder(inputFolder, outputFolder, recursive, parse_patterns(include), parse_patterns(exclude), shard)
+        stats = pipeline.run(items)
+        if(manifest is not None and pruneOutputs):
+            manifest.prune()
+    finally:
+        if(manifest is not None):
+            manifest.save()
+        reportPaths = errors.save()
+    
+    # Display the throughput, and a summary of the errors.
+    summary = stats.summary()
+    if(cache is not None):
+        summary += " (" + cache.summary() + ")"
+    gimp.message(summary)
+    if(errors.failures()):
+        gimp.message("Unexpected error: " + errors.summary() + " (see '" + reportPaths[0] + "')")
+    return stats
@@ -0,0 +1,299 @@
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2013, Jose F. Maldonado
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+#
+#    - Redistributions of source code must retain the above copyright notice, this 
+#    list of conditions and the following disclaimer.
+#    - Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation and/or 
+#    other materials provided with the distribution.
+#    - Neither the name of the author nor the names of its contributors may be used 
+#    to endorse or promote products derived from this software without specific prior 
+#    written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+# SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+# DAMAGE.
+#
+# -------------------------------------------------------------------------------------
+#
+# Cache of the decoded pixels of the images, for the batches which open the same files
+# many times (for example, with different parameters of a filter).
+#
+# The pixels of each file are saved without compression, after a header with his width,
+# height, bytes per pixel and type, in a file named by the hash of the contents of the
+# source file. When the same contents are opened again, the cache file is mapped in 
+# memory and copied into the pixel region of a new layer, band by band, so the image is
+# not decoded. The cache is limited in size, and the least recently used files are 
+# removed when the limit is exceeded.
+#
+# The cache can be shared by several workers (threads or processes): the files are 
+# written with a temporal name and renamed when they are complete, so a file is never
+# read while it is being written, and a file removed while it is mapped stays valid 
+# until it is unmapped. The eviction is serialised between processes with a lock file
+# (in the systems which support fcntl), and the files removed by another process while
+# the cache is being evicted are ignored.
+#
+# Usage:
+# >>> from fusamples import formats
+# >>> from fusamples.cache import PixelCache
+# >>> cache = PixelCache("/tmp/pixels", 512 * 1024 * 1024)
+# >>> image = cache.load(formats.resolve("/tmp/image.png"), "/tmp/image.png")
+
+import errno
+import mmap
+import os
+import struct
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from fusamples.instrument import count, span
+from fusamples.manifest import file_hash, replace_file, temp_path
+
+# Header of the cache files (signature, width, height, bytes per pixel and layer type).
+HEADER = struct.Struct("<8sIIII")
+SIGNATURE = b"FUPIXEL1"
+
+# Extension of the cache files.
+EXTENSION = ".pixels"
+
+# Name of the file locked while the cache is being evicted.
+LOCK_NAME = ".evict.lock"
+
+class PixelCache(object):
+    ''' Cache of the decoded pixels of the images, saved in a folder. '''
+    def __init__(self, folder, maxBytes):
+        ''' Creates a cache (the folder is created if it does not exist).
+        
+        Parameters:
+        folder : string The folder in which the pixels are saved.
+        maxBytes : int The maximum size of the cache, in bytes.
+        '''
+        self.folder = folder
+        self.maxBytes = maxBytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if(not os.path.isdir(folder)):
+            try:
+                os.makedirs(folder)
+            except OSError:
+                # The folder can be created at the same time by another worker.
+                if(not os.path.isdir(folder)):
+                    raise
+    
+    def path(self, digest):
+        ''' Returns the path of the cache file of some contents. '''
+        return os.path.join(self.folder, digest + EXTENSION)
+    
+    def load(self, fileFormat, path, digest=None):
+        ''' Opens an image, from the cache if his contents have been opened before, or 
+        with the loader of his format otherwise (and then his pixels are cached).
+        
+        Parameters:
+        fileFormat : FileFormat The format of the file.
+        path : string The path of the file.
+        digest : string The hash of the contents of the file, if it is already known.
+        
+        Returns:
+        image The image of the file.
+        '''
+        if(digest is None):
+            digest = file_hash(path)
+        image = self._read(self.path(digest), path)
+        with self.lock:
+            if(image is None):
+                self.misses += 1
+            else:
+                self.hits += 1
+        if(image is not None):
+            count("cache_hits")
+            return image
+        count("cache_misses")
+        
+        image = fileFormat.load(path)
+        if(cacheable(image)):
+            self._write(self.path(digest), image.layers[0])
+            self.evict()
+        return image
+    
+    def _read(self, cachePath, path):
+        ''' Creates an image with the pixels of a cache file, or returns None if the file
+        does not exist or is damaged.
+        '''
+        from gimpfu import gimp, NORMAL_MODE
+        try:
+            source = open(cachePath, "rb")
+        except IOError:
+            return None
+        with span("cache_read"):
+            try:
+                header = source.read(HEADER.size)
+                if(len(header) != HEADER.size):
+                    return self._discard(cachePath)
+                signature, width, height, bpp, layerType = HEADER.unpack(header)
+                rowSize = width * bpp
+                if(signature != SIGNATURE or os.fstat(source.fileno()).st_size != HEADER.size + rowSize * height):
+                    return self._discard(cachePath)
+                
+                # Mark the file as recently used.
+                try:
+                    os.utime(cachePath, None)
+                except OSError:
+                    pass
+                
+                # Copy the pixels into a new layer, in bands of the height of the tiles.
+                pixels = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    image = gimp.Image(width, height, _base_type(layerType))
+                    layer = gimp.Layer(image, "Background", width, height, layerType, 100, NORMAL_MODE)
+                    image.add_layer(layer, 0)
+                    rgn = layer.get_pixel_rgn(0, 0, width, height, True, False)
+                    band = gimp.tile_height()
+                    for y in range(0, height, band):
+                        y2 = min(y + band, height)
+                        start = HEADER.size + y * rowSize
+                        rgn[0:width, y:y2] = pixels[start : start + (y2 - y) * rowSize]
+                    layer.flush()
+                    image.filename = path
+                finally:
+                    pixels.close()
+            finally:
+                source.close()
+        return image
+    
+    def _write(self, cachePath, layer):
+        ''' Saves the pixels of a layer in a cache file. '''
+        from gimpfu import gimp
+        temp = temp_path(cachePath)
+        with span("cache_write"):
+            try:
+                rgn = layer.get_pixel_rgn(0, 0, layer.width, layer.height, False, False)
+                band = gimp.tile_height()
+                with open(temp, "wb") as output:
+                    output.write(HEADER.pack(SIGNATURE, layer.width, layer.height, layer.bpp, layer.type))
+                    for y in range(0, layer.height, band):
+                        output.write(rgn[0:layer.width, y:min(y + band, layer.height)])
+                replace_file(temp, cachePath)
+            except (IOError, OSError):
+                # The cache is an optimization, so a file that can not be written (for 
+                # example, because the disk is full) is not an error.
+                _remove(temp)
+    
+    def _discard(self, cachePath):
+        _remove(cachePath)
+        return None
+    
+    def size(self):
+        ''' Returns the size of the cache, in bytes. '''
+        return sum([size for mtime, size, path in self._entries()])
+    
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.folder):
+            if(name.endswith(EXTENSION)):
+                path = os.path.join(self.folder, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+    
+    def evict(self):
+        ''' Removes the least recently used files, until the size of the cache is below
+        his limit.
+        
+        Returns:
+        int The number of removed files.
+        '''
+        with self.lock:
+            lockFile = self._lock()
+            if(lockFile is False):
+                # Another process is evicting the cache.
+                return 0
+            try:
+                entries = sorted(self._entries())
+                total = sum([size for mtime, size, path in entries])
+                removed = 0
+                for mtime, size, path in entries:
+                    if(total <= self.maxBytes):
+                        break
+                    if(_remove(path)):
+                        removed += 1
+                    total -= size
+                self.evictions += removed
+            finally:
+                if(lockFile is not None):
+                    lockFile.close()
+        if(removed):
+            count("cache_evictions", removed)
+        return removed
+    
+    def _lock(self):
+        ''' Locks the lock file of the cache, without waiting.
+        
+        Returns:
+        file The open lock file (it is unlocked when it is closed), None if the system
+        does not support fcntl, or False if the file is locked by another process.
+        '''
+        if(fcntl is None):
+            return None
+        try:
+            lockFile = open(os.path.join(self.folder, LOCK_NAME), "a")
+        except (IOError, OSError):
+            return None
+        try:
+            fcntl.flock(lockFile.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError) as err:
+            lockFile.close()
+            if(err.errno in (errno.EAGAIN, errno.EACCES, errno.EWOULDBLOCK)):
+                return False
+            return None
+        return lockFile
+    
+    def summary(self):
+        ''' Returns a text with the hits and misses of the cache. '''
+        return "%d cache hits, %d misses, %d evictions" % (self.hits, self.misses, self.evictions)
+
+def cacheable(image):
+    ''' Indicates if the pixels of an image can be cached (only the images with a single 
+    layer, which covers the image and is not indexed, since the header does not store 
+    the offsets of the layers nor the color maps).
+    '''
+    if(len(image.layers) != 1):
+        return False
+    layer = image.layers[0]
+    return not layer.is_indexed and layer.offsets == (0, 0) and (layer.width, layer.height) == (image.width, image.height)
+
+def _base_type(layerType):
+    ''' Returns the base type (RGB or GRAY) of the images with a layer type. '''
+    from gimpfu import RGB, GRAY, RGB_IMAGE, RGBA_IMAGE
+    return RGB if layerType in (RGB_IMAGE, RGBA_IMAGE) else GRAY
+
+def _remove(path):
+    ''' Removes a file, if it exists (it can be removed at the same time by another 
+    worker), and returns True if it has been removed.
+    '''
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        # The file has been removed by another worker or (in Windows) it is mapped.
+        return False
@@ -0,0 +1,382 @@
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2013, Jose F. Maldonado
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+#
+#    - Redistributions of source code must retain the above copyright notice, this 
+#    list of conditions and the following disclaimer.
+#    - Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation and/or 
+#    other materials provided with the distribution.
+#    - Neither the name of the author nor the names of its contributors may be used 
+#    to endorse or promote products derived from this software without specific prior 
+#    written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+# SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+# DAMAGE.
+#
+# -------------------------------------------------------------------------------------
+#
+# Daemon which executes the jobs of the plug-ins in a pool of GIMP processes.
+#
+# Starting GIMP (even in batch mode) costs several seconds, so the daemon keeps a pool of
+# GIMP processes running, and receives the jobs through a Unix domain socket. Each line
+# sent to the socket is a JSON request, and the daemon answers each request with a JSON
+# line, in the same order:
+#
+#   {"procedure": "batch_invert", "args": {...}, "timeout": 60}   executes a job (see runner.py)
+#   {"type": "health"}                                            state of the workers
+#   {"type": "metrics"}                                           counters of the daemon
+#   {"type": "shutdown"}                                          stops the daemon
+#
+# The jobs are queued until a worker is free. If a job exceeds its timeout, the worker
+# is killed and restarted, and the job fails. For example:
+#
+#   python -m fusamples.daemon serve --workers 4 --gimp gimp-2.8 &
+#   python -m fusamples.daemon submit jobs.jsonl
+#   python -m fusamples.daemon metrics
+#
+# With the option '--stand-in' the workers use the stand-in of 'gimpfu' of the benchmarks
+# folder instead of GIMP.
+
+import json
+import optparse
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    from queue import Queue, Full
+except ImportError:
+    from Queue import Queue, Full
+
+from fusamples import runner
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), "fusamples.sock")
+
+# Maximum seconds that a worker can take to start.
+START_TIMEOUT = 120
+
+class _Request(object):
+    ''' A request received by the daemon, and his response. '''
+    def __init__(self, job=None, timeout=0):
+        self.job = job
+        self.timeout = timeout
+        self.response = None
+        self.done = threading.Event()
+    
+    def finish(self, response):
+        self.response = response
+        self.done.set()
+
+class Worker(object):
+    ''' A process (GIMP in batch mode) which executes jobs. '''
+    def __init__(self, index, command, workDir):
+        ''' Creates the worker (the process is not started).
+        
+        Parameters:
+        index : int The number of the worker.
+        command : function A function which receives the path of a socket, and returns the command of the process.
+        workDir : string The folder in which the socket is created.
+        '''
+        self.socketPath = os.path.join(workDir, "worker-%d.sock" % index)
+        self.command = command
+        self.process = None
+        self.conn = None
+        self.reader = None
+    
+    def alive(self):
+        return self.process is not None and self.process.poll() is None and self.conn is not None
+    
+    def start(self):
+        ''' Starts the process and waits until it connects. '''
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            if(os.path.exists(self.socketPath)):
+                os.remove(self.socketPath)
+            listener.bind(self.socketPath)
+            listener.listen(1)
+            listener.settimeout(START_TIMEOUT)
+            # The connections of the clients must not be inherited by the process.
+            self.process = subprocess.Popen(self.command(self.socketPath), close_fds=True)
+            self.conn = listener.accept()[0]
+            self.reader = self.conn.makefile("r")
+        finally:
+            listener.close()
+            if(os.path.exists(self.socketPath)):
+                os.remove(self.socketPath)
+    
+    def stop(self):
+        ''' Closes the connection and kills the process (if it is still running). '''
+        if(self.conn is not None):
+            self.reader.close()
+            self.conn.close()
+            self.conn = None
+        if(self.process is not None):
+            if(self.process.poll() is None):
+                self.process.kill()
+            self.process.wait()
+            self.process = None
+    
+    def execute(self, job, timeout):
+        ''' Executes a job (a socket.timeout is raised if the job exceeds the timeout). '''
+        if(not self.alive()):
+            self.stop()
+            self.start()
+        self.conn.settimeout(timeout or None)
+        self.conn.sendall((json.dumps(job) + "\n").encode("utf-8"))
+        line = self.reader.readline()
+        if(not line):
+            raise EOFError("the worker has exited")
+        return json.loads(line)
+
+class Daemon(object):
+    ''' Server which receives requests through a Unix domain socket, and executes the jobs
+    in a pool of workers.
+    '''
+    def __init__(self, socketPath, command, workers=2, timeout=600, maxQueue=1000):
+        ''' Creates the daemon.
+        
+        Parameters:
+        socketPath : string The path of the socket of the daemon.
+        command : function A function which receives the path of a socket, and returns the command of a worker process.
+        workers : int The number of worker processes.
+        timeout : float The default maximum seconds of a job (0 for no limit).
+        maxQueue : int The maximum number of queued jobs (0 for no limit).
+        '''
+        self.socketPath = socketPath
+        self.command = command
+        self.workers = []
+        self.size = max(1, workers)
+        self.timeout = timeout
+        self.queue = Queue(maxQueue)
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = dict.fromkeys(["submitted", "completed", "failed", "timeouts", "rejected", "restarts", "busy"], 0)
+        self.seconds = 0.0
+    
+    def _count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+    
+    def health(self):
+        ''' Returns the state of the daemon. '''
+        alive = len([worker for worker in self.workers if worker.alive()])
+        return { "status": "ok" if alive > 0 else "degraded", "workers": self.size, "alive": alive, "queued": self.queue.qsize(), "uptime": round(time.time() - self.started, 1) }
+    
+    def metrics(self):
+        ''' Returns the counters of the daemon. '''
+        with self.lock:
+            metrics = dict(self.counters)
+            metrics["seconds"] = round(self.seconds, 3)
+        finished = metrics["completed"] + metrics["failed"]
+        metrics["average_seconds"] = round(metrics["seconds"] / finished, 3) if finished else 0.0
+        metrics["queued"] = self.queue.qsize()
+        metrics["uptime"] = round(time.time() - self.started, 1)
+        return metrics
+    
+    def shutdown(self):
+        ''' Stops the daemon (the queued jobs are executed first). '''
+        self.stopped.set()
+    
+    def _work(self, worker):
+        ''' Executes the queued jobs in a worker, restarting it when it fails. '''
+        try:
+            worker.start()
+        except Exception:
+            # The worker will be started again with the first job.
+            worker.stop()
+        
+        while(True):
+            request = self.queue.get()
+            if(request is None):
+                break
+            self._count("busy")
+            start = time.time()
+            try:
+                result = worker.execute(request.job, request.timeout)
+            except socket.timeout:
+                worker.stop()
+                self._count("timeouts")
+                self._count("restarts")
+                result = runner.failed_result(request.job, "the job exceeded the timeout of %s seconds" % request.timeout)
+            except Exception as err:
+                worker.stop()
+                self._count("restarts")
+                result = runner.failed_result(request.job, "the worker failed: " + str(err))
+            with self.lock:
+                self.counters["busy"] -= 1
+                self.counters["completed" if result["status"] == "ok" else "failed"] += 1
+                self.seconds += time.time() - start
+            request.finish(result)
+        worker.stop()
+    
+    def _respond(self, conn, pending):
+        ''' Sends the responses of a connection, in the order of the requests. '''
+        while(True):
+            request = pending.get()
+            if(request is None):
+                break
+            request.done.wait()
+            try:
+                conn.sendall((json.dumps(request.response, sort_keys=True) + "\n").encode("utf-8"))
+            except socket.error:
+                pass
+    
+    def _handle(self, conn):
+        ''' Reads the requests of a connection. '''
+        pending = Queue()
+        writer = threading.Thread(target=self._respond, args=(conn, pending))
+        writer.start()
+        try:
+            for line in conn.makefile("r"):
+                if(not line.strip()):
+                    continue
+                request = _Request()
+                try:
+                    message = json.loads(line)
+                    kind = message.get("type", "job")
+                    if(kind == "health"):
+                        request.finish(self.health())
+                    elif(kind == "metrics"):
+                        request.finish(self.metrics())
+                    elif(kind == "shutdown"):
+                        request.finish({ "status": "ok" })
+                        self.shutdown()
+                    elif(kind == "job"):
+                        request.job = message.get("job", message)
+                        request.timeout = message.get("timeout", self.timeout)
+                        try:
+                            self.queue.put_nowait(request)
+                            self._count("submitted")
+                        except Full:
+                            self._count("rejected")
+                            request.finish(runner.failed_result(request.job, "the queue is full"))
+                    else:
+                        raise ValueError("unknown request '" + str(kind) + "'")
+                except Exception as err:
+                    request.finish({ "status": "failed", "errors": [str(err)] })
+                pending.put(request)
+        finally:
+            pending.put(None)
+            writer.join()
+            conn.close()
+    
+    def serve_forever(self):
+        ''' Starts the workers and serves the requests until the daemon is stopped. '''
+        workDir = tempfile.mkdtemp(prefix="fusamples-")
+        self.workers = [Worker(i, self.command, workDir) for i in range(self.size)]
+        threads = [threading.Thread(target=self._work, args=(worker,)) for worker in self.workers]
+        for thread in threads:
+            thread.start()
+        
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            if(os.path.exists(self.socketPath)):
+                os.remove(self.socketPath)
+            listener.bind(self.socketPath)
+            listener.listen(16)
+            listener.settimeout(0.5)
+            while(not self.stopped.is_set()):
+                try:
+                    conn = listener.accept()[0]
+                except socket.timeout:
+                    continue
+                conn.settimeout(None)
+                handler = threading.Thread(target=self._handle, args=(conn,))
+                handler.daemon = True
+                handler.start()
+        finally:
+            listener.close()
+            if(os.path.exists(self.socketPath)):
+                os.remove(self.socketPath)
+            for thread in threads:
+                self.queue.put(None)
+            for thread in threads:
+                thread.join()
+            shutil.rmtree(workDir, True)
+
+def request(socketPath, messages):
+    ''' Sends requests to the daemon and returns his responses.
+    
+    Parameters:
+    socketPath : string The path of the socket of the daemon.
+    messages : list The requests (dictionaries).
+    
+    Returns:
+    list The responses (dictionaries), in the order of the requests.
+    '''
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.connect(socketPath)
+    try:
+        for message in messages:
+            conn.sendall((json.dumps(message) + "\n").encode("utf-8"))
+        conn.shutdown(socket.SHUT_WR)
+        return [json.loads(line) for line in conn.makefile("r") if line.strip()]
+    finally:
+        conn.close()
+
+def main():
+    parser = optparse.OptionParser(usage="%prog serve|submit|health|metrics|shutdown [options] [job file]")
+    parser.add_option("--socket", default=DEFAULT_SOCKET, help="path of the socket of the daemon [default: %default]")
+    parser.add_option("--workers", type="int", default=2, help="number of GIMP processes [default: %default]")
+    parser.add_option("--timeout", type="float", default=600, help="default maximum seconds of a job, 0 for no limit [default: %default]")
+    parser.add_option("--queue", type="int", default=1000, help="maximum number of queued jobs, 0 for no limit [default: %default]")
+    parser.add_option("--gimp", default="gimp", help="GIMP executable [default: %default]")
+    parser.add_option("--plugins", default=runner.ROOT_DIR, help="folder of the plug-in scripts [default: %default]")
+    parser.add_option("--stand-in", dest="standIn", action="store_true", default=False, help="use the stand-in of gimpfu instead of GIMP")
+    options, args = parser.parse_args()
+    if(not args or args[0] not in ("serve", "submit", "health", "metrics", "shutdown")):
+        parser.error("a command is required (serve, submit, health, metrics or shutdown)")
+    if(not hasattr(socket, "AF_UNIX")):
+        parser.error("Unix domain sockets are not supported in this platform")
+    
+    if(args[0] == "serve"):
+        if(options.standIn):
+            command = lambda path: runner.stand_in_command(options.plugins, "runner.work(%r, %r)" % (path, options.plugins))
+        else:
+            command = lambda path: runner.gimp_command(options.gimp, options.plugins, "runner.work(%r, %r)" % (path, options.plugins))
+        Daemon(options.socket, command, options.workers, options.timeout, options.queue).serve_forever()
+        return 0
+    
+    try:
+        if(args[0] == "submit"):
+            # Read the jobs from the file or from the standard input.
+            if(len(args) > 1 and args[1] != "-"):
+                with open(args[1]) as source:
+                    jobs = runner.parse_jobs(source)
+            else:
+                jobs = runner.parse_jobs(sys.stdin)
+            valid = [job for job in jobs if isinstance(job, dict)]
+            executed = request(options.socket, valid)
+            executed.reverse()
+            responses = [executed.pop() if isinstance(job, dict) else runner.failed_result(None, str(job)) for job in jobs]
+        else:
+            responses = request(options.socket, [{ "type": args[0] }])
+    except socket.error as err:
+        sys.stderr.write("Could not connect to the daemon: " + str(err) + "\n")
+        return 2
+    
+    for response in responses:
+        sys.stdout.write(json.dumps(response, sort_keys=True) + "\n")
+    return 1 if [response for response in responses if response.get("status") not in ("ok", "degraded")] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2013, Jose F. Maldonado
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+#
+#    - Redistributions of source code must retain the above copyright notice, this 
+#    list of conditions and the following disclaimer.
+#    - Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation and/or 
+#    other materials provided with the distribution.
+#    - Neither the name of the author nor the names of its contributors may be used 
+#    to endorse or promote products derived from this software without specific prior 
+#    written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+# SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+# DAMAGE.
+#
+# -------------------------------------------------------------------------------------
+#
+# Export of a layer to several files, using named encoder profiles.
+#
+# Each profile defines a file format of the registry (see formats.py) and the parameters
+# of his saver, for example "fast-png" saves PNG files with compression level 1 while
+# "archive-png" uses level 9. The layer is copied once into a new image, and all the
+# files are saved from that copy.
+#
+# Note that a plug-in can only execute one call of the procedural database at a time,
+# so the files are encoded one after the other.
+
+import os
+import time
+
+from fusamples import formats
+
+class EncoderProfile(object):
+    ''' Named set of parameters for saving a file format. '''
+    def __init__(self, name, formatName, extension, saveArgs=None):
+        ''' Creates the profile.
+        
+        Parameters:
+        name : string The name of the profile.
+        formatName : string The name of the format in the registry.
+        extension : string The extension of the files (with the dot).
+        saveArgs : tuple The parameters of the saver (None for using the defaults of the format).
+        '''
+        self.name = name
+        self.formatName = formatName
+        self.extension = extension
+        self.saveArgs = saveArgs
+
+# The available profiles, indexed by name.
+PROFILES = {}
+
+def register_profile(profile):
+    ''' Adds (or replaces) a profile. '''
+    PROFILES[profile.name] = profile
+
+register_profile(EncoderProfile("png", "png", ".png"))
+register_profile(EncoderProfile("fast-png", "png", ".png", (0, 1, 0, 0, 0, 0, 0)))
+register_profile(EncoderProfile("archive-png", "png", ".png", (0, 9, 0, 0, 0, 0, 0)))
+register_profile(EncoderProfile("jpeg", "jpeg", ".jpg"))
+register_profile(EncoderProfile("progressive-jpeg", "jpeg", ".jpg", (0.9, 0, 1, 1, "Creating with GIMP", 0, 0, 0, 0)))
+register_profile(EncoderProfile("web-jpeg", "jpeg", ".jpg", (0.75, 0, 1, 1, "", 2, 0, 0, 0)))
+register_profile(EncoderProfile("bmp", "bmp", ".bmp"))
+register_profile(EncoderProfile("gif", "gif", ".gif"))
+register_profile(EncoderProfile("tiff", "tiff", ".tif"))
+register_profile(EncoderProfile("webp", "webp", ".webp"))
+
+def parse_profiles(names):
+    ''' Returns the profiles of a list of names separated by commas.
+    
+    Parameters:
+    names : string The names of the profiles, for example "fast-png,progressive-jpeg".
+    '''
+    profiles = []
+    for name in names.split(","):
+        name = name.strip()
+        if(name):
+            if(name not in PROFILES):
+                raise ValueError("unknown encoder profile '" + name + "'")
+            profiles.append(PROFILES[name])
+    return profiles
+
+class ExportResult(object):
+    ''' Results of the export of a file. '''
+    def __init__(self, profile, path, seconds, size):
+        self.profile = profile
+        self.path = path
+        self.seconds = seconds
+        self.size = size
+    
+    def __str__(self):
+        return "%s: %.2f s, %d KB" % (self.profile.name, self.seconds, self.size // 1024)
+
+def export_layer(image, layer, outputFolder, baseName, profiles):
+    ''' Saves a layer with several profiles.
+    
+    Parameters:
+    image : image The image of the layer.
+    layer : layer The layer to save.
+    outputFolder : string The folder in which to save the files.
+    baseName : string The name of the files (without extension).
+    profiles : list The profiles (EncoderProfile objects) to use.
+    
+    Returns:
+    list An ExportResult for each profile.
+    '''
+    from gimpfu import gimp, pdb
+    
+    # Copy the layer into a new image, from which all the files are saved.
+    copyImage = gimp.Image(layer.width, layer.height, image.base_type)
+    copyLayer = pdb.gimp_layer_new_from_drawable(layer, copyImage)
+    copyImage.add_layer(copyLayer, 0)
+    copyLayer.set_offsets(0, 0)
+    
+    # The formats which modify the image before saving it (like GIF) are saved at the end.
+    ordered = sorted(profiles, key=lambda profile: formats.get(profile.formatName).prepare is not None)
+    
+    # When several profiles use the same extension, the name of the profile is added to the file name.
+    extensions = [profile.extension for profile in profiles]
+    
+    results = []
+    try:
+        for profile in ordered:
+            name = baseName
+            if(extensions.count(profile.extension) > 1):
+                name += "-" + profile.name
+            path = os.path.join(outputFolder, name + profile.extension)
+            start = time.time()
+            formats.get(profile.formatName).save(copyImage, copyImage.layers[0], path, profile.saveArgs)
+            results.append(ExportResult(profile, path, time.time() - start, os.path.getsize(path)))
+    finally:
+        pdb.gimp_image_delete(copyImage)
+    
+    # Return the results in the order of the profiles.
+    results.sort(key=lambda result: profiles.index(result.profile))
+    return results
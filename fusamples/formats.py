@@ -0,0 +1,183 @@
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2013, Jose F. Maldonado
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+#
+#    - Redistributions of source code must retain the above copyright notice, this 
+#    list of conditions and the following disclaimer.
+#    - Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation and/or 
+#    other materials provided with the distribution.
+#    - Neither the name of the author nor the names of its contributors may be used 
+#    to endorse or promote products derived from this software without specific prior 
+#    written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+# SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+# DAMAGE.
+#
+# -------------------------------------------------------------------------------------
+#
+# Registry of the file formats supported by the plug-ins.
+#
+# Each format defines his extensions, the signatures (magic bytes) which identify his
+# files, and the procedures (with their default parameters) used for loading and saving
+# it. The format of a file is resolved with a dictionary lookup by extension, and the
+# files without a known extension can be identified by reading their first bytes.
+#
+# Usage:
+# >>> from fusamples import formats
+# >>> fileFormat = formats.resolve("/tmp/image.png")
+# >>> image = fileFormat.load("/tmp/image.png")
+# >>> fileFormat.save(image, image.layers[0], "/tmp/copy.png")
+
+import os
+
+from fusamples.instrument import count, enabled, span
+
+# Number of bytes read for identifying a file.
+SNIFF_SIZE = 16
+
+def _pdb():
+    ''' Returns the procedural database (imported here, so this module can be loaded 
+    before the stand-in of gimpfu is installed).
+    '''
+    from gimpfu import pdb
+    return pdb
+
+class FileFormat(object):
+    ''' A file format and the procedures used for loading and saving it. '''
+    def __init__(self, name, extensions, signatures, loader, saver, saveArgs=(), prepare=None):
+        ''' Creates the format.
+        
+        Parameters:
+        name : string The name of the format.
+        extensions : list The extensions of the format (with the dot and in lower case).
+        signatures : list Tuples (offset, bytes) with the magic bytes of the format.
+        loader : string The name of the procedure which loads the files, or None.
+        saver : string The name of the procedure which saves the files, or None.
+        saveArgs : tuple The parameters of the saver after the image, drawable and file names.
+        prepare : function A function which receives the image and drawable before saving them, and returns the drawable to save.
+        '''
+        self.name = name
+        self.extensions = extensions
+        self.signatures = signatures
+        self.loader = loader
+        self.saver = saver
+        self.saveArgs = tuple(saveArgs)
+        self.prepare = prepare
+    
+    def can_load(self):
+        return self.loader is not None
+    
+    def can_save(self):
+        return self.saver is not None
+    
+    def load(self, path):
+        ''' Opens a file, and returns his image. '''
+        with span(self.name + "_load"):
+            image = _pdb()[self.loader](path, path)
+        if(enabled()):
+            count("bytes_read", os.path.getsize(path))
+        return image
+    
+    def save(self, image, drawable, path, saveArgs=None):
+        ''' Saves a drawable in a file.
+        
+        Parameters:
+        image : image The image of the drawable.
+        drawable : drawable The drawable to save.
+        path : string The path of the file.
+        saveArgs : tuple The parameters of the saver, if the defaults must not be used.
+        '''
+        if(self.prepare is not None):
+            drawable = self.prepare(image, drawable)
+        args = self.saveArgs if saveArgs is None else tuple(saveArgs)
+        with span(self.name + "_save"):
+            _pdb()[self.saver](image, drawable, path, path, *args)
+        if(enabled()):
+            count("bytes_written", os.path.getsize(path))
+    
+    def matches(self, header):
+        ''' Indicates if the first bytes of a file contain a signature of the format. '''
+        for offset, magic in self.signatures:
+            if(header[offset : offset + len(magic)] == magic):
+                return True
+        return False
+
+class FormatRegistry(object):
+    ''' Set of file formats, indexed by name and by extension. '''
+    def __init__(self):
+        self.formats = {}
+        self._byExtension = {}
+    
+    def register(self, fileFormat):
+        ''' Adds a format (replacing the formats with the same name or extensions). '''
+        self.formats[fileFormat.name] = fileFormat
+        for extension in fileFormat.extensions:
+            self._byExtension[extension] = fileFormat
+    
+    def get(self, name):
+        ''' Returns the format with the given name. '''
+        return self.formats[name]
+    
+    def by_extension(self, path):
+        ''' Returns the format of a file according to his extension, or None. '''
+        return self._byExtension.get(os.path.splitext(path)[1].lower())
+    
+    def sniff(self, path):
+        ''' Returns the format of a file according to his first bytes, or None. '''
+        try:
+            with open(path, "rb") as source:
+                header = source.read(SNIFF_SIZE)
+        except (IOError, OSError):
+            return None
+        for fileFormat in self.formats.values():
+            if(fileFormat.matches(header)):
+                return fileFormat
+        return None
+    
+    def resolve(self, path, sniff=False):
+        ''' Returns the format of a file, or None if it is unknown.
+        
+        Parameters:
+        path : string The path of the file.
+        sniff : bool Indicates if the first bytes of the file must be read when his extension is unknown.
+        '''
+        fileFormat = self._byExtension.get(os.path.splitext(path)[1].lower())
+        if(fileFormat is None and sniff):
+            fileFormat = self.sniff(path)
+        return fileFormat
+
+def _prepare_gif(image, drawable):
+    ''' Converts an image to indexed mode, since GIF files can not store RGB images. '''
+    if(not drawable.is_indexed):
+        _pdb().gimp_image_convert_indexed(image, 0, 0, 255, False, False, "")
+    return image.active_layer
+
+# The registry used by the plug-ins, with the default formats.
+registry = FormatRegistry()
+registry.register(FileFormat("png", [".png"], [(0, b"\x89PNG\r\n\x1a\n")], "file_png_load", "file_png_save", (0, 9, 0, 0, 0, 0, 0)))
+registry.register(FileFormat("jpeg", [".jpg", ".jpeg", ".jpe"], [(0, b"\xff\xd8\xff")], "file_jpeg_load", "file_jpeg_save", (0.9, 0, 0, 0, "Creating with GIMP", 0, 0, 0, 0)))
+registry.register(FileFormat("bmp", [".bmp"], [(0, b"BM")], "file_bmp_load", "file_bmp_save"))
+registry.register(FileFormat("gif", [".gif"], [(0, b"GIF87a"), (0, b"GIF89a")], "file_gif_load", "file_gif_save", (0, 0, 0, 0), _prepare_gif))
+registry.register(FileFormat("tiff", [".tif", ".tiff"], [(0, b"II*\x00"), (0, b"MM\x00*")], "file_tiff_load", "file_tiff_save", (1,)))
+registry.register(FileFormat("webp", [".webp"], [(8, b"WEBP")], "file_webp_load", "file_webp_save", (0, 0, 90.0, 100.0, 0, 0, 0, 0, 0, 0, 0, 0, 0)))
+
+def resolve(path, sniff=False):
+    ''' Returns the format of a file using the default registry (see FormatRegistry.resolve). '''
+    return registry.resolve(path, sniff)
+
+def get(name):
+    ''' Returns a format of the default registry. '''
+    return registry.get(name)
@@ -0,0 +1,254 @@
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2013, Jose F. Maldonado
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+#
+#    - Redistributions of source code must retain the above copyright notice, this 
+#    list of conditions and the following disclaimer.
+#    - Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation and/or 
+#    other materials provided with the distribution.
+#    - Neither the name of the author nor the names of its contributors may be used 
+#    to endorse or promote products derived from this software without specific prior 
+#    written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+# SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+# DAMAGE.
+#
+# -------------------------------------------------------------------------------------
+#
+# Instrumentation of the plug-ins.
+#
+# The registered functions are decorated with instrumented(), which measures each call
+# (a root span). Inside a call, span() measures a part of the work (like the 'decode'
+# stage of a batch or the loading of a PNG file), and count() and error() add values to
+# the counters of the call (pixels processed, bytes read and written, errors...).
+#
+# The instrumentation is disabled by default, and then the functions return at once.
+# It is enabled by the environment variable FUSAMPLES_METRICS (or by configure()) with
+# the path of the output file:
+#
+#  - A file ending in '.prom' is written in the text format of Prometheus, with the 
+#    totals of all the calls (the file is rewritten after each call, holding a lock 
+#    file, so the processes of the runner and of the daemon do not lose counters).
+#  - Otherwise, a JSON line is appended to the file for each call.
+
+import functools
+import json
+import os
+import re
+import threading
+import time
+
+from fusamples.manifest import FileLock, replace_file, temp_path
+
+# Environment variable with the path of the output file.
+ENV_VARIABLE = "FUSAMPLES_METRICS"
+
+# Output of the measures (None when the instrumentation is disabled).
+_sink = None
+
+# Spans open in each thread, and the last root span (the parent of the spans opened by
+# threads without spans, like the workers of a batch).
+_local = threading.local()
+_active = None
+_lock = threading.Lock()
+
+class _NullSpan(object):
+    ''' Span which does nothing (used when the instrumentation is disabled). '''
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, type, value, traceback):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class Span(object):
+    ''' Measure of the time spent in a part of a call. The counters and the errors are
+    stored in the root span.
+    '''
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.parent = parent
+        self.root = parent.root if parent is not None else self
+        self.started = 0.0
+        self.seconds = 0.0
+        self.counters = {}
+        self.errors = 0
+        self.spans = {}
+    
+    def __enter__(self):
+        global _active
+        stack = getattr(_local, "stack", None)
+        if(stack is None):
+            stack = _local.stack = []
+        stack.append(self)
+        if(self.parent is None):
+            _active = self
+        self.started = time.time()
+        return self
+    
+    def __exit__(self, type, value, traceback):
+        global _active
+        self.seconds = time.time() - self.started
+        _local.stack.pop()
+        
+        # The errors are counted once (by the root span) if they are not handled.
+        if(value is not None and self.parent is None):
+            with _lock:
+                self.errors += 1
+        
+        if(self.parent is not None):
+            # Accumulate the time of the span (by name) in the root span.
+            with _lock:
+                total = self.root.spans.setdefault(self.name, [0.0, 0])
+                total[0] += self.seconds
+                total[1] += 1
+        else:
+            if(_active is self):
+                _active = None
+            sink = _sink
+            if(sink is not None):
+                sink.write(self)
+        return False
+
+class JsonLinesSink(object):
+    ''' Appends a JSON line to a file for each call. '''
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+    
+    def write(self, span):
+        record = {
+            "time": round(span.started, 3),
+            "pid": os.getpid(),
+            "function": span.name,
+            "seconds": round(span.seconds, 6),
+            "errors": span.errors,
+            "counters": span.counters,
+            "spans": dict([(name, { "seconds": round(total[0], 6), "calls": total[1] }) for name, total in span.spans.items()]),
+        }
+        with self.lock:
+            with open(self.path, "a") as output:
+                output.write(json.dumps(record, sort_keys=True) + "\n")
+
+class PrometheusSink(object):
+    ''' Writes the totals of all the calls in the text format of Prometheus. The totals of
+    the file are loaded before adding the values of each call, so they are kept between
+    executions of the plug-ins. The file is locked while it is updated, since it can be 
+    shared by several processes.
+    '''
+    LINE = re.compile(r'^(\w+)(\{.*\})? ([-+.\deE]+|NaN)$')
+    
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+    
+    def _load(self):
+        totals = {}
+        if(os.path.exists(self.path)):
+            with open(self.path) as source:
+                for line in source:
+                    match = self.LINE.match(line.strip())
+                    if(match):
+                        totals[(match.group(1), match.group(2) or "")] = float(match.group(3))
+        return totals
+    
+    def write(self, span):
+        function = '{function="%s"}' % span.name
+        values = [
+            ("fusamples_calls_total", function, 1),
+            ("fusamples_seconds_total", function, span.seconds),
+            ("fusamples_errors_total", function, span.errors),
+        ]
+        for name, value in span.counters.items():
+            values.append(("fusamples_" + re.sub(r"\W", "_", name) + "_total", function, value))
+        for name, total in span.spans.items():
+            labels = '{function="%s",span="%s"}' % (span.name, name)
+            values.append(("fusamples_span_seconds_total", labels, total[0]))
+            values.append(("fusamples_span_calls_total", labels, total[1]))
+        
+        with self.lock, FileLock(self.path):
+            totals = self._load()
+            for name, labels, value in values:
+                totals[(name, labels)] = totals.get((name, labels), 0) + value
+            
+            # Write the file atomically, so a collector never reads it half written.
+            lines = []
+            for name in sorted(set([key[0] for key in totals])):
+                lines.append("# TYPE " + name + " counter")
+                for key in sorted([key for key in totals if key[0] == name]):
+                    lines.append("%s%s %s" % (key[0], key[1], repr(float(totals[key]))))
+            temporary = temp_path(self.path)
+            with open(temporary, "w") as output:
+                output.write("\n".join(lines) + "\n")
+            replace_file(temporary, self.path)
+
+def configure(path=None):
+    ''' Enables the instrumentation, writing the measures in a file ('.prom' files are 
+    written in the Prometheus format, and the other ones as JSON lines), or disables it
+    if the path is None.
+    '''
+    global _sink
+    if(not path):
+        _sink = None
+    elif(path.endswith(".prom")):
+        _sink = PrometheusSink(path)
+    else:
+        _sink = JsonLinesSink(path)
+
+def enabled():
+    return _sink is not None
+
+def _current():
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else _active
+
+def span(name):
+    ''' Returns a context manager which measures a part of the current call. '''
+    if(_sink is None):
+        return _NULL_SPAN
+    return Span(name, _current())
+
+def count(name, value=1):
+    ''' Adds a value to a counter of the current call (like 'pixels' or 'bytes_read'). '''
+    if(_sink is None):
+        return
+    current = _current()
+    if(current is not None):
+        with _lock:
+            counters = current.root.counters
+            counters[name] = counters.get(name, 0) + value
+
+def error(err=None):
+    ''' Counts an error of the current call. '''
+    if(_sink is None):
+        return
+    current = _current()
+    if(current is not None):
+        with _lock:
+            current.root.errors += 1
+
+def instrumented(function):
+    ''' Decorator which measures each call of a function (the root span). '''
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if(_sink is None):
+            return function(*args, **kwargs)
+        with Span(function.__name__):
+            return function(*args, **kwargs)
+    return wrapper
+
+configure(os.environ.get(ENV_VARIABLE))
@@ -0,0 +1,321 @@
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2013, Jose F. Maldonado
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+#
+#    - Redistributions of source code must retain the above copyright notice, this 
+#    list of conditions and the following disclaimer.
+#    - Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation and/or 
+#    other materials provided with the distribution.
+#    - Neither the name of the author nor the names of its contributors may be used 
+#    to endorse or promote products derived from this software without specific prior 
+#    written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+# SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+# DAMAGE.
+#
+# -------------------------------------------------------------------------------------
+#
+# Engine of point operations based on lookup tables.
+#
+# A point operation (an operation in which each pixel only depends on the same pixel of
+# the source) is compiled into lookup tables: an optional mix of the RGB channels (for
+# example, a gray conversion) defined by a table of 256 values per channel, followed by
+# a table of 256 bytes for each channel. The tables are applied to whole buffers of
+# pixels with str.translate() (or NumPy, if it is installed), instead of calculating
+# each pixel with Python code.
+#
+# The operations are compiled by name and parameters, and cached:
+# >>> op = compile_op("invert")
+# >>> result = op.apply(srcRgn[0:w, 0:h], layer.bpp)
+# >>> op = compile_op("discolour").then(compile_op("invert"))
+# >>> op = compile_op("gray", luminance="rec709")
+
+from array import array
+
+from fusamples.pixels import to_string
+
+try:
+    from itertools import izip as zip
+except ImportError:
+    pass
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def make_table(function):
+    ''' Creates a table of 256 bytes from a function which maps a value (0 - 255) to a value. '''
+    return bytes(bytearray([min(255, max(0, int(function(v)))) for v in range(256)]))
+
+# Common tables.
+IDENTITY = make_table(lambda v: v)
+INVERT = make_table(lambda v: 255 - v)
+ZERO = make_table(lambda v: 0)
+
+def compose_tables(first, second):
+    ''' Returns the table which applies a table and then another (None means identity). '''
+    if(first is None):
+        return second
+    if(second is None):
+        return first
+    return first.translate(second)
+
+class MixLut(object):
+    ''' Mix of the RGB channels into a gray value, calculated as
+    final[(tables[0][r] + tables[1][g] + tables[2][b]) >> shift].
+    '''
+    def __init__(self, tables, shift=0, final=None):
+        ''' Creates the mix.
+        
+        Parameters:
+        tables : list Three lists of 256 integers (the contribution of each value of the R, G and B channels).
+        shift : int The number of bits to shift the sum (for fixed-point weights).
+        final : list A list which maps the shifted sum to the gray value, or None if the shifted sum is always between 0 and 255.
+        '''
+        self.tables = [list(table) for table in tables]
+        self.shift = shift
+        self.final = list(final) if final is not None else None
+        self.arrays = None
+    
+    def gray_of(self, r, g, b):
+        ''' Calculates the gray value of a pixel. '''
+        value = (self.tables[0][r] + self.tables[1][g] + self.tables[2][b]) >> self.shift
+        return self.final[value] if self.final is not None else value
+    
+    def before(self, tables):
+        ''' Returns the mix which first applies the given tables to the RGB channels. '''
+        mixed = []
+        for c in range(3):
+            pre = bytearray(tables[c] if tables[c] is not None else IDENTITY)
+            mixed.append([self.tables[c][pre[v]] for v in range(256)])
+        return MixLut(mixed, self.shift, self.final)
+    
+    def after(self, gray):
+        ''' Returns the mix which maps his gray values with a list of 256 values. '''
+        final = self.final if self.final is not None else list(range(256))
+        return MixLut(self.tables, self.shift, [gray[v] for v in final])
+    
+    def numpy_tables(self):
+        ''' Returns the tables and the final list as NumPy arrays (converted only once, 
+        the first time that the mix is applied with NumPy).
+        '''
+        if(self.arrays is None):
+            tables = [numpy.array(table, dtype=numpy.int64) for table in self.tables]
+            final = numpy.array(self.final, dtype=numpy.int64) if self.final is not None else None
+            self.arrays = (tables, final)
+        return self.arrays
+    
+    def apply(self, data, pixelSize, useNumpy=True):
+        ''' Replaces the RGB channels of a buffer with the gray values (both 
+        implementations use the same integer arithmetic, so they give the same results).
+        '''
+        if(useNumpy and numpy is not None):
+            tables, final = self.numpy_tables()
+            pixels = numpy.frombuffer(data, dtype=numpy.uint8).reshape(-1, pixelSize).copy()
+            total = numpy.zeros(len(pixels), dtype=numpy.int64)
+            for c in range(3):
+                total += tables[c].take(pixels[:, c])
+            total >>= self.shift
+            if(final is not None):
+                total = final.take(total)
+            pixels[:, 0:3] = total.astype(numpy.uint8)[:, numpy.newaxis]
+            return to_string(pixels)
+        
+        pixels = array("B", data)
+        tr, tg, tb = self.tables
+        shift = self.shift
+        if(self.final is not None):
+            final = self.final
+            gray = array("B", (final[(tr[r] + tg[g] + tb[b]) >> shift] for r, g, b in zip(pixels[0::pixelSize], pixels[1::pixelSize], pixels[2::pixelSize])))
+        else:
+            gray = array("B", ((tr[r] + tg[g] + tb[b]) >> shift for r, g, b in zip(pixels[0::pixelSize], pixels[1::pixelSize], pixels[2::pixelSize])))
+        pixels[0::pixelSize] = gray
+        pixels[1::pixelSize] = gray
+        pixels[2::pixelSize] = gray
+        return to_string(pixels)
+
+class PointOp(object):
+    ''' A point operation compiled into lookup tables: an optional mix of the RGB channels
+    followed by a table for each channel.
+    '''
+    def __init__(self, tables=None, mix=None):
+        ''' Creates the operation.
+        
+        Parameters:
+        tables : dict The table (a string of 256 bytes) of each channel index. The channels without table are not modified.
+        mix : MixLut The mix of the RGB channels, or None.
+        '''
+        self.tables = dict(tables or {})
+        self.mix = mix
+    
+    def table(self, channel):
+        return self.tables.get(channel)
+    
+    def then(self, other):
+        ''' Returns the operation which applies this operation and then another one. '''
+        channels = set(self.tables) | set(other.tables)
+        if(other.mix is None):
+            tables = dict([(c, compose_tables(self.table(c), other.table(c))) for c in channels])
+            return PointOp(tables, self.mix)
+        
+        # The channels which are not mixed (like alpha) are composed.
+        tables = dict([(c, compose_tables(self.table(c), other.table(c))) for c in channels if c >= 3])
+        for c in range(3):
+            if(other.table(c) is not None):
+                tables[c] = other.table(c)
+        
+        if(self.mix is None):
+            return PointOp(tables, other.mix.before([self.table(c) for c in range(3)]))
+        
+        # After the first mix the RGB channels have the same value, so the second mix is a
+        # function of that value.
+        own = [bytearray(self.table(c) or IDENTITY) for c in range(3)]
+        gray = [other.mix.gray_of(own[0][v], own[1][v], own[2][v]) for v in range(256)]
+        return PointOp(tables, self.mix.after(gray))
+    
+    def apply(self, data, pixelSize):
+        ''' Applies the operation to a buffer of pixels.
+        
+        Parameters:
+        data : string The pixels, as returned by a pixel region.
+        pixelSize : int The number of bytes of each pixel.
+        
+        Returns:
+        string The resulting pixels.
+        '''
+        if(self.mix is not None):
+            data = self.mix.apply(data, pixelSize)
+        
+        tables = [self.table(c) for c in range(pixelSize)]
+        if(not [table for table in tables if table is not None]):
+            return data
+        
+        # When all the channels use the same table, the whole buffer is translated at once.
+        if(tables.count(tables[0]) == pixelSize):
+            return data.translate(tables[0])
+        
+        result = bytearray(data)
+        for c, table in enumerate(tables):
+            if(table is not None):
+                result[c::pixelSize] = data[c::pixelSize].translate(table)
+        return bytes(result)
+
+# Weights of the RGB channels in the luminance of each standard.
+LUMA_WEIGHTS = {
+    "rec601": (0.299, 0.587, 0.114),
+    "rec709": (0.2126, 0.7152, 0.0722),
+}
+
+# Luminances supported by the gray operation ('linear' is the Rec.709 luminance of the
+# linear light values, encoded back with the sRGB curve).
+LUMINANCES = ["average", "rec601", "rec709", "linear"]
+
+# Number of bits of the fractional part of the fixed-point weights.
+FIXED_BITS = 16
+
+def fixed_weights(weights):
+    ''' Converts a list of weights which add up to 1 into fixed-point integers which add
+    up exactly to 1 << FIXED_BITS (so white is mapped to white).
+    '''
+    one = 1 << FIXED_BITS
+    fixed = [int(round(w * one)) for w in weights]
+    fixed[-1] = one - sum(fixed[:-1])
+    return fixed
+
+def srgb_to_linear(v):
+    ''' Decodes a sRGB value (0 - 255) into a linear light value (0.0 - 1.0). '''
+    c = v / 255.0
+    return c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4
+
+def linear_to_srgb(c):
+    ''' Encodes a linear light value (0.0 - 1.0) into a sRGB value (0 - 255). '''
+    c = c * 12.92 if c <= 0.0031308 else 1.055 * c ** (1 / 2.4) - 0.055
+    return int(round(min(1.0, max(0.0, c)) * 255))
+
+def luminance_mix(luminance):
+    ''' Returns the mix which calculates a luminance (one of LUMINANCES) with integer 
+    arithmetic: each channel value is mapped by a table to his fixed-point contribution,
+    and the sum is shifted, so the weighted luminances cost the same as the average and
+    their results do not depend on the platform.
+    '''
+    if(luminance == "average"):
+        return MixLut([range(256)] * 3, 0, [s // 3 for s in range(3 * 255 + 1)])
+    half = 1 << (FIXED_BITS - 1)
+    if(luminance in LUMA_WEIGHTS):
+        weights = fixed_weights(LUMA_WEIGHTS[luminance])
+        tables = [[w * v for v in range(256)] for w in weights]
+        tables[0] = [t + half for t in tables[0]]
+        return MixLut(tables, FIXED_BITS)
+    if(luminance == "linear"):
+        # The channels are decoded into 16 bits linear values, weighted, and the linear 
+        # luminance is encoded back with a table of 65536 values.
+        weights = fixed_weights(LUMA_WEIGHTS["rec709"])
+        linear = [int(round(srgb_to_linear(v) * 65535)) for v in range(256)]
+        tables = [[w * l for l in linear] for w in weights]
+        tables[0] = [t + half for t in tables[0]]
+        return MixLut(tables, FIXED_BITS, [linear_to_srgb(y / 65535.0) for y in range(65536)])
+    raise ValueError("unknown luminance '" + str(luminance) + "'")
+
+def _gray(luminance="rec601"):
+    ''' Gray as the luminance of the RGB channels (see LUMINANCES). '''
+    return PointOp(mix=luminance_mix(luminance))
+
+def _discolour():
+    ''' Gray as the average of the RGB channels (like the discolour plug-ins). '''
+    return PointOp(mix=luminance_mix("average"))
+
+def _invert():
+    ''' Inversion of the RGB channels (like gimp_invert). '''
+    return PointOp({ 0: INVERT, 1: INVERT, 2: INVERT })
+
+def _channel(channel=0):
+    ''' Extraction of an RGB channel (the other ones are set to zero, like in split channels). '''
+    return PointOp(dict([(c, ZERO) for c in range(3) if c != channel]))
+
+def _identity():
+    return PointOp()
+
+# Builders of the operations, indexed by name.
+OPERATIONS = {
+    "identity": _identity,
+    "discolour": _discolour,
+    "gray": _gray,
+    "invert": _invert,
+    "channel": _channel,
+}
+
+# Compiled operations, indexed by name and parameters.
+_cache = {}
+
+def register_op(name, builder):
+    ''' Adds an operation. The builder receives the parameters as keyword arguments, and
+    returns a PointOp object.
+    '''
+    OPERATIONS[name] = builder
+    for key in [key for key in _cache if key[0] == name]:
+        del _cache[key]
+
+def compile_op(name, **params):
+    ''' Returns the operation with the given name and parameters (compiled only once). '''
+    key = (name, tuple(sorted(params.items())))
+    op = _cache.get(key)
+    if(op is None):
+        if(name not in OPERATIONS):
+            raise ValueError("unknown point operation '" + name + "'")
+        op = OPERATIONS[name](**params)
+        _cache[key] = op
+    return op
@@ -0,0 +1,236 @@
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2013, Jose F. Maldonado
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+#
+#    - Redistributions of source code must retain the above copyright notice, this 
+#    list of conditions and the following disclaimer.
+#    - Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation and/or 
+#    other materials provided with the distribution.
+#    - Neither the name of the author nor the names of its contributors may be used 
+#    to endorse or promote products derived from this software without specific prior 
+#    written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+# SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+# DAMAGE.
+#
+# -------------------------------------------------------------------------------------
+#
+# Manifest of the files processed by a batch, which allows to skip the files that have
+# not changed since the previous execution.
+#
+# The manifest is saved as JSON in the output folder. Each entry is indexed by the path
+# of the input file, and stores his size, modification time and content hash, the
+# parameters of the filter and the path of the output file. The content hash is only
+# calculated when the size or the modification time have changed. The shards of a 
+# batch which save their results in the same folder keep separate manifests.
+
+import hashlib
+import json
+import os
+import sys
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Name of the manifest file.
+MANIFEST_NAME = ".batch-manifest.json"
+
+# Number of recorded files after which the manifest is saved.
+SAVE_INTERVAL = 100
+
+# Size of the blocks used for calculating the hashes.
+HASH_BLOCK = 1024 * 1024
+
+def file_hash(path):
+    ''' Calculates the MD5 hash of the contents of a file.
+    
+    Parameters:
+    path : string The path of the file.
+    '''
+    digest = hashlib.md5()
+    with open(path, "rb") as source:
+        block = source.read(HASH_BLOCK)
+        while(block):
+            digest.update(block)
+            block = source.read(HASH_BLOCK)
+    return digest.hexdigest()
+
+def shard_name(name, shard):
+    ''' Returns the name of a file of a batch for a shard (like '.batch-manifest-2-of-8.json'),
+    so the shards which save their results in the same folder do not overwrite the files
+    of the others.
+    
+    Parameters:
+    name : string The name of the file.
+    shard : tuple The shard (as returned by fusamples.batch.parse_shard), or None for all the files.
+    '''
+    if(shard is None):
+        return name
+    root, ext = os.path.splitext(name)
+    return "%s-%d-of-%d%s" % (root, shard[0], shard[1], ext)
+
+def temp_path(path):
+    ''' Returns the path of a temporal file for writing a file, which is different in each
+    process and thread (so they never write the same temporal file).
+    '''
+    return "%s.%d.%d.tmp" % (path, os.getpid(), threading.current_thread().ident)
+
+class FileLock(object):
+    ''' Lock of a file which is read and written by several processes, taken with fcntl 
+    on a hidden lock file next to it (in the systems without fcntl it does nothing).
+    
+    Usage:
+    >>> with FileLock(path):
+    >>>     ... read, modify and replace the file ...
+    '''
+    def __init__(self, path):
+        folder, name = os.path.split(path)
+        self.path = os.path.join(folder, "." + name.lstrip(".") + ".lock")
+        self.file = None
+    
+    def __enter__(self):
+        if(fcntl is not None):
+            try:
+                self.file = open(self.path, "a")
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+            except (IOError, OSError):
+                # The file can not be locked (for example, in some network file systems).
+                if(self.file is not None):
+                    self.file.close()
+                self.file = None
+        return self
+    
+    def __exit__(self, *args):
+        # Closing the file releases the lock.
+        if(self.file is not None):
+            self.file.close()
+            self.file = None
+        return False
+
+def replace_file(source, destination):
+    ''' Renames a file, replacing the destination atomically (if the system allows it). '''
+    if(hasattr(os, "replace")):
+        os.replace(source, destination)
+    else:
+        # Python 2 can not replace a file in Windows, so it must be removed first.
+        if(sys.platform == "win32" and os.path.exists(destination)):
+            os.remove(destination)
+        os.rename(source, destination)
+
+class Manifest(object):
+    ''' Manifest of the files processed in an output folder. '''
+    def __init__(self, outputFolder, params, shard=None):
+        ''' Loads the manifest of a folder (if it exists).
+        
+        Parameters:
+        outputFolder : string The folder in which the results are saved.
+        params : dict The filter and his parameters, a file is processed again when they change.
+        shard : tuple The shard processed by the batch, or None for all the files.
+        '''
+        self.path = os.path.join(outputFolder, shard_name(MANIFEST_NAME, shard))
+        self.params = params
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.pending = 0
+        if(os.path.isfile(self.path)):
+            try:
+                with open(self.path) as source:
+                    self.entries = json.load(source).get("entries", {})
+            except ValueError:
+                # A damaged manifest is discarded, so all the files are processed again.
+                self.entries = {}
+    
+    def _key(self, item):
+        return os.path.abspath(item.inputPath)
+    
+    def check(self, item):
+        ''' Returns False if a file has not changed since it was processed (so the batch 
+        skips it), or True otherwise. It can be used as a non exclusive stage.
+        
+        Parameters:
+        item : BatchItem The file to check.
+        '''
+        key = self._key(item)
+        stat = os.stat(item.inputPath)
+        item.mtime = stat.st_mtime
+        item.hash = None
+        with self.lock:
+            entry = self.entries.get(key)
+        if(entry is None or entry["params"] != self.params or entry["size"] != stat.st_size):
+            return True
+        if(not os.path.isfile(entry["output"])):
+            return True
+        if(entry["mtime"] == stat.st_mtime):
+            return False
+        
+        # The file was touched, so verify if his content has changed.
+        item.hash = file_hash(item.inputPath)
+        if(item.hash != entry["hash"]):
+            return True
+        with self.lock:
+            entry["mtime"] = stat.st_mtime
+            self.pending += 1
+        return False
+    
+    def record(self, item):
+        ''' Records that a file has been processed. It can be used as the last (non 
+        exclusive) stage of a batch.
+        
+        Parameters:
+        item : BatchItem The processed file.
+        '''
+        stat = os.stat(item.inputPath)
+        digest = getattr(item, "hash", None) or file_hash(item.inputPath)
+        entry = { "size": stat.st_size, "mtime": stat.st_mtime, "hash": digest, "params": self.params, "output": os.path.abspath(item.outputPath) }
+        with self.lock:
+            self.entries[self._key(item)] = entry
+            self.pending += 1
+            if(self.pending >= SAVE_INTERVAL):
+                self._save()
+    
+    def prune(self):
+        ''' Removes the output files (and the entries) of the input files that no longer exist.
+        
+        Returns:
+        int The number of removed entries.
+        '''
+        removed = 0
+        with self.lock:
+            for key in list(self.entries):
+                if(not os.path.exists(key)):
+                    output = self.entries.pop(key)["output"]
+                    if(os.path.isfile(output)):
+                        os.remove(output)
+                    removed += 1
+                    self.pending += 1
+        return removed
+    
+    def save(self):
+        ''' Saves the manifest, writing a temporal file which then replaces the previous one. '''
+        with self.lock:
+            self._save()
+    
+    def _save(self):
+        temp = temp_path(self.path)
+        with open(temp, "w") as output:
+            json.dump({ "version": 1, "entries": self.entries }, output)
+            output.flush()
+            os.fsync(output.fileno())
+        replace_file(temp, self.path)
+        self.pending = 0
@@ -0,0 +1,117 @@
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2013, Jose F. Maldonado
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+#
+#    - Redistributions of source code must retain the above copyright notice, this 
+#    list of conditions and the following disclaimer.
+#    - Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation and/or 
+#    other materials provided with the distribution.
+#    - Neither the name of the author nor the names of its contributors may be used 
+#    to endorse or promote products derived from this software without specific prior 
+#    written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+# SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+# DAMAGE.
+#
+# -------------------------------------------------------------------------------------
+#
+# Pipelines of pixel filters.
+#
+# A pipeline is defined by a string with the names of its stages separated by '|', for
+# example "discolour|invert|split:R,G,B". The point operations (discolour, invert and
+# channel) are fused into a single set of lookup tables (see lut.py), so the pixels are
+# read once, transformed by all the stages in memory and written once. The 'split' stage
+# can only be the last one, and produces one output for each channel.
+
+from fusamples.lut import compile_op
+from fusamples.pixels import CHANNELS, ChannelSplitter
+
+def _parse_channels(arg):
+    names = [name.strip().upper() for name in arg.split(",") if name.strip()]
+    if(not names):
+        raise ValueError("no channels specified")
+    for name in names:
+        if(name not in CHANNELS):
+            raise ValueError("unknown channel '" + name + "'")
+    return names
+
+class Pipeline(object):
+    ''' A fused pipeline: a point operation, optionally followed by a split of the channels. '''
+    def __init__(self, op, channels=None):
+        ''' Creates the pipeline.
+        
+        Parameters:
+        op : PointOp The fused point operations.
+        channels : list The names of the channels of the split stage (like "R" or "A"), or None if the pipeline does not split the channels.
+        '''
+        self.op = op
+        self.channels = channels
+        self._splitters = {}
+    
+    def prepare(self, pixelSize):
+        ''' Prepares the pipeline for pixels of the given size (it raises a ValueError if the
+        pixels do not have the channels of the split stage).
+        '''
+        if(self.channels is not None and pixelSize not in self._splitters):
+            self._splitters[pixelSize] = ChannelSplitter(pixelSize, [CHANNELS[name] for name in self.channels])
+    
+    def process(self, data, pixelSize):
+        ''' Applies all the stages to a buffer of pixels.
+        
+        Parameters:
+        data : string The pixels, as returned by a pixel region.
+        pixelSize : int The number of bytes of each pixel.
+        
+        Returns:
+        list The resulting buffers (one for each channel of the split stage, or only one).
+        '''
+        result = self.op.apply(data, pixelSize)
+        if(self.channels is None):
+            return [result]
+        
+        self.prepare(pixelSize)
+        return self._splitters[pixelSize].split(result)
+
+def parse_pipeline(spec):
+    ''' Parses the specification of a pipeline (like "discolour|invert|split:R,G,B").
+    The stages are 'discolour', 'invert', 'channel:<R|G|B>' (keeps a channel and clears 
+    the other RGB channels) and 'split:<channels>'.
+    
+    Returns:
+    Pipeline The fused pipeline.
+    '''
+    op = compile_op("identity")
+    channels = None
+    for stage in spec.split("|"):
+        name, sep, arg = stage.strip().partition(":")
+        name = name.strip().lower()
+        if(not name):
+            continue
+        if(channels is not None):
+            raise ValueError("'split' must be the last stage of the pipeline")
+        
+        if(name == "split"):
+            channels = _parse_channels(arg or "R,G,B")
+        elif(name == "channel"):
+            names = _parse_channels(arg)
+            if(len(names) != 1 or names[0] == "A"):
+                raise ValueError("'channel' requires one of the R, G or B channels")
+            op = op.then(compile_op("channel", channel=CHANNELS[names[0]]))
+        elif(name in ("discolour", "invert")):
+            op = op.then(compile_op(name))
+        else:
+            raise ValueError("unknown stage '" + name + "'")
+    return Pipeline(op, channels)
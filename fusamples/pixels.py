@@ -0,0 +1,300 @@
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2013, Jose F. Maldonado
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+#
+#    - Redistributions of source code must retain the above copyright notice, this 
+#    list of conditions and the following disclaimer.
+#    - Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation and/or 
+#    other materials provided with the distribution.
+#    - Neither the name of the author nor the names of its contributors may be used 
+#    to endorse or promote products derived from this software without specific prior 
+#    written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+# SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+# DAMAGE.
+#
+# -------------------------------------------------------------------------------------
+#
+# Pixel buffer operations shared by the pixel level plug-ins.
+#
+# The functions of this module work over the raw strings returned by the pixel regions
+# (for example 'layer.get_pixel_rgn(0, 0, w, h)[0:w, 0:h]'), so a whole layer can be
+# processed with a few bulk operations instead of executing Python code for each pixel.
+# NumPy is used when it is installed, otherwise the 'array' module is used.
+#
+# The channels of the pixels can have 8 bits (the only depth of GIMP 2.8), 16 or 32 bits,
+# or be floats (GIMP 2.10 and later). The depth is identified by an array type code
+# ("B", "H", "I", "f" or "d", see pixel_format()), and the buffers are processed as 
+# typed arrays of that type, so the values are never converted one by one.
+
+from array import array
+
+try:
+    from itertools import izip as zip
+except ImportError:
+    pass
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Table which maps the sum of the RGB channels of a pixel to his gray value.
+_GRAY_OF_SUM = array("B", [s // 3 for s in range(3 * 255 + 1)])
+
+def to_string(buf):
+    ''' Converts an array (or a NumPy array) into a string that can be assigned to a pixel region.
+    
+    Parameters:
+    buf : array The buffer to convert.
+    '''
+    if hasattr(buf, "tobytes"):
+        return buf.tobytes()
+    return buf.tostring()
+
+def band_height(rowSize, memoryBudget, alignment=1, buffers=4):
+    ''' Calculates the number of rows of the bands in which a region must be processed
+    for not exceeding a memory budget.
+    
+    Parameters:
+    rowSize : int The number of bytes of a row of the region.
+    memoryBudget : int The maximum number of bytes used by the buffers.
+    alignment : int The number of rows must be a multiple of this value (normally gimp.tile_height()), if possible.
+    buffers : int The number of buffers of the size of a band used at the same time.
+    
+    Returns:
+    int The number of rows (at least one).
+    '''
+    rows = max(1, memoryBudget // (rowSize * buffers))
+    if(rows >= alignment):
+        rows -= rows % alignment
+    return rows
+
+# Tables of the gray values of the other integer depths (created when they are needed).
+_grayTables = { "B": _GRAY_OF_SUM }
+
+# Maximum value (opaque alpha) of the channels of each type.
+MAX_VALUES = { "B": 255, "H": 65535, "I": 4294967295, "f": 1.0, "d": 1.0 }
+
+# Precisions of GIMP 2.10 from which the channels are floats (half floats are not supported).
+_FLOAT_PRECISION = 500
+
+class PixelFormat(object):
+    ''' Format of the pixels of a drawable. '''
+    def __init__(self, channels, typecode):
+        ''' Creates the format.
+        
+        Parameters:
+        channels : int The number of channels of each pixel.
+        typecode : string The array type code of the channels ("B", "H", "I", "f" or "d").
+        '''
+        self.channels = channels
+        self.typecode = typecode
+        self.channelSize = array(typecode).itemsize
+        self.pixelSize = channels * self.channelSize
+        self.isFloat = typecode in ("f", "d")
+        self.maxValue = MAX_VALUES[typecode]
+
+def pixel_format(drawable):
+    ''' Returns the format of the pixels of a drawable, identifying the depth of his 
+    channels by his number of bytes per pixel.
+    '''
+    channels = (3 if drawable.is_rgb else 1) + (1 if drawable.has_alpha else 0)
+    channelSize = drawable.bpp // channels
+    if(channelSize == 1):
+        return PixelFormat(channels, "B")
+    
+    # GIMP 2.10 stores 32 bits integers and floats with the same number of bytes, so his
+    # precision is used for distinguishing them (if it is not known, they are floats).
+    isFloat = channelSize != 2
+    try:
+        from gimpfu import pdb
+        isFloat = pdb.gimp_image_get_precision(drawable.image) >= _FLOAT_PRECISION
+    except (AttributeError, RuntimeError, ImportError):
+        pass
+    typecode = { (2, False): "H", (4, False): "I", (4, True): "f", (8, True): "d" }.get((channelSize, isFloat))
+    if(typecode is None):
+        raise ValueError("the channels of %d bytes are not supported" % channelSize)
+    return PixelFormat(channels, typecode)
+
+def has_8_bits(drawable):
+    ''' Indicates if the channels of a drawable have 8 bits (the only depth supported by
+    the operations which read the channels as bytes).
+    '''
+    return drawable.bpp == (3 if drawable.is_rgb else 1) + (1 if drawable.has_alpha else 0)
+
+def discolour_buffer(data, pixelSize, useNumpy=True, typecode="B"):
+    ''' Converts a buffer of pixels to gray scale, calculating the gray tone of each 
+    pixel as the average of his RGB channels. The alpha channel (or any other channel)
+    is copied without changes.
+    
+    Parameters:
+    data : string The pixels, as returned by a pixel region.
+    pixelSize : int The number of bytes of each pixel (3 for RGB, 4 for RGBA, 6 for RGB with 16 bits per channel...).
+    useNumpy : bool Indicates if NumPy must be used (when it is installed).
+    typecode : string The array type code of the channels (see pixel_format()).
+    
+    Returns:
+    string The converted pixels.
+    '''
+    if(useNumpy and numpy is not None):
+        return _discolour_numpy(data, pixelSize, typecode)
+    return _discolour_array(data, pixelSize, typecode)
+
+def _discolour_numpy(data, pixelSize, typecode):
+    ''' Implementation of discolour_buffer() which uses NumPy. '''
+    # Put each pixel in a row of the matrix.
+    dtype = numpy.dtype(typecode)
+    pixels = numpy.frombuffer(data, dtype=dtype).reshape(-1, pixelSize // dtype.itemsize).copy()
+    
+    # Calculate the gray values with one reduction and copy them in the RGB columns.
+    if(dtype.kind == "f"):
+        gray = pixels[:, 0:3].sum(axis=1, dtype=dtype) / dtype.type(3)
+    else:
+        gray = pixels[:, 0:3].sum(axis=1, dtype={ 1: numpy.uint16, 2: numpy.uint32 }.get(dtype.itemsize, numpy.uint64)) // 3
+    pixels[:, 0:3] = gray[:, numpy.newaxis]
+    return to_string(pixels)
+
+def _gray_table(typecode):
+    ''' Returns the table which maps the sum of the RGB channels to the gray value, for
+    the integer types of 8 and 16 bits (None for the other types).
+    '''
+    if(typecode not in _grayTables):
+        _grayTables[typecode] = array(typecode, [s // 3 for s in range(3 * MAX_VALUES[typecode] + 1)]) if typecode == "H" else None
+    return _grayTables[typecode]
+
+def _discolour_array(data, pixelSize, typecode):
+    ''' Implementation of discolour_buffer() which only uses the 'array' module. '''
+    pixels = array(typecode, data)
+    step = pixelSize // pixels.itemsize
+    
+    # Calculate the gray values from the strided views of the RGB channels.
+    channels = zip(pixels[0::step], pixels[1::step], pixels[2::step])
+    table = _gray_table(typecode)
+    if(table is not None):
+        gray = array(typecode, (table[r + g + b] for r, g, b in channels))
+    elif(typecode in ("f", "d")):
+        gray = array(typecode, ((r + g + b) / 3.0 for r, g, b in channels))
+    else:
+        gray = array(typecode, ((r + g + b) // 3 for r, g, b in channels))
+    
+    # Copy the gray values in the RGB channels (the other channels are not modified).
+    pixels[0::step] = gray
+    pixels[1::step] = gray
+    pixels[2::step] = gray
+    return to_string(pixels)
+
+# Index of each channel name.
+CHANNELS = { "R": 0, "G": 1, "B": 2, "A": 3 }
+
+# Suffix of the name of the layer of each channel.
+CHANNEL_NAMES = { "R": "Red", "G": "Green", "B": "Blue", "A": "Alpha" }
+
+def new_channel_layers(img, layer, names, roi):
+    ''' Creates a layer for each channel, above a layer and with his size and type. If the
+    region is not the whole layer the new layers are cleared (otherwise all their pixels
+    are written).
+    
+    Parameters:
+    img : image The image of the layer.
+    layer : layer The layer whose channels are separated.
+    names : list The names of the channels (keys of CHANNELS).
+    roi : Roi The region of the layer which is processed.
+    
+    Returns:
+    list The new layers, in the same order as the names.
+    '''
+    from gimpfu import gimp, pdb, TRANSPARENT_FILL
+    
+    # Get the layer position.
+    pos = 0;
+    for i in range(len(img.layers)):
+        if(img.layers[i] == layer):
+            pos = i
+    
+    # Create the layers.
+    newLayers = []
+    for name in names:
+        newLayer = gimp.Layer(img, layer.name + " " + CHANNEL_NAMES[name], layer.width, layer.height, layer.type, layer.opacity, layer.mode)
+        img.add_layer(newLayer, pos)
+        if(not roi.is_whole()):
+            pdb.gimp_drawable_fill(newLayer, TRANSPARENT_FILL)
+        newLayers.append(newLayer)
+    return newLayers
+
+class ChannelSplitter(object):
+    ''' Separates the channels of buffers of pixels. Each selected channel produces a 
+    buffer in which the other color channels are zero, and the alpha channel (or any
+    other channel) is copied. When the alpha channel is selected, it is stored in the RGB
+    channels of his buffer, which is made opaque.
+    
+    The output buffers are zero-filled only once, and are reused while the buffers to
+    split have the same length.
+    '''
+    def __init__(self, pixelSize, channels, typecode="B"):
+        ''' Creates the splitter.
+        
+        Parameters:
+        pixelSize : int The number of bytes of each pixel (3 for RGB, 4 for RGBA, 8 for RGBA with 16 bits per channel...).
+        channels : list The indexes of the channels to extract (see CHANNELS).
+        typecode : string The array type code of the channels (see pixel_format()).
+        '''
+        self.typecode = typecode
+        self.channelCount = pixelSize // array(typecode).itemsize
+        for channel in channels:
+            if(channel >= self.channelCount):
+                raise ValueError("the pixels do not have the channel " + str(channel))
+        self.pixelSize = pixelSize
+        self.channels = list(channels)
+        self._outputs = None
+    
+    def _buffers(self, length):
+        ''' Returns the output buffers for the given length (in values), creating them if necessary. '''
+        if(self._outputs is None or len(self._outputs[0]) != length):
+            zeros = array(self.typecode, [0]) * length
+            self._outputs = [array(self.typecode, zeros) for channel in self.channels]
+            for channel, out in zip(self.channels, self._outputs):
+                if(channel == 3):
+                    out[3::self.channelCount] = array(self.typecode, [MAX_VALUES[self.typecode]]) * (length // self.channelCount)
+        return self._outputs
+    
+    def split(self, data):
+        ''' Separates the channels of a buffer.
+        
+        Parameters:
+        data : string The pixels, as returned by a pixel region.
+        
+        Returns:
+        list A string for each selected channel.
+        '''
+        size = self.channelCount
+        src = array(self.typecode, data)
+        results = []
+        for channel, out in zip(self.channels, self._buffers(len(src))):
+            values = src[channel::size]
+            if(channel < 3):
+                out[channel::size] = values
+            else:
+                out[0::size] = values
+                out[1::size] = values
+                out[2::size] = values
+            
+            # Copy the alpha channel (or any other channel).
+            for k in range(3, size):
+                if(channel != 3 or k != 3):
+                    out[k::size] = src[k::size]
+            results.append(to_string(out))
+        return results
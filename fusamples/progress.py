@@ -0,0 +1,146 @@
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2013, Jose F. Maldonado
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+#
+#    - Redistributions of source code must retain the above copyright notice, this 
+#    list of conditions and the following disclaimer.
+#    - Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation and/or 
+#    other materials provided with the distribution.
+#    - Neither the name of the author nor the names of its contributors may be used 
+#    to endorse or promote products derived from this software without specific prior 
+#    written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+# SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+# DAMAGE.
+#
+# -------------------------------------------------------------------------------------
+#
+# Progress bar of the pixel level plug-ins.
+#
+# Each call to gimp.progress_update() is a message to the GIMP process, so updating the
+# progress bar once per row (or per tile) of a big layer sends thousands of messages, 
+# while the bar can only show a few changes per second. A Progress only sends the
+# updates separated by a minimum interval of time (and the last one).
+#
+# It also checks a cancellation flag in each update: when the operation is cancelled, 
+# update() raises Cancelled, so the plug-in can discard the results written so far 
+# (the shadow tiles or the new layers) before closing his undo group. While the progress
+# bar is shown, the signals SIGINT and SIGTERM (Ctrl+C in the terminal which started 
+# GIMP, or 'kill <pid>' of the plug-in process) cancel the operation instead of killing
+# the plug-in. The operation can also be cancelled with cancel(), for example from 
+# another thread.
+#
+# Usage:
+# >>> progress = Progress("Discolouring " + layer.name + "...")
+# >>> try:
+# >>>     for y1, y2 in scan.bands():
+# >>>         progress.update(scan.progress(y1))
+# >>>         ...
+# >>> except Cancelled:
+# >>>     ...   # Discard the results.
+# >>> progress.end()
+
+import signal
+import threading
+import time
+
+# Minimum time (in seconds) between two updates of the progress bar.
+INTERVAL = 0.1
+
+# Signals which cancel the operation in progress.
+SIGNALS = [signal.SIGINT, signal.SIGTERM]
+
+# Cancellation flag of the operation in progress.
+_cancelled = threading.Event()
+
+class Cancelled(Exception):
+    ''' Raised by Progress.update() when the operation has been cancelled. '''
+    pass
+
+def cancel():
+    ''' Requests the cancellation of the operation in progress. '''
+    _cancelled.set()
+
+def cancelled():
+    ''' Indicates if the cancellation of the operation in progress has been requested. '''
+    return _cancelled.is_set()
+
+def _handle_signal(signum, frame):
+    ''' Handler of the signals which cancel the operation in progress. '''
+    cancel()
+
+class Progress(object):
+    ''' Progress bar of an operation, whose updates are limited by an interval of time. '''
+    def __init__(self, text, interval=None):
+        ''' Shows the progress bar (and forgets the previous cancellations), and installs the
+        handlers of the signals which cancel the operation.
+        
+        Parameters:
+        text : string The text of the progress bar.
+        interval : float The minimum time (in seconds) between two updates (None for INTERVAL).
+        '''
+        from gimpfu import gimp
+        self._update = gimp.progress_update
+        self.interval = INTERVAL if interval is None else interval
+        self.updates = 0
+        self._last = time.time()
+        _cancelled.clear()
+        self._handlers = {}
+        for signum in SIGNALS:
+            try:
+                self._handlers[signum] = signal.signal(signum, _handle_signal)
+            except ValueError:
+                # Only the main thread can install signal handlers (the operation can 
+                # still be cancelled with cancel()).
+                pass
+        gimp.progress_init(text)
+    
+    def check(self):
+        ''' Raises Cancelled if the cancellation of the operation has been requested. '''
+        if(_cancelled.is_set()):
+            raise Cancelled("the operation has been cancelled")
+    
+    def update(self, fraction):
+        ''' Updates the progress bar, if the interval has passed since the previous update
+        (the progress bar is always updated when the operation is completed).
+        
+        Parameters:
+        fraction : float The fraction of the operation completed, between 0 and 1.
+        '''
+        self.check()
+        now = time.time()
+        if(now - self._last >= self.interval or fraction >= 1.0):
+            self._update(fraction)
+            self._last = now
+            self.updates += 1
+    
+    def scaled(self, start, part):
+        ''' Returns a function which updates the progress bar with the progress of a part 
+        of the operation (for example, to pass it to TileScheduler.run()).
+        
+        Parameters:
+        start : float The fraction of the operation completed before the part.
+        part : float The fraction of the operation represented by the part.
+        '''
+        return lambda fraction: self.update(start + fraction * part)
+    
+    def end(self):
+        ''' Hides the progress bar, and restores the previous handlers of the signals. '''
+        from gimpfu import pdb
+        for signum, handler in self._handlers.items():
+            signal.signal(signum, signal.SIG_DFL if handler is None else handler)
+        self._handlers = {}
+        pdb.gimp_progress_end()
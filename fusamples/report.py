@@ -0,0 +1,213 @@
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2013, Jose F. Maldonado
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+#
+#    - Redistributions of source code must retain the above copyright notice, this 
+#    list of conditions and the following disclaimer.
+#    - Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation and/or 
+#    other materials provided with the distribution.
+#    - Neither the name of the author nor the names of its contributors may be used 
+#    to endorse or promote products derived from this software without specific prior 
+#    written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+# SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+# DAMAGE.
+#
+# -------------------------------------------------------------------------------------
+#
+# Collection of the errors of a batch.
+#
+# The failures of a batch (file, stage and exception) are collected in memory instead of
+# being displayed one by one, and at the end of the batch they are saved in a report
+# next to the outputs ('batch-errors.json' and 'batch-errors.csv', or for example 
+# 'batch-errors-2-of-8.json' for the second of eight shards). The report is merged with
+# the one of the previous batches: the entries of the files processed again are 
+# replaced, and the entries of the other files are kept.
+#
+# The files which fail in several batches (for example, corrupted images which make a
+# loader fail) are quarantined: the following batches skip them, until they are modified.
+# The quarantine is saved in the output folder ('.batch-quarantine.json').
+
+import csv
+import json
+import os
+import sys
+import threading
+import time
+
+from fusamples.batch import Stage
+from fusamples.manifest import FileLock, replace_file, shard_name, temp_path
+
+# Names of the files of the report and of the quarantine.
+REPORT_NAME = "batch-errors"
+QUARANTINE_NAME = ".batch-quarantine.json"
+
+# Columns of the report.
+COLUMNS = ["path", "stage", "status", "error", "message", "retries", "time"]
+
+def _write_atomically(path, write, binary=False):
+    ''' Writes a file through a temporary file, so it is never left half written. '''
+    temporary = temp_path(path)
+    if(binary and sys.version_info[0] < 3):
+        output = open(temporary, "wb")
+    elif(binary):
+        output = open(temporary, "w", newline="")
+    else:
+        output = open(temporary, "w")
+    try:
+        write(output)
+    finally:
+        output.close()
+    replace_file(temporary, path)
+
+def _load_report(path):
+    ''' Returns the entries of a report, or an empty list if it does not exist or is damaged. '''
+    if(not os.path.exists(path)):
+        return []
+    try:
+        with open(path) as source:
+            entries = json.load(source)
+    except (IOError, OSError, ValueError):
+        return []
+    return entries if isinstance(entries, list) else []
+
+class ErrorCollector(object):
+    ''' Collects the errors of a batch, and quarantines the files which fail repeatedly. '''
+    def __init__(self, outputFolder, maxFailures=2, shard=None):
+        ''' Loads the quarantine of a folder (if it exists).
+        
+        Parameters:
+        outputFolder : string The folder in which the results are saved.
+        maxFailures : int The number of batches in which a file must fail to be quarantined (0 for never quarantining files).
+        shard : tuple The shard processed by the batch (its report and quarantine are saved in separate files), or None for all the files.
+        '''
+        self.outputFolder = outputFolder
+        self.maxFailures = maxFailures
+        self.shard = shard
+        self.quarantinePath = os.path.join(outputFolder, shard_name(QUARANTINE_NAME, shard))
+        self.lock = threading.Lock()
+        self.entries = []
+        self.seen = set()
+        self.quarantine = {}
+        if(os.path.exists(self.quarantinePath)):
+            try:
+                with open(self.quarantinePath) as source:
+                    self.quarantine = json.load(source)
+            except ValueError:
+                # A damaged quarantine is discarded.
+                self.quarantine = {}
+    
+    def stages(self, stages):
+        ''' Returns the stages of a batch, with the stages which skip the quarantined files 
+        and release the files which have been processed.
+        '''
+        return [Stage("quarantine", self.check, False)] + stages + [Stage("release", self.release, False)]
+    
+    def _unchanged(self, item, entry):
+        stat = os.stat(item.inputPath)
+        return entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime
+    
+    def check(self, item):
+        ''' Stage which skips a file if it is quarantined and has not been modified. '''
+        with self.lock:
+            self.seen.add(item.inputPath)
+            entry = self.quarantine.get(item.inputPath)
+        if(entry is None or self.maxFailures <= 0 or entry["failures"] < self.maxFailures):
+            return True
+        if(not self._unchanged(item, entry)):
+            # The file has been modified, so it can be processed again.
+            with self.lock:
+                self.quarantine.pop(item.inputPath, None)
+            return True
+        self._add(item, entry["stage"], "quarantined", entry["error"], "skipped after failing in %d batches: %s" % (entry["failures"], entry["message"]))
+        return False
+    
+    def release(self, item):
+        ''' Stage which removes a file from the quarantine when it has been processed. '''
+        with self.lock:
+            self.quarantine.pop(item.inputPath, None)
+    
+    def add(self, item, stage, err):
+        ''' Records a failure (this method can be used as the 'onError' function of a BatchPipeline). '''
+        self._add(item, stage, "failed", type(err).__name__, str(err))
+        
+        # Count the batches in which the file has failed.
+        if(self.maxFailures > 0 and os.path.exists(item.inputPath)):
+            stat = os.stat(item.inputPath)
+            with self.lock:
+                entry = self.quarantine.get(item.inputPath)
+                failures = 1
+                if(entry is not None and entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime):
+                    failures = entry["failures"] + 1
+                self.quarantine[item.inputPath] = { "size": stat.st_size, "mtime": stat.st_mtime, "failures": failures,
+                    "stage": stage, "error": type(err).__name__, "message": str(err) }
+    
+    def _add(self, item, stage, status, error, message):
+        entry = { "path": item.inputPath, "stage": stage, "status": status, "error": error, "message": message,
+            "retries": getattr(item, "retries", 0), "time": time.strftime("%Y-%m-%dT%H:%M:%S") }
+        with self.lock:
+            self.entries.append(entry)
+    
+    def failures(self):
+        return [entry for entry in self.entries if entry["status"] == "failed"]
+    
+    def quarantined(self):
+        return [entry for entry in self.entries if entry["status"] == "quarantined"]
+    
+    def save(self):
+        ''' Saves the quarantine and the report. The entries of the report of previous 
+        batches are kept, except the ones of the files processed by this batch (so the 
+        report is removed when all his files have been processed without errors).
+        
+        Returns:
+        list The paths of the files of the report (empty if there are no errors).
+        '''
+        with self.lock:
+            entries = list(self.entries)
+            seen = set(self.seen)
+            quarantine = dict([(path, entry) for path, entry in self.quarantine.items() if os.path.exists(path)])
+        
+        if(quarantine):
+            _write_atomically(self.quarantinePath, lambda output: json.dump(quarantine, output, indent=1, sort_keys=True))
+        elif(os.path.exists(self.quarantinePath)):
+            os.remove(self.quarantinePath)
+        
+        base = os.path.join(self.outputFolder, shard_name(REPORT_NAME, self.shard))
+        paths = [base + ".json", base + ".csv"]
+        
+        # Merge the report with the one of the previous batches (other batches can save
+        # it at the same time, for example the jobs of the daemon over the same folder).
+        with FileLock(paths[0]):
+            entries += [entry for entry in _load_report(paths[0]) if entry.get("path") not in seen]
+            entries.sort(key=lambda entry: entry["path"])
+            if(not entries):
+                for path in paths:
+                    if(os.path.exists(path)):
+                        os.remove(path)
+                return []
+            
+            def write_csv(output):
+                writer = csv.DictWriter(output, COLUMNS)
+                writer.writerow(dict([(column, column) for column in COLUMNS]))
+                for entry in entries:
+                    writer.writerow(entry)
+            _write_atomically(paths[0], lambda output: json.dump(entries, output, indent=1, sort_keys=True))
+            _write_atomically(paths[1], write_csv, True)
+        return paths
+    
+    def summary(self):
+        ''' Returns a line of text describing the errors. '''
+        return "%d files failed, %d files quarantined" % (len(self.failures()), len(self.quarantined()))
@@ -0,0 +1,94 @@
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2013, Jose F. Maldonado
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+#
+#    - Redistributions of source code must retain the above copyright notice, this 
+#    list of conditions and the following disclaimer.
+#    - Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation and/or 
+#    other materials provided with the distribution.
+#    - Neither the name of the author nor the names of its contributors may be used 
+#    to endorse or promote products derived from this software without specific prior 
+#    written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+# SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+# DAMAGE.
+#
+# -------------------------------------------------------------------------------------
+#
+# Helpers for scaling the images of a batch.
+#
+# The images can be scaled down right after they are opened, so the filters only process
+# the pixels that are kept. A pyramid of sizes (like 2048, 1024, 512 and 256) is built by
+# scaling each level from the previous one, instead of from the original image, so each
+# scale only reads the pixels of a level which is already small.
+
+def fit_size(width, height, maxSize):
+    ''' Calculates the size of an image scaled to fit in a square, keeping his aspect ratio
+    (the images are never enlarged).
+    
+    Parameters:
+    width : int The width of the image.
+    height : int The height of the image.
+    maxSize : int The size of the side of the square (0 for no limit).
+    
+    Returns:
+    tuple The new width and height.
+    '''
+    if(maxSize <= 0 or (width <= maxSize and height <= maxSize)):
+        return (width, height)
+    if(width >= height):
+        return (maxSize, max(1, int(round(height * float(maxSize) / width))))
+    return (max(1, int(round(width * float(maxSize) / height))), maxSize)
+
+def scale_to_fit(image, maxSize):
+    ''' Scales an image (all his layers) to fit in a square of the given size, if it is
+    bigger.
+    
+    Returns:
+    bool True if the image has been scaled.
+    '''
+    from gimpfu import pdb
+    width, height = fit_size(image.width, image.height, maxSize)
+    if((width, height) == (image.width, image.height)):
+        return False
+    pdb.gimp_image_scale(image, width, height)
+    return True
+
+def parse_sizes(text):
+    ''' Parses a list of sizes separated by commas (like "2048,1024,512"), and returns 
+    them in decreasing order.
+    '''
+    try:
+        sizes = [int(size) for size in text.split(",") if size.strip()]
+    except ValueError:
+        raise ValueError("invalid list of sizes '" + text + "'")
+    if(not sizes or min(sizes) <= 0):
+        raise ValueError("the sizes must be positive numbers")
+    return sorted(set(sizes), reverse=True)
+
+def pyramid(image, sizes, save):
+    ''' Scales an image to several sizes, from the biggest to the smallest, scaling each
+    level from the previous one (when the sizes are halved, each level is obtained by 
+    halving the previous one).
+    
+    Parameters:
+    image : image The image, which is modified.
+    sizes : list The sizes of the levels, in decreasing order (see parse_sizes).
+    save : function A function which receives the image and the size of each level, and saves it.
+    '''
+    for size in sizes:
+        scale_to_fit(image, size)
+        save(image, size)
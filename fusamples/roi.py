@@ -0,0 +1,188 @@
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2013, Jose F. Maldonado
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+#
+#    - Redistributions of source code must retain the above copyright notice, this 
+#    list of conditions and the following disclaimer.
+#    - Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation and/or 
+#    other materials provided with the distribution.
+#    - Neither the name of the author nor the names of its contributors may be used 
+#    to endorse or promote products derived from this software without specific prior 
+#    written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+# SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+# DAMAGE.
+#
+# -------------------------------------------------------------------------------------
+#
+# Region of interest of the pixel level plug-ins.
+#
+# The region of interest of a drawable is the intersection of the drawable with the
+# bounds of the selection (or the whole drawable, if nothing is selected), so a filter
+# only has to read and write the tiles inside it. The values of the selection mask are
+# used for blending the results with the original pixels at the edges of the selection.
+#
+# Note that when the results are written in the shadow tiles of the drawable, GIMP
+# applies the selection mask by itself in merge_shadow(), so they must not be blended.
+#
+# Usage:
+# >>> roi = get_roi(img, layer)
+# >>> if roi is not None:
+# >>>     original = srcRgn[roi.x:roi.x2, roi.y:roi.y2]
+# >>>     result = blend(process(original), original, roi.mask(roi.x, roi.y, roi.x2, roi.y2), layer.bpp)
+
+from array import array
+
+from fusamples.pixels import to_string
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class Roi(object):
+    ''' Rectangle of a drawable which must be processed. '''
+    def __init__(self, drawable, x, y, width, height, selection=None):
+        ''' Creates the region.
+        
+        Parameters:
+        drawable : drawable The drawable.
+        x : int The left side of the region (in coordinates of the drawable).
+        y : int The top side of the region (in coordinates of the drawable).
+        width : int The width of the region.
+        height : int The height of the region.
+        selection : channel The selection mask, or None if nothing is selected.
+        '''
+        self.drawable = drawable
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.x2 = x + width
+        self.y2 = y + height
+        self.selection = selection
+    
+    def is_whole(self):
+        ''' Indicates if the region covers the whole drawable, without a selection. '''
+        return self.selection is None and self.width == self.drawable.width and self.height == self.drawable.height
+    
+    def tile_range(self, tileWidth, tileHeight):
+        ''' Returns the columns and rows of the tiles which intersect the region.
+        
+        Returns:
+        tuple The range of columns and the range of rows.
+        '''
+        return range(self.x // tileWidth, (self.x2 - 1) // tileWidth + 1), range(self.y // tileHeight, (self.y2 - 1) // tileHeight + 1)
+    
+    def rows(self, rowHeight):
+        ''' Splits the region in bands aligned to the rows of tiles.
+        
+        Parameters:
+        rowHeight : int The height of the rows (normally gimp.tile_height()).
+        
+        Returns:
+        list A list of tuples (y1, y2).
+        '''
+        bands = []
+        y = self.y
+        while(y < self.y2):
+            y2 = min((y // rowHeight + 1) * rowHeight, self.y2)
+            bands.append((y, y2))
+            y = y2
+        return bands
+    
+    def mask(self, x1, y1, x2, y2):
+        ''' Returns the values of the selection mask (one byte per pixel) in a rectangle of
+        the drawable, or None if nothing is selected.
+        '''
+        if(self.selection is None):
+            return None
+        ox, oy = self.drawable.offsets
+        rgn = self.selection.get_pixel_rgn(x1 + ox, y1 + oy, x2 - x1, y2 - y1, False, False)
+        return rgn[x1 + ox : x2 + ox, y1 + oy : y2 + oy]
+
+def get_roi(img, drawable):
+    ''' Returns the region of a drawable which must be processed, or None if the selection
+    does not intersect it.
+    
+    Parameters:
+    img : image The image of the drawable.
+    drawable : drawable The drawable to process.
+    '''
+    from gimpfu import pdb
+    nonEmpty, x, y, width, height = pdb.gimp_drawable_mask_intersect(drawable)
+    if(not nonEmpty):
+        return None
+    selection = None if pdb.gimp_selection_is_empty(img) else img.selection
+    return Roi(drawable, x, y, width, height, selection)
+
+def whole_roi(drawable):
+    ''' Returns a region which covers a whole drawable. '''
+    return Roi(drawable, 0, 0, drawable.width, drawable.height)
+
+def blend(result, original, mask, pixelSize, typecode="B"):
+    ''' Blends the results of a filter with the original pixels, according to the values
+    of the selection mask (255 keeps the result, 0 keeps the original pixel).
+    
+    Parameters:
+    result : string The pixels generated by the filter.
+    original : string The original pixels.
+    mask : string The values of the mask (one byte per pixel), or None.
+    pixelSize : int The number of bytes of each pixel.
+    typecode : string The array type code of the channels (see fusamples.pixels.pixel_format()).
+    
+    Returns:
+    string The blended pixels.
+    '''
+    if(mask is None or mask == b"\xff" * len(mask)):
+        return result
+    if(mask == b"\x00" * len(mask)):
+        return original
+    isFloat = typecode in ("f", "d")
+    if(numpy is not None):
+        dtype = numpy.dtype(typecode)
+        work = numpy.float64 if isFloat else numpy.uint64
+        res = numpy.frombuffer(result, dtype=dtype).reshape(-1, pixelSize // dtype.itemsize).astype(work)
+        org = numpy.frombuffer(original, dtype=dtype).reshape(-1, pixelSize // dtype.itemsize).astype(work)
+        m = numpy.frombuffer(mask, dtype=numpy.uint8).astype(work)[:, numpy.newaxis]
+        if(isFloat):
+            out = (res * m + org * (255 - m)) / 255
+        else:
+            out = (res * m + org * (255 - m) + 127) // 255
+        return to_string(out.astype(dtype))
+    res = array(typecode, result)
+    org = array(typecode, original)
+    values = array("B", mask)
+    out = array(typecode, org)
+    channels = pixelSize // out.itemsize
+    for i in range(len(values)):
+        m = values[i]
+        if(m == 0):
+            continue
+        for k in range(i * channels, (i + 1) * channels):
+            if(isFloat):
+                out[k] = (res[k] * m + org[k] * (255 - m)) / 255.0
+            else:
+                out[k] = (res[k] * m + org[k] * (255 - m) + 127) // 255
+    return to_string(out)
+
+def blend_pixel(result, original, m):
+    ''' Blends a pixel (a tuple of values) with the original one, according to the value
+    of the selection mask.
+    '''
+    if(m == 255):
+        return result
+    return tuple([(r * m + o * (255 - m) + 127) // 255 for r, o in zip(result, original)])
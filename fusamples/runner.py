@@ -0,0 +1,350 @@
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2013, Jose F. Maldonado
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+#
+#    - Redistributions of source code must retain the above copyright notice, this 
+#    list of conditions and the following disclaimer.
+#    - Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation and/or 
+#    other materials provided with the distribution.
+#    - Neither the name of the author nor the names of its contributors may be used 
+#    to endorse or promote products derived from this software without specific prior 
+#    written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+# SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+# DAMAGE.
+#
+# -------------------------------------------------------------------------------------
+#
+# Headless runner of the plug-ins.
+#
+# This module executes jobs (calls to the functions of the plug-ins) without the user
+# interface of GIMP. GIMP is started only once, in batch mode, and all the jobs are
+# executed in the same session, so the start-up cost is paid only once. The jobs are
+# read from a file (or from the standard input), one JSON object per line:
+#
+#   {"procedure": "batch_invert", "args": {"inputFolder": "/in", "outputFolder": "/out"}}
+#   {"procedure": "save_to_files", "image": "/in/a.png", "args": {"outputFolder": "/out"}}
+#
+# The arguments which are not specified take the default values of the plug-in, and the
+# procedures which work over an image receive the image of the 'image' file (or None).
+# The result of each job is printed as a JSON line, and the exit status is 0 if all the
+# jobs succeed, 1 if any job fails and 2 if GIMP could not be executed:
+#
+#   python -m fusamples.runner jobs.jsonl
+#   cat jobs.jsonl | python -m fusamples.runner --gimp /usr/bin/gimp-2.8
+#
+# With the option '--stand-in' the jobs are executed in the current process, using the
+# stand-in of 'gimpfu' of the benchmarks folder, instead of GIMP.
+
+import json
+import optparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Scripts whose procedures can be executed by default.
+DEFAULT_SCRIPTS = ["test-batch-invert.py", "test-batch-cartoon.py", "test-batch-pyramid.py", "test-save-to-files.py"]
+
+# Prefix of the messages of the plug-ins which report an error.
+ERROR_PREFIX = "Unexpected error: "
+
+class Procedure(object):
+    ''' A function registered by a plug-in. '''
+    def __init__(self, name, label, params, function):
+        ''' Creates the procedure.
+        
+        Parameters:
+        name : string The name of the procedure in the PDB (like 'python_fu_test_batch_invert').
+        label : string The menu path of the procedure (the procedures of the '<Image>' menu receive an image and a drawable).
+        params : list The parameters declared in the registration.
+        function : function The function of the plug-in.
+        '''
+        self.name = name
+        self.params = params
+        self.function = function
+        self.takesImage = label.startswith("<Image>")
+    
+    def arguments(self, args):
+        ''' Returns the list of arguments of the function (without the image and the drawable),
+        from a dictionary of arguments indexed by name and the default values.
+        '''
+        names = [param[1] for param in self.params]
+        for name in args:
+            if(name not in names):
+                raise ValueError("unknown argument '" + name + "'")
+        return [args.get(param[1], param[3]) for param in self.params]
+
+def load_procedures(folder=ROOT_DIR, scripts=DEFAULT_SCRIPTS):
+    ''' Executes plug-in scripts, capturing the functions that they register.
+    
+    Parameters:
+    folder : string The folder of the scripts.
+    scripts : list The file names of the scripts.
+    
+    Returns:
+    dict The procedures, indexed by the name of the function and by the name in the PDB.
+    '''
+    import gimpfu
+    procedures = {}
+    
+    def register(proc_name, blurb, help, author, copyright, date, label, imagetypes, params, results, function, *args, **kwargs):
+        procedure = Procedure(proc_name, label, params, function)
+        procedures[proc_name] = procedure
+        procedures[function.__name__] = procedure
+    
+    # Replace register() and main() while the scripts are executed, so they do not try 
+    # to communicate with GIMP as plug-ins.
+    originals = (gimpfu.register, gimpfu.main)
+    gimpfu.register, gimpfu.main = register, lambda *args: None
+    try:
+        for script in scripts:
+            path = os.path.join(folder, script)
+            namespace = { "__name__": os.path.splitext(script)[0].replace("-", "_"), "__file__": path }
+            with open(path) as source:
+                code = compile(source.read(), path, "exec")
+            exec(code, namespace)
+    finally:
+        gimpfu.register, gimpfu.main = originals
+    return procedures
+
+def failed_result(job, error):
+    ''' Returns the result of a job which could not be executed. '''
+    job = job or {}
+    return { "id": job.get("id"), "procedure": job.get("procedure"), "status": "failed", "errors": [error], "messages": [], "seconds": 0 }
+
+def run_job(procedures, job):
+    ''' Executes a job.
+    
+    Parameters:
+    procedures : dict The procedures, as returned by load_procedures().
+    job : dict The job (with the keys 'procedure', 'args' and, optionally, 'image' and 'id').
+    
+    Returns:
+    dict The result of the job (with the keys 'id', 'procedure', 'status', 'errors', 'messages' and 'seconds').
+    '''
+    import gimpfu
+    from fusamples import formats
+    
+    result = { "id": job.get("id"), "procedure": job.get("procedure"), "errors": [], "messages": [] }
+    start = time.time()
+    
+    # Collect the messages of the plug-in, instead of displaying them.
+    gimp = gimpfu.gimp
+    original = gimp.message
+    gimp.message = result["messages"].append
+    image = None
+    try:
+        procedure = procedures.get(job.get("procedure"))
+        if(procedure is None):
+            raise ValueError("unknown procedure '" + str(job.get("procedure")) + "'")
+        args = procedure.arguments(job.get("args", {}))
+        
+        if(procedure.takesImage):
+            layer = None
+            if(job.get("image")):
+                fileFormat = formats.resolve(job["image"], True)
+                if(fileFormat is None or not fileFormat.can_load()):
+                    raise ValueError("unknown format of '" + job["image"] + "'")
+                image = fileFormat.load(job["image"])
+                layer = image.layers[0] if image.layers else None
+            args = [image, layer] + args
+        
+        procedure.function(*args)
+    except Exception as err:
+        result["errors"].append(str(err))
+    finally:
+        gimp.message = original
+        if(image is not None):
+            gimpfu.pdb.gimp_image_delete(image)
+    
+    # The plug-ins do not raise their errors, they display them.
+    result["errors"] += [message[len(ERROR_PREFIX):] for message in result["messages"] if message.startswith(ERROR_PREFIX)]
+    result["status"] = "failed" if result["errors"] else "ok"
+    result["seconds"] = round(time.time() - start, 3)
+    return result
+
+def parse_jobs(lines):
+    ''' Parses the lines of a job file (the empty lines and the lines which start with '#'
+    are ignored).
+    
+    Returns:
+    list The jobs (the dictionary of each job, or the error produced when parsing it).
+    '''
+    jobs = []
+    for number, line in enumerate(lines):
+        line = line.strip()
+        if(not line or line.startswith("#")):
+            continue
+        try:
+            job = json.loads(line)
+            if(not isinstance(job, dict) or not isinstance(job.get("args", {}), dict)):
+                raise ValueError("a job must be an object with a dictionary of arguments")
+        except ValueError as err:
+            job = ValueError("line " + str(number + 1) + ": " + str(err))
+        if(isinstance(job, dict) and job.get("id") is None):
+            job["id"] = number + 1
+        jobs.append(job)
+    return jobs
+
+def run_jobs(procedures, jobs, output):
+    ''' Executes several jobs, writing the result of each one as a JSON line.
+    
+    Returns:
+    int The number of failed jobs.
+    '''
+    failures = 0
+    for job in jobs:
+        if(isinstance(job, Exception)):
+            result = failed_result(None, str(job))
+        else:
+            result = run_job(procedures, job)
+        if(result["status"] != "ok"):
+            failures += 1
+        output.write(json.dumps(result, sort_keys=True) + "\n")
+        output.flush()
+    return failures
+
+def serve(jobsPath, resultsPath, folder=ROOT_DIR):
+    ''' Executes the jobs of a file inside GIMP (this function is called by the batch
+    interpreter, see launch()).
+    '''
+    procedures = load_procedures(folder)
+    with open(jobsPath) as source:
+        jobs = parse_jobs(source)
+    with open(resultsPath, "w") as output:
+        run_jobs(procedures, jobs, output)
+
+def work(socketPath, folder=ROOT_DIR):
+    ''' Executes the jobs received through a Unix domain socket, until the socket is closed
+    (this function is called by the workers of the daemon, see daemon.py).
+    
+    Parameters:
+    socketPath : string The path of the socket in which the daemon waits for the worker.
+    folder : string The folder of the plug-in scripts.
+    '''
+    import socket
+    procedures = load_procedures(folder)
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.connect(socketPath)
+    try:
+        for line in conn.makefile("r"):
+            result = run_job(procedures, json.loads(line))
+            conn.sendall((json.dumps(result, sort_keys=True) + "\n").encode("utf-8"))
+    finally:
+        conn.close()
+
+def gimp_command(gimpPath, folder, call):
+    ''' Returns the command which starts GIMP in batch mode, without user interface, and
+    calls a function of this module (like "runner.serve(...)").
+    '''
+    code = "import sys; sys.path.insert(0, %r); from fusamples import runner; %s" % (folder, call)
+    return [gimpPath, "-i", "--batch-interpreter", "python-fu-eval", "-b", code, "-b", "pdb.gimp_quit(1)"]
+
+def stand_in_command(folder, call):
+    ''' Returns the command which calls a function of this module (like "runner.work(...)")
+    in a new Python process, using the stand-in of 'gimpfu' instead of GIMP.
+    '''
+    code = "import sys; sys.path.insert(0, %r); from fusamples import runner; runner.install_stand_in(%r); %s" % (folder, folder, call)
+    return [sys.executable, "-c", code]
+
+def launch(jobs, output, gimpPath="gimp", folder=ROOT_DIR):
+    ''' Starts GIMP in batch mode (without user interface) and executes the jobs.
+    
+    Parameters:
+    jobs : list The jobs, as returned by parse_jobs().
+    output : file The file in which the results are written.
+    gimpPath : string The GIMP executable.
+    folder : string The folder of the plug-in scripts and of the 'fusamples' package.
+    
+    Returns:
+    int The exit status (0 if all the jobs succeed, 1 if any job fails and 2 if GIMP could not be executed).
+    '''
+    workDir = tempfile.mkdtemp(prefix="fusamples-")
+    jobsPath = os.path.join(workDir, "jobs.jsonl")
+    resultsPath = os.path.join(workDir, "results.jsonl")
+    try:
+        # Only the jobs which could be parsed are sent to GIMP.
+        valid = [job for job in jobs if isinstance(job, dict)]
+        with open(jobsPath, "w") as jobsFile:
+            for job in valid:
+                jobsFile.write(json.dumps(job) + "\n")
+        
+        command = gimp_command(gimpPath, folder, "runner.serve(%r, %r, %r)" % (jobsPath, resultsPath, folder))
+        try:
+            subprocess.call(command)
+        except OSError as err:
+            sys.stderr.write("Could not execute GIMP: " + str(err) + "\n")
+            return 2
+        
+        # Read the results, and mark as failed the jobs without result (if GIMP has crashed).
+        executed = []
+        if(os.path.exists(resultsPath)):
+            with open(resultsPath) as resultsFile:
+                executed = [json.loads(line) for line in resultsFile if line.strip()]
+        if(not executed and valid):
+            sys.stderr.write("GIMP did not execute the jobs\n")
+            return 2
+        for job in valid[len(executed):]:
+            executed.append(failed_result(job, "GIMP exited before executing the job"))
+        
+        # Write the results in the order of the jobs.
+        executed.reverse()
+        results = [executed.pop() if isinstance(job, dict) else failed_result(None, str(job)) for job in jobs]
+        for result in results:
+            output.write(json.dumps(result, sort_keys=True) + "\n")
+        return 1 if [result for result in results if result["status"] != "ok"] else 0
+    finally:
+        for path in (jobsPath, resultsPath):
+            if(os.path.exists(path)):
+                os.remove(path)
+        os.rmdir(workDir)
+
+def install_stand_in(folder=ROOT_DIR):
+    ''' Installs the stand-in of 'gimpfu' of the benchmarks folder. '''
+    benchDir = os.path.join(folder, "benchmarks")
+    if(benchDir not in sys.path):
+        sys.path.insert(0, benchDir)
+    import fakegimp
+    sys.modules["gimpfu"] = fakegimp
+    return fakegimp
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options] [job file]")
+    parser.add_option("--gimp", default="gimp", help="GIMP executable [default: %default]")
+    parser.add_option("--plugins", default=ROOT_DIR, help="folder of the plug-in scripts [default: %default]")
+    parser.add_option("--stand-in", dest="standIn", action="store_true", default=False, help="execute the jobs with the stand-in of gimpfu, instead of GIMP")
+    options, args = parser.parse_args()
+    if(len(args) > 1):
+        parser.error("only one job file can be specified")
+    
+    # Read the jobs from the file or from the standard input.
+    if(args and args[0] != "-"):
+        with open(args[0]) as source:
+            jobs = parse_jobs(source)
+    else:
+        jobs = parse_jobs(sys.stdin)
+    
+    if(options.standIn):
+        install_stand_in(options.plugins)
+        return 1 if run_jobs(load_procedures(options.plugins), jobs, sys.stdout) else 0
+    return launch(jobs, sys.stdout, options.gimp, options.plugins)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2013, Jose F. Maldonado
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+#
+#    - Redistributions of source code must retain the above copyright notice, this 
+#    list of conditions and the following disclaimer.
+#    - Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation and/or 
+#    other materials provided with the distribution.
+#    - Neither the name of the author nor the names of its contributors may be used 
+#    to endorse or promote products derived from this software without specific prior 
+#    written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+# SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+# DAMAGE.
+#
+# -------------------------------------------------------------------------------------
+#
+# Row-major iteration over the region of interest of a drawable.
+#
+# GIMP stores the pixels of a drawable in tiles, and the pixel regions return them in
+# rows (all the pixels of a row, then the pixels of the next row). Iterating over the 
+# columns of a buffer ('for x: for y:') reads one pixel of each row before moving to the
+# next column, so every access falls in a different cache line (or a different tile), 
+# and when the region has many rows the lines are evicted before the next column reuses 
+# them. The helpers of this module always walk the region in the order in which it is
+# stored: by rows of tiles (bands), and then by scanlines inside each band.
+#
+# Usage:
+# >>> scan = Scan(roi, layer.bpp, gimp.tile_height())
+# >>> for y1, y2 in scan.bands():
+# >>>     data = bytearray(scan.read(srcRgn, y1, y2))
+# >>>     for y, line in scan.scanlines(data, y1, y2):
+# >>>         process(line)   # 'line' is a memoryview of the pixels of the row 'y'.
+# >>>     scan.write(dstRgn, y1, y2, data)
+
+class Scan(object):
+    ''' Row-major walk over the region of interest of a drawable. '''
+    def __init__(self, roi, pixelSize, bandHeight):
+        ''' Creates the walk.
+        
+        Parameters:
+        roi : Roi The region to walk.
+        pixelSize : int The number of bytes of each pixel.
+        bandHeight : int The number of rows of the bands (normally gimp.tile_height() or a multiple of it).
+        '''
+        self.roi = roi
+        self.pixelSize = pixelSize
+        self.bandHeight = max(1, bandHeight)
+        self.rowSize = roi.width * pixelSize
+    
+    def bands(self):
+        ''' Returns the bands of the region, from top to bottom, as tuples (y1, y2). '''
+        return self.roi.rows(self.bandHeight)
+    
+    def tiles(self, tileWidth, tileHeight):
+        ''' Returns the tiles which intersect the region, as tuples (column, row), in 
+        row-major order (all the tiles of a row of tiles, then the next row).
+        '''
+        cols, rows = self.roi.tile_range(tileWidth, tileHeight)
+        return [(col, row) for row in rows for col in cols]
+    
+    def read(self, rgn, y1, y2):
+        ''' Reads the pixels of a band from a pixel region. '''
+        return rgn[self.roi.x:self.roi.x2, y1:y2]
+    
+    def write(self, rgn, y1, y2, data):
+        ''' Writes the pixels of a band (a string, a bytearray or a memoryview) in a pixel
+        region. The pixel regions only accept strings, so a bytearray or a memoryview is
+        copied once.
+        '''
+        if(isinstance(data, memoryview)):
+            data = data.tobytes()
+        rgn[self.roi.x:self.roi.x2, y1:y2] = bytes(data)
+    
+    def scanlines(self, data, y1, y2):
+        ''' Splits a band in scanlines, without copying it.
+        
+        Parameters:
+        data : bytearray The pixels of the band (as returned by read()), which can be followed by unused bytes.
+        y1 : int The first row of the band.
+        y2 : int The row after the last row of the band.
+        
+        Returns:
+        generator The tuples (y, line), where 'line' is a contiguous memoryview of the pixels of the row 'y'.
+        '''
+        view = memoryview(data)
+        for y in range(y1, y2):
+            start = (y - y1) * self.rowSize
+            yield y, view[start : start + self.rowSize]
+    
+    def progress(self, y):
+        ''' Returns the fraction of the region processed before the row 'y'. '''
+        return float(y - self.roi.y) / float(self.roi.height)
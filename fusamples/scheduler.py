@@ -0,0 +1,199 @@
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2013, Jose F. Maldonado
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+#
+#    - Redistributions of source code must retain the above copyright notice, this 
+#    list of conditions and the following disclaimer.
+#    - Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation and/or 
+#    other materials provided with the distribution.
+#    - Neither the name of the author nor the names of its contributors may be used 
+#    to endorse or promote products derived from this software without specific prior 
+#    written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+# SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+# DAMAGE.
+#
+# -------------------------------------------------------------------------------------
+#
+# Parallel processing of the tiles of a layer.
+#
+# The pixels of the tiles are read and written by the main process (which is the only
+# one connected with GIMP), while the pixel operations are executed by a pool of worker
+# processes. The tiles are sent to the workers through a fixed number of shared memory
+# buffers (the queue depth), and the results are written back in the same order in
+# which the tiles were read.
+
+import ctypes
+import multiprocessing
+import signal
+import sys
+from collections import deque
+from multiprocessing.sharedctypes import RawArray
+
+# Shared buffers and function of the worker processes (set by _init_worker).
+_slots = None
+_function = None
+
+def _init_worker(slots, function):
+    ''' Initializes a worker process. '''
+    global _slots, _function
+    
+    # The worker inherits the signal handlers of the plug-in (see fusamples/progress.py),
+    # which would prevent terminating it. The plug-in handles the cancellations, so the
+    # worker ignores SIGINT and is killed by SIGTERM.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    _slots = slots
+    _function = function
+
+def _run_job(slot, length, pixelSize):
+    ''' Applies the function of the worker over the pixels stored in a shared buffer. '''
+    buf = _slots[slot]
+    result = _function(ctypes.string_at(ctypes.addressof(buf), length), pixelSize)
+    ctypes.memmove(buf, result, length)
+
+def tile_jobs(width, height, tileWidth, tileHeight, tilesPerJob=1, x=0, y=0):
+    ''' Splits a rectangle in jobs, each one made by consecutive tiles of the same row of 
+    tiles (clipped to the rectangle). The jobs are generated in row-major order.
+    
+    Parameters:
+    width : int The width of the rectangle.
+    height : int The height of the rectangle.
+    tileWidth : int The width of the tiles.
+    tileHeight : int The height of the tiles.
+    tilesPerJob : int The number of tiles of each job.
+    x : int The left side of the rectangle.
+    y : int The top side of the rectangle.
+    
+    Returns:
+    list A list of tuples (x1, y1, x2, y2).
+    '''
+    jobs = []
+    jobWidth = tileWidth * max(1, tilesPerJob)
+    for ty in range(y - y % tileHeight, y + height, tileHeight):
+        for tx in range(x - x % tileWidth, x + width, jobWidth):
+            jobs.append((max(tx, x), max(ty, y), min(tx + jobWidth, x + width), min(ty + tileHeight, y + height)))
+    return jobs
+
+class TileScheduler(object):
+    ''' Applies a pixel function over the tiles of a layer, using a pool of processes.
+    
+    The function receives a string with the pixels of a tile and the size of the pixels,
+    and must return a string of the same length. It must be defined at the top level of
+    a module, so the worker processes can import it.
+    '''
+    def __init__(self, function, workers=0, queueDepth=0, tilesPerJob=1):
+        ''' Creates the scheduler.
+        
+        Parameters:
+        function : function The pixel function, for example fusamples.pixels.discolour_buffer.
+        workers : int The number of worker processes (0 for one per CPU, 1 for processing the tiles in the main process).
+        queueDepth : int The maximum number of tiles being processed at the same time (0 for twice the number of workers).
+        tilesPerJob : int The number of tiles sent to a worker in each job.
+        '''
+        if(workers <= 0):
+            workers = multiprocessing.cpu_count()
+        
+        # On Windows the worker processes execute the script of the plug-in again, which
+        # fails outside of GIMP, so the tiles are processed in the main process.
+        if(sys.platform == "win32"):
+            workers = 1
+        
+        self.function = function
+        self.workers = workers
+        self.queueDepth = queueDepth if queueDepth > 0 else 2 * workers
+        self.tilesPerJob = max(1, tilesPerJob)
+    
+    def run(self, srcRgn, dstRgn, width, height, pixelSize, tileWidth, tileHeight, progress=None, x=0, y=0):
+        ''' Processes all the tiles of a rectangle.
+        
+        Parameters:
+        srcRgn : PixelRgn The pixel region from which the tiles are read.
+        dstRgn : PixelRgn The pixel region in which the results are written.
+        width : int The width of the rectangle.
+        height : int The height of the rectangle.
+        pixelSize : int The number of bytes of each pixel.
+        tileWidth : int The width of the tiles (normally gimp.tile_width()).
+        tileHeight : int The height of the tiles (normally gimp.tile_height()).
+        progress : function A function which receives the fraction of completed tiles (for example Progress.update(), which can raise Cancelled).
+        x : int The left side of the rectangle.
+        y : int The top side of the rectangle.
+        '''
+        self.run_regions([(srcRgn, dstRgn, x, y, width, height, pixelSize)], tileWidth, tileHeight, progress)
+    
+    def run_regions(self, regions, tileWidth, tileHeight, progress=None):
+        ''' Processes all the tiles of several rectangles (for example, of several layers),
+        sharing the pool of workers, so the tiles of a rectangle are processed while the 
+        tiles of the next one are being read.
+        
+        Parameters:
+        regions : list The rectangles, as tuples (srcRgn, dstRgn, x, y, width, height, pixelSize).
+        tileWidth : int The width of the tiles (normally gimp.tile_width()).
+        tileHeight : int The height of the tiles (normally gimp.tile_height()).
+        progress : function A function which receives the fraction of completed tiles of all the rectangles.
+        '''
+        jobs = []
+        for srcRgn, dstRgn, x, y, width, height, pixelSize in regions:
+            for rect in tile_jobs(width, height, tileWidth, tileHeight, self.tilesPerJob, x, y):
+                jobs.append((srcRgn, dstRgn, pixelSize, rect))
+        if(not jobs):
+            return
+        if(self.workers <= 1):
+            self._run_serial(jobs, progress)
+        else:
+            maxPixelSize = max([region[6] for region in regions])
+            self._run_parallel(jobs, tileWidth * tileHeight * self.tilesPerJob * maxPixelSize, progress)
+    
+    def _run_serial(self, jobs, progress):
+        ''' Processes the jobs in the main process. '''
+        for done, (srcRgn, dstRgn, pixelSize, (x1, y1, x2, y2)) in enumerate(jobs):
+            dstRgn[x1:x2, y1:y2] = self.function(srcRgn[x1:x2, y1:y2], pixelSize)
+            if(progress is not None):
+                progress(float(done + 1) / len(jobs))
+    
+    def _run_parallel(self, jobs, slotSize, progress):
+        ''' Processes the jobs in the pool of workers. '''
+        slots = [RawArray(ctypes.c_ubyte, slotSize) for i in range(self.queueDepth)]
+        freeSlots = deque(range(self.queueDepth))
+        pending = deque()
+        pool = multiprocessing.Pool(self.workers, _init_worker, (slots, self.function))
+        try:
+            nextJob = 0
+            done = 0
+            while(done < len(jobs)):
+                # Read tiles and send them to the workers while there are free buffers.
+                while(freeSlots and nextJob < len(jobs)):
+                    srcRgn, dstRgn, pixelSize, (x1, y1, x2, y2) = jobs[nextJob]
+                    data = srcRgn[x1:x2, y1:y2]
+                    slot = freeSlots.popleft()
+                    ctypes.memmove(slots[slot], data, len(data))
+                    pending.append((jobs[nextJob], slot, len(data), pool.apply_async(_run_job, (slot, len(data), pixelSize))))
+                    nextJob += 1
+                
+                # Wait for the oldest job and write his result.
+                (srcRgn, dstRgn, pixelSize, (x1, y1, x2, y2)), slot, length, result = pending.popleft()
+                result.get()
+                dstRgn[x1:x2, y1:y2] = ctypes.string_at(ctypes.addressof(slots[slot]), length)
+                freeSlots.append(slot)
+                done += 1
+                if(progress is not None):
+                    progress(float(done) / len(jobs))
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
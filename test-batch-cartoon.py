@@ -28,11 +28,13 @@
 # ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
 # DAMAGE.
 
-import os
 from gimpfu import *
+from fusamples.batch import run_batch
+from fusamples.instrument import error, instrumented
 
-def batch_cartoon(img, layer, inputFolder, outputFolder, maskRadius, blackPct):
-    ''' Apply the cartoon filter to the PNG and JPEG images of a folder.
+@instrumented
+def batch_cartoon(img, layer, inputFolder, outputFolder, maskRadius, blackPct, workers, memoryBudget, incremental, pruneOutputs, recursive, include, exclude, shard, maxSize, cacheFolder, cacheSize):
+    ''' Apply the cartoon filter to the images of a folder.
     
     Parameters:
     img : image The current image (unused).
@@ -41,40 +43,48 @@ def batch_cartoon(img, layer, inputFolder, outputFolder, maskRadius, blackPct):
     outputFolder : string The folder in which save the modified images.
     maskRadius : float Cartoon mask radius (radius of pixel neighborhood).
     blackPct : float Percentage of darkened pixels to set to black (0.0 - 1.0).
+    workers : int The maximum number of images being processed at the same time.
+    memoryBudget : int The maximum memory (in MB) used by the open images.
+    incremental : bool Indicates if the files that have not changed since the previous batch must be skipped.
+    pruneOutputs : bool Indicates if the outputs of the files that no longer exist must be removed (only in incremental mode).
+    recursive : bool Indicates if the subfolders must be processed (the tree of folders is mirrored in the output folder).
+    include : string The glob patterns of the files to process, separated by commas (empty for all the files).
+    exclude : string The glob patterns of the files and folders to ignore, separated by commas.
+    shard : string The part of the files to process, as "k/N" (the k-th of N parts, chosen by the hash of the path of each file), or empty for all the files.
+    maxSize : int The maximum width and height of the images, which are scaled down right after being opened (0 for keeping their size).
+    cacheFolder : string The folder in which the decoded pixels of the images are cached, so the images opened again are not decoded (empty for no cache).
+    cacheSize : int The maximum size (in MB) of the cache of decoded pixels.
     '''
-    # Iterate the folder
-    for file in os.listdir(inputFolder):
-        try:
-            # Build the full file paths.
-            inputPath = inputFolder + "\\" + file
-            outputPath = outputFolder + "\\" + file
-        
-            # Open the file if is a JPEG or PNG image.
-            image = None
-            if(file.lower().endswith(('.png'))):
-                image = pdb.file_png_load(inputPath, inputPath)
-            if(file.lower().endswith(('.jpeg', '.jpg'))):
-                image = pdb.file_jpeg_load(inputPath, inputPath)
-                
-            # Verify if the file is an image.
-            if(image != None):
-                # Invert the image.
-                if(len(image.layers) > 0):
-                    layer = image.layers[0]
-                    pdb.plug_in_cartoon(image, layer, maskRadius, blackPct)
-                    
-                    # Save the image.
-                    if(file.lower().endswith(('.png'))):
-                        pdb.file_png_save(image, image.layers[0], outputPath, outputPath, 0, 9, 0, 0, 0, 0, 0)
-                    if(file.lower().endswith(('.jpeg', '.jpg'))):
-                        pdb.file_jpeg_save(image, layer, outputPath, outputPath, 0.9, 0, 0, 0, "Creating with GIMP", 0, 0, 0, 0)
-        except Exception as err:
-            gimp.message("Unexpected error: " + str(err))
+    def cartoon(item):
+        ''' Applies the cartoon filter to the first layer of an image. '''
+        pdb.plug_in_cartoon(item.image, item.image.layers[0], maskRadius, blackPct)
+    
+    try:
+        params = { "filter": "cartoon", "maskRadius": maskRadius, "blackPct": blackPct }
+        run_batch(inputFolder, outputFolder, cartoon, params, workers, memoryBudget, incremental, pruneOutputs, recursive, include, exclude, shard, maxSize, cacheFolder, cacheSize)
+    except Exception as err:
+        error(err)
+        gimp.message("Unexpected error: " + str(err))
+
+def batch_cartoon_folder(img, layer, inputFolder, outputFolder, maskRadius, blackPct):
+    ''' Apply the cartoon filter to the images of a folder, with the default options of 
+    the batch. This is the procedure of the original sample, which keeps his signature 
+    so the scripts that call it do not break.
+    
+    Parameters:
+    img : image The current image (unused).
+    layer : layer The layer of the image that is selected (unused).
+    inputFolder : string The folder of the images that must be modified.
+    outputFolder : string The folder in which save the modified images.
+    maskRadius : float Cartoon mask radius (radius of pixel neighborhood).
+    blackPct : float Percentage of darkened pixels to set to black (0.0 - 1.0).
+    '''
+    batch_cartoon(img, layer, inputFolder, outputFolder, maskRadius, blackPct, 2, 1024, False, False, False, "", "", "", 0, "", 1024)
 
 register(
     "python_fu_test_batch_cartoon",
     "Batch cartoon",
-    "Apply the cartoon filter to the PNG and JPEG images of a folder.",
+    "Apply the cartoon filter to the images of a folder.",
     "JFM",
     "Open source (BSD 3-clause license)",
     "2013",
@@ -87,6 +97,35 @@ register(
         (PF_SLIDER, "blackPct", "Percentage of dark" , 0.2, (0.0,1.0,0.01))
     ],
     [],
+    batch_cartoon_folder)
+
+register(
+    "python_fu_test_batch_cartoon_options",
+    "Batch cartoon (options)",
+    "Apply the cartoon filter to the images of a folder.",
+    "JFM",
+    "Open source (BSD 3-clause license)",
+    "2013",
+    "<Image>/Filters/Test/Batch cartoon (options)",
+    "*",
+    [
+        (PF_DIRNAME, "inputFolder", "Input directory", ""),
+        (PF_DIRNAME, "outputFolder", "Output directory", ""),
+        (PF_SLIDER, "maskRadius", "Mask radius", 7, (1,50,1)),
+        (PF_SLIDER, "blackPct", "Percentage of dark" , 0.2, (0.0,1.0,0.01)),
+        (PF_SPINNER, "workers", "Workers", 2, (1, 16, 1)),
+        (PF_SPINNER, "memoryBudget", "Memory budget (MB)", 1024, (16, 65536, 16)),
+        (PF_TOGGLE, "incremental", "Skip unchanged files", False),
+        (PF_TOGGLE, "pruneOutputs", "Remove outputs of deleted files", False),
+        (PF_TOGGLE, "recursive", "Include subfolders", False),
+        (PF_STRING, "include", "Include patterns (like *.png,*.jpg)", ""),
+        (PF_STRING, "exclude", "Exclude patterns", ""),
+        (PF_STRING, "shard", "Shard (k/N, empty for all)", ""),
+        (PF_SPINNER, "maxSize", "Maximum size (0 = original size)", 0, (0, 65536, 16)),
+        (PF_STRING, "cacheFolder", "Pixel cache directory (empty = no cache)", ""),
+        (PF_SPINNER, "cacheSize", "Pixel cache size (MB)", 1024, (16, 65536, 16))
+    ],
+    [],
     batch_cartoon)
 
 main()
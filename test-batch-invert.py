@@ -28,11 +28,49 @@
 # ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
 # DAMAGE.
 
-import os
 from gimpfu import *
+from fusamples.batch import run_batch
+from fusamples.instrument import error, instrumented
 
-def batch_invert(img, layer, inputFolder, outputFolder):
-    ''' Inverts the colors of the PNG and JPEG images of a folder.
+def invert(item):
+    ''' Inverts the first layer of an image.
+    
+    Parameters:
+    item : BatchItem The file whose image must be inverted.
+    '''
+    pdb.gimp_invert(item.image.layers[0])
+
+@instrumented
+def batch_invert(img, layer, inputFolder, outputFolder, workers, memoryBudget, incremental, pruneOutputs, recursive, include, exclude, shard, maxSize, cacheFolder, cacheSize):
+    ''' Inverts the colors of the images of a folder.
+    
+    Parameters:
+    img : image The current image (unused).
+    layer : layer The layer of the image that is selected (unused).
+    inputFolder : string The folder of the images that must be inverted.
+    outputFolder : string The folder in which save the inverted images.
+    workers : int The maximum number of images being processed at the same time.
+    memoryBudget : int The maximum memory (in MB) used by the open images.
+    incremental : bool Indicates if the files that have not changed since the previous batch must be skipped.
+    pruneOutputs : bool Indicates if the outputs of the files that no longer exist must be removed (only in incremental mode).
+    recursive : bool Indicates if the subfolders must be processed (the tree of folders is mirrored in the output folder).
+    include : string The glob patterns of the files to process, separated by commas (empty for all the files).
+    exclude : string The glob patterns of the files and folders to ignore, separated by commas.
+    shard : string The part of the files to process, as "k/N" (the k-th of N parts, chosen by the hash of the path of each file), or empty for all the files.
+    maxSize : int The maximum width and height of the images, which are scaled down right after being opened (0 for keeping their size).
+    cacheFolder : string The folder in which the decoded pixels of the images are cached, so the images opened again are not decoded (empty for no cache).
+    cacheSize : int The maximum size (in MB) of the cache of decoded pixels.
+    '''
+    try:
+        run_batch(inputFolder, outputFolder, invert, { "filter": "invert" }, workers, memoryBudget, incremental, pruneOutputs, recursive, include, exclude, shard, maxSize, cacheFolder, cacheSize)
+    except Exception as err:
+        error(err)
+        gimp.message("Unexpected error: " + str(err))
+
+def batch_invert_folder(img, layer, inputFolder, outputFolder):
+    ''' Inverts the colors of the images of a folder, with the default options. This is 
+    the procedure of the original sample, which keeps his signature so the scripts that
+    call it do not break.
     
     Parameters:
     img : image The current image (unused).
@@ -40,39 +78,12 @@ def batch_invert(img, layer, inputFolder, outputFolder):
     inputFolder : string The folder of the images that must be inverted.
     outputFolder : string The folder in which save the inverted images.
     '''
-    # Iterate the folder
-    for file in os.listdir(inputFolder):
-        try:
-            # Build the full file paths.
-            inputPath = inputFolder + "\\" + file
-            outputPath = outputFolder + "\\" + file
-        
-            # Open the file if is a JPEG or PNG image.
-            image = None
-            if(file.lower().endswith(('.png'))):
-                image = pdb.file_png_load(inputPath, inputPath)
-            if(file.lower().endswith(('.jpeg', '.jpg'))):
-                image = pdb.file_jpeg_load(inputPath, inputPath)
-                
-            # Verify if the file is an image.
-            if(image != None):
-                # Invert the image.
-                if(len(image.layers) > 0):
-                    layer = image.layers[0]
-                    pdb.gimp_invert(layer)
-                    
-                    # Save the image.
-                    if(file.lower().endswith(('.png'))):
-                        pdb.file_png_save(image, image.layers[0], outputPath, outputPath, 0, 9, 0, 0, 0, 0, 0)
-                    if(file.lower().endswith(('.jpeg', '.jpg'))):
-                        pdb.file_jpeg_save(image, layer, outputPath, outputPath, 0.9, 0, 0, 0, "Creating with GIMP", 0, 0, 0, 0)
-        except Exception as err:
-            gimp.message("Unexpected error: " + str(err))
+    batch_invert(img, layer, inputFolder, outputFolder, 2, 1024, False, False, False, "", "", "", 0, "", 1024)
 
 register(
     "python_fu_test_batch_invert",
     "Batch invert",
-    "Inverts the colors of the PNG and JPEG images of a folder",
+    "Inverts the colors of the images of a folder",
     "JFM",
     "Open source (BSD 3-clause license)",
     "2013",
@@ -83,6 +94,33 @@ register(
         (PF_DIRNAME, "outputFolder", "Output directory", "")
     ],
     [],
+    batch_invert_folder)
+
+register(
+    "python_fu_test_batch_invert_options",
+    "Batch invert (options)",
+    "Inverts the colors of the images of a folder",
+    "JFM",
+    "Open source (BSD 3-clause license)",
+    "2013",
+    "<Image>/Filters/Test/Batch invert (options)",
+    "*",
+    [
+        (PF_DIRNAME, "inputFolder", "Input directory", ""),
+        (PF_DIRNAME, "outputFolder", "Output directory", ""),
+        (PF_SPINNER, "workers", "Workers", 2, (1, 16, 1)),
+        (PF_SPINNER, "memoryBudget", "Memory budget (MB)", 1024, (16, 65536, 16)),
+        (PF_TOGGLE, "incremental", "Skip unchanged files", False),
+        (PF_TOGGLE, "pruneOutputs", "Remove outputs of deleted files", False),
+        (PF_TOGGLE, "recursive", "Include subfolders", False),
+        (PF_STRING, "include", "Include patterns (like *.png,*.jpg)", ""),
+        (PF_STRING, "exclude", "Exclude patterns", ""),
+        (PF_STRING, "shard", "Shard (k/N, empty for all)", ""),
+        (PF_SPINNER, "maxSize", "Maximum size (0 = original size)", 0, (0, 65536, 16)),
+        (PF_STRING, "cacheFolder", "Pixel cache directory (empty = no cache)", ""),
+        (PF_SPINNER, "cacheSize", "Pixel cache size (MB)", 1024, (16, 65536, 16))
+    ],
+    [],
     batch_invert)
 
 main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2013, Jose F. Maldonado
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+#
+#    - Redistributions of source code must retain the above copyright notice, this 
+#    list of conditions and the following disclaimer.
+#    - Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation and/or 
+#    other materials provided with the distribution.
+#    - Neither the name of the author nor the names of its contributors may be used 
+#    to endorse or promote products derived from this software without specific prior 
+#    written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+# SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+# DAMAGE.
+#
+# -------------------------------------------------------------------------------------
+#
+# This file is a basic example of a Python plug-in for GIMP.
+#
+# It can be executed by selecting the menu option: 'Filters/Test/Batch pyramid'
+# or by writing the following lines in the Python console (that can be opened with the
+# menu option 'Filters/Python-Fu/Console'):
+# >>> gimp.pdb.python_fu_test_batch_pyramid(None, None, "/in", "/out", "2048,1024,512,256", 2, 1024, False, "", "", "")
+
+import os
+from gimpfu import *
+from fusamples.batch import make_output_folder, run_batch
+from fusamples.instrument import error, instrumented
+from fusamples.resize import parse_sizes, pyramid
+
+def level_path(item, size):
+    ''' Returns the path of the file of a level of the pyramid (like 'photo-512.png'). '''
+    root, ext = os.path.splitext(item.outputPath)
+    return root + "-" + str(size) + ext
+
+def save_level(item, image, size):
+    ''' Saves a level of the pyramid in the same format than the original file.
+    
+    Parameters:
+    item : BatchItem The file whose pyramid is being generated.
+    image : image The image scaled to the size of the level.
+    size : int The size of the level.
+    '''
+    if(item.format.prepare is None):
+        item.format.save(image, image.layers[0], level_path(item, size))
+    else:
+        # The format modifies the image before saving it (for example, GIF converts it to
+        # indexed mode), so a copy is saved and the next levels are scaled from the original.
+        copy = pdb.gimp_image_duplicate(image)
+        try:
+            item.format.save(copy, copy.layers[0], level_path(item, size))
+        finally:
+            pdb.gimp_image_delete(copy)
+
+@instrumented
+def batch_pyramid(img, layer, inputFolder, outputFolder, sizes, workers, memoryBudget, recursive, include, exclude, shard):
+    ''' Generates thumbnails of several sizes for the images of a folder. Each image is 
+    opened once, and each size is obtained by scaling down the previous one (for example, 
+    the thumbnail of 512 pixels is obtained from the one of 1024 pixels), so the smaller
+    sizes are cheap to generate.
+    
+    Parameters:
+    img : image The current image (unused).
+    layer : layer The layer of the image that is selected (unused).
+    inputFolder : string The folder of the images.
+    outputFolder : string The folder in which save the thumbnails (named like the original file plus the size, as 'photo-512.png').
+    sizes : string The maximum width and height of each thumbnail, separated by commas (the images are never enlarged).
+    workers : int The maximum number of images being processed at the same time.
+    memoryBudget : int The maximum memory (in MB) used by the open images.
+    recursive : bool Indicates if the subfolders must be processed (the tree of folders is mirrored in the output folder).
+    include : string The glob patterns of the files to process, separated by commas (empty for all the files).
+    exclude : string The glob patterns of the files and folders to ignore, separated by commas.
+    shard : string The part of the files to process, as "k/N" (the k-th of N parts, chosen by the hash of the path of each file), or empty for all the files.
+    '''
+    try:
+        sizeList = parse_sizes(sizes)
+        
+        def encode(item):
+            ''' Scales an image to each size, and saves the thumbnails. '''
+            make_output_folder(item)
+            pyramid(item.image, sizeList, lambda image, size: save_level(item, image, size))
+        
+        # The thumbnails are saved by the encode stage, without filter.
+        run_batch(inputFolder, outputFolder, None, { "filter": "pyramid" }, workers, memoryBudget, recursive=recursive, include=include, exclude=exclude, shard=shard, encode=encode)
+    except Exception as err:
+        error(err)
+        gimp.message("Unexpected error: " + str(err))
+
+register(
+    "python_fu_test_batch_pyramid",
+    "Batch pyramid",
+    "Generates thumbnails of several sizes for the images of a folder",
+    "JFM",
+    "Open source (BSD 3-clause license)",
+    "2013",
+    "<Image>/Filters/Test/Batch pyramid",
+    "*",
+    [
+        (PF_DIRNAME, "inputFolder", "Input directory", ""),
+        (PF_DIRNAME, "outputFolder", "Output directory", ""),
+        (PF_STRING, "sizes", "Sizes (separated by commas)", "2048,1024,512,256"),
+        (PF_SPINNER, "workers", "Workers", 2, (1, 16, 1)),
+        (PF_SPINNER, "memoryBudget", "Memory budget (MB)", 1024, (16, 65536, 16)),
+        (PF_TOGGLE, "recursive", "Include subfolders", False),
+        (PF_STRING, "include", "Include patterns (like *.png,*.jpg)", ""),
+        (PF_STRING, "exclude", "Exclude patterns", ""),
+        (PF_STRING, "shard", "Shard (k/N, empty for all)", "")
+    ],
+    [],
+    batch_pyramid)
+
+main()
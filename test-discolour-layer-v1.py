@@ -40,7 +40,13 @@
 # >>> gimp.pdb.python_fu_test_discolour_layer_v1(image, layer)
 
 from gimpfu import *
+from fusamples.instrument import count, error, instrumented
+from fusamples.pixels import has_8_bits
+from fusamples.progress import Cancelled, Progress
+from fusamples.roi import blend_pixel, get_roi
+from fusamples.scan import Scan
 
+@instrumented
 def discolour_layer_v1(img, layer) :
     ''' Converts a layer to gray scale, without modifying his type (RGB or RGBA).
     Note that this implementation is very inefficient, since it do not make use 
@@ -52,41 +58,75 @@ def discolour_layer_v1(img, layer) :
     layer : layer The layer of the image that is selected.
     '''
     # Indicates that the process has started.
-    gimp.progress_init("Discolouring " + layer.name + "...")
+    progress = Progress("Discolouring " + layer.name + "...")
 
     # Set up an undo group, so the operation will be undone in one step.
     pdb.gimp_image_undo_group_start(img)
 
-    # Iterate over all the pixels and convert them to gray.
+    # Iterate over the pixels of the selection bounds and convert them to gray.
     try:
-        for x in range(layer.width):
-            # Update the progress bar.
-            gimp.progress_update(float(x) / float(layer.width))
-
-            for y in range(layer.height):
-                # Get the pixel and verify that is an RGB value.
-                pixel = layer.get_pixel(x,y)
-            
-                if(len(pixel) >= 3):
-                    # Calculate his gray tone.
-                    sum = pixel[0] + pixel[1] + pixel[2]
-                    gray = int(sum/3)
-                
-                    # Create a new tuple representing the new color.
-                    newColor = (gray,gray,gray) + pixel[3:]
-                    layer.set_pixel(x,y, newColor)
+        # This version reads the channels as bytes, so it only supports 8 bits per channel.
+        if(not has_8_bits(layer)):
+            raise ValueError("only the images with 8 bits per channel are supported")
         
-        # Update the layer.
-        layer.update(0, 0, layer.width, layer.height)
+        roi = get_roi(img, layer)
+        if(roi is not None):
+            # Count the pixels to process.
+            count("pixels", roi.width * roi.height)
+            
+            # Get the values of the selection mask.
+            mask = roi.mask(roi.x, roi.y, roi.x2, roi.y2)
+            if(mask is not None):
+                mask = bytearray(mask)
+            
+            # Keep a copy of the original pixels of the region (the changes made with 
+            # set_pixel() are not saved in the undo history, so they must be reverted 
+            # by hand if the operation is cancelled).
+            original = layer.get_pixel_rgn(roi.x, roi.y, roi.width, roi.height, False, False)[roi.x:roi.x2, roi.y:roi.y2]
+            
+            # Iterate over the rows (in the order in which the pixels are stored), and 
+            # over the pixels of each row.
+            scan = Scan(roi, layer.bpp, gimp.tile_height())
+            for y1, y2 in scan.bands():
+                for y in range(y1, y2):
+                    # Update the progress bar.
+                    progress.update(scan.progress(y))
+                    
+                    for x in range(roi.x, roi.x2):
+                        # Get the pixel and verify that is an RGB value.
+                        pixel = layer.get_pixel(x,y)
+                    
+                        if(len(pixel) >= 3):
+                            # Calculate his gray tone.
+                            sum = pixel[0] + pixel[1] + pixel[2]
+                            gray = int(sum/3)
+                        
+                            # Create a new tuple representing the new color.
+                            newColor = (gray,gray,gray) + pixel[3:]
+                            
+                            # Blend the new color with the pixel at the edges of the selection.
+                            if(mask is not None):
+                                newColor = blend_pixel(newColor, pixel, mask[(y - roi.y) * roi.width + (x - roi.x)])
+                            layer.set_pixel(x,y, newColor)
+            
+            # Update the layer.
+            layer.update(roi.x, roi.y, roi.width, roi.height)
 
+    except Cancelled:
+        # Restore the original pixels, writing the copy of the region at once.
+        rgn = layer.get_pixel_rgn(roi.x, roi.y, roi.width, roi.height, True, False)
+        rgn[roi.x:roi.x2, roi.y:roi.y2] = original
+        layer.flush()
+        layer.update(roi.x, roi.y, roi.width, roi.height)
     except Exception as err:
+        error(err)
         gimp.message("Unexpected error: " + str(err))
     
     # Close the undo group.
     pdb.gimp_image_undo_group_end(img)
     
     # End progress.
-    pdb.gimp_progress_end()
+    progress.end()
 
 register(
     "python_fu_test_discolour_layer_v1",
@@ -38,11 +38,21 @@
 # >>> image = gimp.image_list()[0]
 # >>> layer = image.layers[0]
 # >>> gimp.pdb.python_fu_test_discolour_layer_v2(image, layer)
+#
+# The option of this version (write in place) is available in the menu option
+# 'Filters/Test/Discolour layer v2 (options)', or by writing:
+# >>> gimp.pdb.python_fu_test_discolour_layer_v2_options(image, layer, True)
 
 from gimpfu import *
 from array import array
+from fusamples.instrument import count, error, instrumented
+from fusamples.pixels import has_8_bits
+from fusamples.progress import Cancelled, Progress
+from fusamples.roi import blend, get_roi
+from fusamples.scan import Scan
 
-def discolour_layer_v2(img, layer) :
+@instrumented
+def discolour_layer_v2(img, layer, inPlace) :
     ''' Converts a layer to gray scale, without modifying his type (RGB or RGBA).
     Note that this implementation is very inefficient, since it do  not make use 
     of tiles. 
@@ -50,70 +60,117 @@ def discolour_layer_v2(img, layer) :
     Parameters:
     img : image The current image.
     layer : layer The layer of the image that is selected.
+    inPlace : bool Indicates if the results must be written in the shadow tiles of the layer, instead of in a new layer.
     '''
+    # This version reads the channels as bytes, so it only supports 8 bits per channel.
+    if(not has_8_bits(layer)):
+        gimp.message("Unexpected error: only the images with 8 bits per channel are supported")
+        return
+    
     # Indicates that the process has started.
-    gimp.progress_init("Discolouring " + layer.name + "...")
+    progress = Progress("Discolouring " + layer.name + "...")
 
     # Set up an undo group, so the operation will be undone in one step.
     pdb.gimp_image_undo_group_start(img)
 
-    # Get the layer position.
-    pos = 0;
-    for i in range(len(img.layers)):
-        if(img.layers[i] == layer):
-            pos = i
-    
-    # Create a new layer to save the results (otherwise is not possible to undo the operation).
-    newLayer = gimp.Layer(img, layer.name + " temp", layer.width, layer.height, layer.type, layer.opacity, layer.mode)
-    img.add_layer(newLayer, pos)
-    layerName = layer.name
+    # Get the region to process (the part of the layer inside the selection bounds).
+    roi = get_roi(img, layer)
+    if(roi is None):
+        pdb.gimp_image_undo_group_end(img)
+        progress.end()
+        return
     
-    # Clear the new layer.
-    pdb.gimp_edit_clear(newLayer)
-    newLayer.flush()
+    # Count the pixels to process.
+    count("pixels", roi.width * roi.height)
+
+    # Get the layer in which the results are saved. In place, the results are written in 
+    # the shadow tiles of the layer, and merge_shadow() saves them in the undo history and
+    # blends them with the original pixels at the edges of the selection.
+    dstLayer = layer
+    if(not inPlace):
+        # Get the layer position.
+        pos = 0;
+        for i in range(len(img.layers)):
+            if(img.layers[i] == layer):
+                pos = i
+        
+        # Create a copy of the layer to save the results (otherwise is not possible to undo the 
+        # operation), so the pixels outside of the selection keep their values.
+        dstLayer = layer.copy()
+        dstLayer.name = layer.name + " temp"
+        img.add_layer(dstLayer, pos)
+        layerName = layer.name
     
     # Convert the pixels to gray scale.
     try:
-        # Get the pixel regions.
-        srcRgn = layer.get_pixel_rgn(0, 0, layer.width, layer.height, False, False)
-        dstRgn = newLayer.get_pixel_rgn(0, 0, layer.width, layer.height, True, False)
+        # Get the pixel regions, and the selection mask of the region to process (which is
+        # not needed in place).
+        srcRgn = layer.get_pixel_rgn(roi.x, roi.y, roi.width, roi.height, False, False)
+        dstRgn = dstLayer.get_pixel_rgn(roi.x, roi.y, roi.width, roi.height, True, inPlace)
+        mask = None if inPlace else roi.mask(roi.x, roi.y, roi.x2, roi.y2)
         
-        for x in range(layer.width):
-            # Update the progress bar.
-            gimp.progress_update(float(x) / float(layer.width))
-
-            for y in range(layer.height):
-                # Get the pixel and calculate his gray tone.
-                pixel = srcRgn[x,y]
-                gray = (ord(pixel[0]) + ord(pixel[1]) + ord(pixel[2]))/3
-                res = chr(gray) + chr(gray) + chr(gray)
-                        
-                # If the image has an alpha channel (or any other channel) copy his values.
-                if(len(pixel) > 3):
-                    for k in range(len(pixel)-3):
-                        res += pixel[k+3]
-                                
-                # Save the value in the result layer.
-                dstRgn[x,y] = res
+        # Iterate over the rows (in the order in which the pixels are stored), and over
+        # the pixels of each row.
+        scan = Scan(roi, layer.bpp, gimp.tile_height())
+        for y1, y2 in scan.bands():
+            for y in range(y1, y2):
+                # Update the progress bar.
+                progress.update(scan.progress(y))
+                
+                for x in range(roi.x, roi.x2):
+                    # Get the pixel and calculate his gray tone.
+                    pixel = srcRgn[x,y]
+                    gray = (ord(pixel[0]) + ord(pixel[1]) + ord(pixel[2]))/3
+                    res = chr(gray) + chr(gray) + chr(gray)
+                            
+                    # If the image has an alpha channel (or any other channel) copy his values.
+                    if(len(pixel) > 3):
+                        for k in range(len(pixel)-3):
+                            res += pixel[k+3]
+                    
+                    # Blend the result with the pixel at the edges of the selection.
+                    if(mask is not None):
+                        k = (y - roi.y) * roi.width + (x - roi.x)
+                        res = blend(res, pixel, mask[k:k+1], len(pixel))
+                                    
+                    # Save the value in the result layer.
+                    dstRgn[x,y] = res
         
-        # Update the new layer.
-        newLayer.flush()
-        newLayer.merge_shadow(True)
-        newLayer.update(0, 0, newLayer.width, newLayer.height)
+        # Update the layer.
+        dstLayer.flush()
+        dstLayer.merge_shadow(True)
+        dstLayer.update(roi.x, roi.y, roi.width, roi.height)
         
-        # Remove the old layer.
-        img.remove_layer(layer)
-        
-        # Change the name of the new layer (two layers can not have the same name).
-        newLayer.name = layerName
+        if(not inPlace):
+            # Remove the old layer.
+            img.remove_layer(layer)
+            
+            # Change the name of the new layer (two layers can not have the same name).
+            dstLayer.name = layerName
+    except Cancelled:
+        # Discard the results (the shadow tiles are not merged, and the new layer is removed).
+        if(not inPlace):
+            img.remove_layer(dstLayer)
     except Exception as err:
+        error(err)
         gimp.message("Unexpected error: " + str(err))
     
     # Close the undo group.
     pdb.gimp_image_undo_group_end(img)
     
     # End progress.
-    pdb.gimp_progress_end()
+    progress.end()
+
+def discolour_layer_v2_new_layer(img, layer) :
+    ''' Converts a layer to gray scale in a new layer. This is the procedure of the 
+    original sample, which keeps his signature (without options) so the scripts that 
+    call it do not break.
+    
+    Parameters:
+    img : image The current image.
+    layer : layer The layer of the image that is selected.
+    '''
+    discolour_layer_v2(img, layer, False)
 
 register(
     "python_fu_test_discolour_layer_v2",
@@ -126,6 +183,21 @@ register(
     "RGB, RGB*",
     [],
     [],
+    discolour_layer_v2_new_layer)
+
+register(
+    "python_fu_test_discolour_layer_v2_options",
+    "Discolour layer v2 (options)",
+    "Converts a layer to gray scale. Note that this implementation is very inefficient, since it do not make use of tiles.",
+    "JFM",
+    "Open source (BSD 3-clause license)",
+    "2013",
+    "<Image>/Filters/Test/Discolour layer v2 (options)",
+    "RGB, RGB*",
+    [
+        (PF_TOGGLE, "inPlace", "Write in place (without a new layer)", True)
+    ],
+    [],
     discolour_layer_v2)
 
 main()
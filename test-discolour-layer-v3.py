@@ -38,90 +38,169 @@
 # >>> image = gimp.image_list()[0]
 # >>> layer = image.layers[0]
 # >>> gimp.pdb.python_fu_test_discolour_layer_v3(image, layer)
+#
+# The options of this version (the write in place and the memory budget) are available
+# in the menu option 'Filters/Test/Discolour layer v3 (options)', or by writing:
+# >>> gimp.pdb.python_fu_test_discolour_layer_v3_options(image, layer, True, 0)
 
-from gimpfu import *
 from array import array
+from gimpfu import *
+from fusamples.instrument import count, error, instrumented
+from fusamples.pixels import band_height, pixel_format, to_string
+from fusamples.progress import Cancelled, Progress
+from fusamples.roi import blend, get_roi
+from fusamples.scan import Scan
 
-def discolour_layer_v3(img, layer) :
+@instrumented
+def discolour_layer_v3(img, layer, inPlace, memoryBudget) :
     ''' Converts a layer to gray scale, without modifying his type (RGB or RGBA).
     Note that this implementation is bit more efficient than versions 1 and 2, 
     since it transforms the pixel regions to arrays for operate over the pixels. 
+    The layer can be processed in horizontal bands, so the size of the arrays is
+    limited by a memory budget instead of by the size of the layer.
     
     Parameters:
     img : image The current image.
     layer : layer The layer of the image that is selected.
+    inPlace : bool Indicates if the results must be written in the shadow tiles of the layer, instead of in a new layer.
+    memoryBudget : int The maximum memory (in MB) used by the arrays, or 0 for processing the whole layer at once.
     '''
     # Indicates that the process has started.
-    gimp.progress_init("Discolouring " + layer.name + "...")
+    progress = Progress("Discolouring " + layer.name + "...")
 
     # Set up an undo group, so the operation will be undone in one step.
     pdb.gimp_image_undo_group_start(img)
 
-    # Get the layer position.
-    pos = 0;
-    for i in range(len(img.layers)):
-        if(img.layers[i] == layer):
-            pos = i
+    # Get the region to process (the part of the layer inside the selection bounds).
+    roi = get_roi(img, layer)
+    if(roi is None):
+        pdb.gimp_image_undo_group_end(img)
+        progress.end()
+        return
     
-    # Create a new layer to save the results (otherwise is not possible to undo the operation).
-    newLayer = gimp.Layer(img, layer.name + " temp", layer.width, layer.height, layer.type, layer.opacity, layer.mode)
-    img.add_layer(newLayer, pos)
-    layerName = layer.name
-    
-    # Clear the new layer.
-    pdb.gimp_edit_clear(newLayer)
-    newLayer.flush()
+    # Count the pixels to process.
+    count("pixels", roi.width * roi.height)
+
+    # Get the layer in which the results are saved. In place, the results are written in 
+    # the shadow tiles of the layer, and merge_shadow() saves them in the undo history and
+    # blends them with the original pixels at the edges of the selection.
+    dstLayer = layer
+    if(not inPlace):
+        # Get the layer position.
+        pos = 0;
+        for i in range(len(img.layers)):
+            if(img.layers[i] == layer):
+                pos = i
+        
+        # Create a copy of the layer to save the results (otherwise is not possible to undo the 
+        # operation), so the pixels outside of the selection keep their values.
+        dstLayer = layer.copy()
+        dstLayer.name = layer.name + " temp"
+        img.add_layer(dstLayer, pos)
+        layerName = layer.name
     
     # Convert the pixels to gray scale.
     try:
-        # Get the pixel regions and generate the arrays.
-        srcRgn = layer.get_pixel_rgn(0, 0, layer.width, layer.height, False, False)
-        dstRgn = newLayer.get_pixel_rgn(0, 0, layer.width, layer.height, True, False)
+        # Get the pixel regions of the region to process.
+        srcRgn = layer.get_pixel_rgn(roi.x, roi.y, roi.width, roi.height, False, False)
+        dstRgn = dstLayer.get_pixel_rgn(roi.x, roi.y, roi.width, roi.height, True, inPlace)
+        pixelSize = len(srcRgn[roi.x,roi.y])
+        fmt = pixel_format(layer)
         
-        pixelSize = len(srcRgn[0,0])
-        srcArray = array("B", srcRgn[0:layer.width, 0:layer.height])
-        dstArray = array("B", "\x00" * (layer.width * layer.height * pixelSize))
+        # Calculate the height of the bands in which the region is processed (all the 
+        # region is processed at once if there is no memory budget).
+        bandHeight = roi.height
+        if(memoryBudget > 0):
+            bandHeight = band_height(roi.width * pixelSize, memoryBudget * 1024 * 1024, gimp.tile_height())
         
-        # Iterate over the pixels.
-        for x in range(layer.width):
-            # Update the progress bar.
-            gimp.progress_update(float(x) / float(layer.width))
-
-            for y in range(layer.height):
-                # Get the pixel and calculate his gray value.
-                pos = (x * layer.height + y) * pixelSize
-                gray = (srcArray[pos] + srcArray[pos+1] + srcArray[pos+2])/3
-                
-                # Copy the gray value in the RGB channels.
-                dstArray[pos] = gray
-                dstArray[pos + 1] = gray
-                dstArray[pos + 2] = gray
+        # Generate the arrays, which are reused for all the bands (they are bytearrays, so
+        # they can be refilled in place through memoryviews, without creating new arrays).
+        srcArray = bytearray(min(bandHeight, roi.height) * roi.width * pixelSize)
+        dstArray = bytearray(len(srcArray))
+        srcView = memoryview(srcArray)
+        dstView = memoryview(dstArray)
+        
+        # Iterate over the bands, and over the rows of each band (in the order in which
+        # the pixels are stored).
+        scan = Scan(roi, pixelSize, bandHeight)
+        for y1, y2 in scan.bands():
+            size = (y2 - y1) * scan.rowSize
+            srcView[0:size] = scan.read(srcRgn, y1, y2)
+            
+            # Start from the original pixels, so the alpha channel (or any other channel)
+            # keeps his values.
+            dstView[0:size] = srcView[0:size]
+            
+            for y, line in scan.scanlines(dstArray, y1, y2):
+                # Update the progress bar.
+                progress.update(scan.progress(y))
                 
-                # If the image has an alpha channel (or any other channel) copy his values.
-                if(pixelSize > 3):
-                    dstArray[pos + 3 : pos + pixelSize] = srcArray[pos + 3 : pos + pixelSize]
+                # Get the pixels of the row. With 8 bits per channel the band is modified
+                # directly, otherwise the row is converted to an array of the type of the
+                # channels (which can have 16 or 32 bits or be floats).
+                if(fmt.typecode == "B"):
+                    pixels = dstArray
+                    first = (y - y1) * scan.rowSize
+                else:
+                    pixels = array(fmt.typecode, line.tobytes())
+                    first = 0
                 
-        # Copy the array back to the pixel region.
-        dstRgn[0:layer.width, 0:layer.height] = dstArray.tostring()
+                # Iterate over the pixels of the row.
+                for pos in range(first, first + scan.rowSize // fmt.channelSize, fmt.channels):
+                    # Calculate the gray value of the pixel.
+                    total = pixels[pos] + pixels[pos+1] + pixels[pos+2]
+                    gray = total / 3.0 if fmt.isFloat else total // 3
+                    
+                    # Copy the gray value in the RGB channels.
+                    pixels[pos] = gray
+                    pixels[pos + 1] = gray
+                    pixels[pos + 2] = gray
+                if(pixels is not dstArray):
+                    line[:] = to_string(pixels)
+                    
+            # Blend the results with the original pixels at the edges of the selection (not 
+            # needed in place), and copy them back to the pixel region.
+            mask = None if inPlace else roi.mask(roi.x, y1, roi.x2, y2)
+            if(mask is not None):
+                scan.write(dstRgn, y1, y2, blend(dstView[0:size].tobytes(), srcView[0:size].tobytes(), mask, pixelSize, fmt.typecode))
+            else:
+                scan.write(dstRgn, y1, y2, dstView[0:size])
 
-        # Update the new layer.
-        newLayer.flush()
-        newLayer.merge_shadow(True)
-        newLayer.update(0, 0, newLayer.width, newLayer.height)
+        # Update the layer.
+        dstLayer.flush()
+        dstLayer.merge_shadow(True)
+        dstLayer.update(roi.x, roi.y, roi.width, roi.height)
         
-        # Remove the old layer.
-        img.remove_layer(layer)
-        
-        # Change the name of the new layer (two layers can not have the same name).
-        newLayer.name = layerName
+        if(not inPlace):
+            # Remove the old layer.
+            img.remove_layer(layer)
+            
+            # Change the name of the new layer (two layers can not have the same name).
+            dstLayer.name = layerName
+    except Cancelled:
+        # Discard the results (the shadow tiles are not merged, and the new layer is removed).
+        if(not inPlace):
+            img.remove_layer(dstLayer)
     except Exception as err:
+        error(err)
         gimp.message("Unexpected error: " + str(err))
     
     # Close the undo group.
     pdb.gimp_image_undo_group_end(img)
     
     # End progress.
-    pdb.gimp_progress_end()
+    progress.end()
+
+def discolour_layer_v3_new_layer(img, layer) :
+    ''' Converts a layer to gray scale in a new layer. This is the procedure of the 
+    original sample, which keeps his signature (without options) so the scripts that 
+    call it do not break.
+    
+    Parameters:
+    img : image The current image.
+    layer : layer The layer of the image that is selected.
+    '''
+    discolour_layer_v3(img, layer, False, 0)
 
 register(
     "python_fu_test_discolour_layer_v3",
@@ -134,6 +213,22 @@ register(
     "RGB, RGB*",
     [],
     [],
+    discolour_layer_v3_new_layer)
+
+register(
+    "python_fu_test_discolour_layer_v3_options",
+    "Discolour layer v3 (options)",
+    "Converts a layer to gray scale. This implementation is bit more efficient than versions 1 and 2, since it transforms the pixel regions to arrays for operate over the pixels. ",
+    "JFM",
+    "Open source (BSD 3-clause license)",
+    "2013",
+    "<Image>/Filters/Test/Discolour layer v3 (options)",
+    "RGB, RGB*",
+    [
+        (PF_TOGGLE, "inPlace", "Write in place (without a new layer)", True),
+        (PF_SPINNER, "memoryBudget", "Memory budget in MB (0 = no limit)", 0, (0, 65536, 16))
+    ],
+    [],
     discolour_layer_v3)
 
 main()
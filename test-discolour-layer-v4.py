@@ -38,93 +38,213 @@
 # >>> image = gimp.image_list()[0]
 # >>> layer = image.layers[0]
 # >>> gimp.pdb.python_fu_test_discolour_layer_v4(image, layer)
+#
+# The option of this version (write in place) is available in the menu option
+# 'Filters/Test/Discolour layer v4 (options)', or by writing:
+# >>> gimp.pdb.python_fu_test_discolour_layer_v4_options(image, layer, True)
+#
+# This file also registers a parallel version of the plug-in, which can be executed with
+# the menu option 'Filters/Test/Discolour layer v4 (parallel)' or by writing:
+# >>> gimp.pdb.python_fu_test_discolour_layer_v4_parallel(image, layer, 0, 0, 1)
 
+from functools import partial
 from gimpfu import *
+from fusamples.instrument import count, error, instrumented
+from fusamples.pixels import discolour_buffer, has_8_bits, pixel_format
+from fusamples.progress import Cancelled, Progress
+from fusamples.roi import Roi, blend, get_roi
+from fusamples.scan import Scan
+from fusamples.scheduler import TileScheduler
 
-def discolour_layer_v4(img, layer) :
+@instrumented
+def discolour_layer_v4(img, layer, inPlace) :
     ''' Converts a layer to gray scale, without modifying his type (RGB or RGBA).
     Note that this version is the fastest, since it make use of tiles.
     
     Parameters:
     img : image The current image.
     layer : layer The layer of the image that is selected.
+    inPlace : bool Indicates if the results must be written in the shadow tiles of the layer, instead of in a new layer.
     '''
+    # This version reads the channels as bytes, so it only supports 8 bits per channel.
+    if(not has_8_bits(layer)):
+        gimp.message("Unexpected error: only the images with 8 bits per channel are supported")
+        return
+    
     # Indicates that the process has started.
-    gimp.progress_init("Discolouring " + layer.name + "...")
+    progress = Progress("Discolouring " + layer.name + "...")
 
     # Set up an undo group, so the operation will be undone in one step.
     pdb.gimp_image_undo_group_start(img)
 
-    # Get the layer position.
-    pos = 0;
-    for i in range(len(img.layers)):
-        if(img.layers[i] == layer):
-            pos = i
-    
-    # Create a new layer to save the results (otherwise is not possible to undo the operation).
-    newLayer = gimp.Layer(img, layer.name + " temp", layer.width, layer.height, layer.type, layer.opacity, layer.mode)
-    img.add_layer(newLayer, pos)
-    layerName = layer.name
+    # Get the region to process (the part of the layer inside the selection bounds).
+    roi = get_roi(img, layer)
+    if(roi is None):
+        pdb.gimp_image_undo_group_end(img)
+        progress.end()
+        return
     
-    # Clear the new layer.
-    pdb.gimp_edit_clear(newLayer)
-    newLayer.flush()
+    # Count the pixels to process.
+    count("pixels", roi.width * roi.height)
+
+    # Get the layer in which the results are saved. In place, the results are written in 
+    # the shadow tiles of the layer, and merge_shadow() saves them in the undo history and
+    # blends them with the original pixels at the edges of the selection.
+    dstLayer = layer
+    if(not inPlace):
+        # Get the layer position.
+        pos = 0;
+        for i in range(len(img.layers)):
+            if(img.layers[i] == layer):
+                pos = i
+        
+        # Create a copy of the layer to save the results (otherwise is not possible to undo the 
+        # operation), so the pixels outside of the selection keep their values.
+        dstLayer = layer.copy()
+        dstLayer.name = layer.name + " temp"
+        img.add_layer(dstLayer, pos)
+        layerName = layer.name
     
     # Convert the pixels to gray scale.
     try:
-        # Calculate the number of tiles.
-        tn = int(layer.width / gimp.tile_width())
-        if (layer.width % gimp.tile_width() > 0):
-            tn += 1
-        tm = int(layer.height / gimp.tile_height())
-        if (layer.height % gimp.tile_height() > 0):
-            tm += 1
-
+        # Get the tiles which intersect the region, in the order in which they are stored
+        # (all the tiles of a row of tiles, then the next row).
+        tw = gimp.tile_width()
+        th = gimp.tile_height()
+        scan = Scan(roi, layer.bpp, th)
+        tiles = scan.tiles(tw, th)
         
-        # Iterate over the tiles.
-        for i in range(tn):
-            for j in range(tm):
-                # Update the progress bar.
-                gimp.progress_update(float(i*tm + j) / float(tn*tm))
-        
-                # Get the tiles.
-                srcTile = layer.get_tile(False, j, i)
-                dstTile = newLayer.get_tile(False, j, i)
+        # Get the pixel regions, through which each tile is read and written at once.
+        srcRgn = layer.get_pixel_rgn(roi.x, roi.y, roi.width, roi.height, False, False)
+        dstRgn = dstLayer.get_pixel_rgn(roi.x, roi.y, roi.width, roi.height, True, inPlace)
+        pixelSize = layer.bpp
         
-                # Iterate over the pixels of each tile.
-                for x in range(srcTile.ewidth):
-                    for y in range(srcTile.eheight):
-                        # Get the pixel and calculate his gray value.
-                        pixel = srcTile[x,y]
-                        gray = (ord(pixel[0]) + ord(pixel[1]) + ord(pixel[2]))/3
-                        res = chr(gray) + chr(gray) + chr(gray)
-                        
-                        # If the image has an alpha channel (or any other channel) copy his values.
-                        if(len(pixel) > 3):
-                            for k in range(len(pixel)-3):
-                                res += pixel[k+3]
-                                
-                        # Save the value in the result layer.
-                        dstTile[x,y] = res
-        
-        # Update the new layer.
-        newLayer.flush()
-        newLayer.merge_shadow(True)
-        newLayer.update(0, 0, newLayer.width, newLayer.height)
+        # Iterate over the tiles.
+        for n, (i, j) in enumerate(tiles):
+            # Update the progress bar.
+            progress.update(float(n) / float(len(tiles)))
+            
+            # Get the part of the tile inside the region (in coordinates of the layer), and
+            # his selection mask (which is not needed in place).
+            x1 = max(roi.x, i*tw)
+            x2 = min(roi.x2, (i + 1)*tw)
+            y1 = max(roi.y, j*th)
+            y2 = min(roi.y2, (j + 1)*th)
+            part = Scan(Roi(layer, x1, y1, x2 - x1, y2 - y1), pixelSize, th)
+            mask = None if inPlace else roi.mask(x1, y1, x2, y2)
+            
+            # Read the pixels of the tile, and iterate over his rows (the channels are 
+            # bytes, so each row is modified directly in the buffer of the tile).
+            original = part.read(srcRgn, y1, y2)
+            data = bytearray(original)
+            for y, line in part.scanlines(data, y1, y2):
+                first = (y - y1) * part.rowSize
+                for pos in range(first, first + part.rowSize, pixelSize):
+                    # Calculate the gray value of the pixel, and copy it in the RGB 
+                    # channels (the alpha channel, or any other channel, is not modified).
+                    gray = (data[pos] + data[pos+1] + data[pos+2]) // 3
+                    data[pos] = gray
+                    data[pos + 1] = gray
+                    data[pos + 2] = gray
+            
+            # Blend the results with the original pixels at the edges of the selection, and
+            # write the tile at once.
+            if(mask is not None):
+                data = blend(bytes(data), original, mask, pixelSize)
+            part.write(dstRgn, y1, y2, data)
         
-        # Remove the old layer.
-        img.remove_layer(layer)
+        # Update the layer.
+        dstLayer.flush()
+        dstLayer.merge_shadow(True)
+        dstLayer.update(roi.x, roi.y, roi.width, roi.height)
         
-        # Change the name of the new layer (two layers can not have the same name).
-        newLayer.name = layerName
+        if(not inPlace):
+            # Remove the old layer.
+            img.remove_layer(layer)
+            
+            # Change the name of the new layer (two layers can not have the same name).
+            dstLayer.name = layerName
+    except Cancelled:
+        # Discard the results (the shadow tiles are not merged, and the new layer is removed).
+        if(not inPlace):
+            img.remove_layer(dstLayer)
     except Exception as err:
+        error(err)
         gimp.message("Unexpected error: " + str(err))
     
     # Close the undo group.
     pdb.gimp_image_undo_group_end(img)
     
     # End progress.
-    pdb.gimp_progress_end()
+    progress.end()
+
+@instrumented
+def discolour_layer_v4_parallel(img, layer, workers, queueDepth, tilesPerJob) :
+    ''' Converts a layer to gray scale, without modifying his type (RGB or RGBA).
+    This version reads the tiles in the main process, but converts them in a pool
+    of worker processes, so all the CPUs can be used. The channels can have 8, 16 or
+    32 bits, or be floats.
+    
+    Parameters:
+    img : image The current image.
+    layer : layer The layer of the image that is selected.
+    workers : int The number of worker processes (0 for one per CPU).
+    queueDepth : int The maximum number of jobs being processed at the same time (0 for twice the number of workers).
+    tilesPerJob : int The number of tiles sent to a worker in each job.
+    '''
+    # Indicates that the process has started.
+    progress = Progress("Discolouring " + layer.name + "...")
+
+    # Set up an undo group, so the operation will be undone in one step.
+    pdb.gimp_image_undo_group_start(img)
+
+    # Convert the pixels to gray scale.
+    try:
+        # Get the region to process (the part of the layer inside the selection bounds).
+        roi = get_roi(img, layer)
+        if(roi is not None):
+            # Count the pixels to process.
+            count("pixels", roi.width * roi.height)
+            
+            # Get the pixel regions (the results are written in the shadow tiles, so the 
+            # operation can be undone without creating a new layer, and GIMP blends them
+            # with the original pixels at the edges of the selection).
+            srcRgn = layer.get_pixel_rgn(roi.x, roi.y, roi.width, roi.height, False, False)
+            dstRgn = layer.get_pixel_rgn(roi.x, roi.y, roi.width, roi.height, True, True)
+            
+            # Process the tiles as arrays of the type of the channels (the progress bar is
+            # updated when each tile is completed).
+            function = partial(discolour_buffer, typecode=pixel_format(layer).typecode)
+            scheduler = TileScheduler(function, int(workers), int(queueDepth), int(tilesPerJob))
+            scheduler.run(srcRgn, dstRgn, roi.width, roi.height, layer.bpp, gimp.tile_width(), gimp.tile_height(), progress.update, roi.x, roi.y)
+            
+            # Update the layer.
+            layer.flush()
+            layer.merge_shadow(True)
+            layer.update(roi.x, roi.y, roi.width, roi.height)
+    except Cancelled:
+        # Discard the results (the shadow tiles are not merged with the layer).
+        pass
+    except Exception as err:
+        error(err)
+        gimp.message("Unexpected error: " + str(err))
+    
+    # Close the undo group.
+    pdb.gimp_image_undo_group_end(img)
+    
+    # End progress.
+    progress.end()
+
+def discolour_layer_v4_new_layer(img, layer) :
+    ''' Converts a layer to gray scale in a new layer. This is the procedure of the 
+    original sample, which keeps his signature (without options) so the scripts that 
+    call it do not break.
+    
+    Parameters:
+    img : image The current image.
+    layer : layer The layer of the image that is selected.
+    '''
+    discolour_layer_v4(img, layer, False)
 
 register(
     "python_fu_test_discolour_layer_v4",
@@ -137,6 +257,38 @@ register(
     "RGB, RGB*",
     [],
     [],
+    discolour_layer_v4_new_layer)
+
+register(
+    "python_fu_test_discolour_layer_v4_options",
+    "Discolour layer v4 (options)",
+    "Converts a layer to gray scale. This version is the fastest, since it make use of tiles.",
+    "JFM",
+    "Open source (BSD 3-clause license)",
+    "2013",
+    "<Image>/Filters/Test/Discolour layer v4 (options)",
+    "RGB, RGB*",
+    [
+        (PF_TOGGLE, "inPlace", "Write in place (without a new layer)", True)
+    ],
+    [],
     discolour_layer_v4)
 
+register(
+    "python_fu_test_discolour_layer_v4_parallel",
+    "Discolour layer v4 (parallel)",
+    "Converts a layer to gray scale. This version converts the tiles in a pool of worker processes.",
+    "JFM",
+    "Open source (BSD 3-clause license)",
+    "2013",
+    "<Image>/Filters/Test/Discolour layer v4 (parallel)",
+    "RGB, RGB*",
+    [
+        (PF_SPINNER, "workers", "Workers (0 = one per CPU)", 0, (0, 64, 1)),
+        (PF_SPINNER, "queueDepth", "Queue depth (0 = automatic)", 0, (0, 1024, 1)),
+        (PF_SPINNER, "tilesPerJob", "Tiles per job", 1, (1, 256, 1))
+    ],
+    [],
+    discolour_layer_v4_parallel)
+
 main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2013, Jose F. Maldonado
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+#
+#    - Redistributions of source code must retain the above copyright notice, this 
+#    list of conditions and the following disclaimer.
+#    - Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation and/or 
+#    other materials provided with the distribution.
+#    - Neither the name of the author nor the names of its contributors may be used 
+#    to endorse or promote products derived from this software without specific prior 
+#    written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+# SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+# DAMAGE.
+#
+# -------------------------------------------------------------------------------------
+#
+# This file is a basic example of a Python plug-in for GIMP.
+#
+# It can be executed by selecting the menu option: 'Filters/Test/Discolour layer v5'
+# or by writing the following lines in the Python console (that can be opened with the
+# menu option 'Filters/Python-Fu/Console'):
+# >>> image = gimp.image_list()[0]
+# >>> layer = image.layers[0]
+# >>> gimp.pdb.python_fu_test_discolour_layer_v5(image, layer, True, 0)
+
+from gimpfu import *
+from fusamples.instrument import count, error, instrumented, span
+from fusamples.lut import LUMINANCES, compile_op
+from fusamples.pixels import discolour_buffer, pixel_format
+from fusamples.progress import Cancelled, Progress
+from fusamples.roi import get_roi
+from fusamples.scan import Scan
+
+@instrumented
+def discolour_layer_v5(img, layer, useNumpy, luminance) :
+    ''' Converts a layer to gray scale, without modifying his type (RGB or RGBA).
+    This version reads the whole layer into a single buffer and converts it with
+    vectorized operations (using NumPy if it is installed, or the 'array' module 
+    otherwise), so no Python code is executed for each pixel. Besides the average of 
+    the RGB channels, the gray value can be the Rec.601, Rec.709 or linear light 
+    luminance, calculated with fixed-point lookup tables (see fusamples/lut.py). The 
+    average supports channels of 8, 16 or 32 bits and floats, while the luminances 
+    only support 8 bits per channel.
+    
+    Parameters:
+    img : image The current image.
+    layer : layer The layer of the image that is selected.
+    useNumpy : bool Indicates if NumPy must be used (when it is installed).
+    luminance : int The index of the gray conversion (0 = average, 1 = Rec.601, 2 = Rec.709, 3 = linear light).
+    '''
+    # Indicates that the process has started.
+    progress = Progress("Discolouring " + layer.name + "...")
+
+    # Set up an undo group, so the operation will be undone in one step.
+    pdb.gimp_image_undo_group_start(img)
+
+    # Convert the pixels to gray scale.
+    try:
+        # Get the region to process (the part of the layer inside the selection bounds).
+        roi = get_roi(img, layer)
+        if(roi is not None):
+            # Count the pixels to process.
+            count("pixels", roi.width * roi.height)
+            
+            # Get the pixel regions (the results are written in the shadow tiles, so the 
+            # operation can be undone without creating a new layer, and GIMP blends them
+            # with the original pixels at the edges of the selection).
+            srcRgn = layer.get_pixel_rgn(roi.x, roi.y, roi.width, roi.height, False, False)
+            dstRgn = layer.get_pixel_rgn(roi.x, roi.y, roi.width, roi.height, True, True)
+            
+            # Read all the pixels in one buffer (the region is walked as a single band).
+            scan = Scan(roi, layer.bpp, roi.height)
+            with span("read"):
+                data = scan.read(srcRgn, roi.y, roi.y2)
+            progress.update(0.33)
+            
+            # Convert the buffer and write it back in one assignment.
+            with span("compute"):
+                name = LUMINANCES[int(luminance)]
+                typecode = pixel_format(layer).typecode
+                if(name == "average"):
+                    result = discolour_buffer(data, layer.bpp, useNumpy, typecode)
+                elif(typecode != "B"):
+                    raise ValueError("the luminances only support 8 bits per channel")
+                else:
+                    result = compile_op("gray", luminance=name).mix.apply(data, layer.bpp, useNumpy)
+            progress.update(0.66)
+            with span("write"):
+                scan.write(dstRgn, roi.y, roi.y2, result)
+            
+            # Update the layer.
+            layer.flush()
+            layer.merge_shadow(True)
+            layer.update(roi.x, roi.y, roi.width, roi.height)
+    except Cancelled:
+        # Discard the results (the shadow tiles are not merged with the layer).
+        pass
+    except Exception as err:
+        error(err)
+        gimp.message("Unexpected error: " + str(err))
+    
+    # Close the undo group.
+    pdb.gimp_image_undo_group_end(img)
+    
+    # End progress.
+    progress.end()
+
+register(
+    "python_fu_test_discolour_layer_v5",
+    "Discolour layer v5",
+    "Converts a layer to gray scale. This version reads the whole layer into one buffer and converts it with vectorized operations (NumPy, or the 'array' module if NumPy is not installed).",
+    "JFM",
+    "Open source (BSD 3-clause license)",
+    "2013",
+    "<Image>/Filters/Test/Discolour layer v5",
+    "RGB, RGB*",
+    [
+        (PF_TOGGLE, "useNumpy", "Use NumPy (if installed)", True),
+        (PF_OPTION, "luminance", "Gray value", 0, ["Average", "Rec.601 luminance", "Rec.709 luminance", "Linear light luminance"])
+    ],
+    [],
+    discolour_layer_v5)
+
+main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2013, Jose F. Maldonado
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+#
+#    - Redistributions of source code must retain the above copyright notice, this 
+#    list of conditions and the following disclaimer.
+#    - Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation and/or 
+#    other materials provided with the distribution.
+#    - Neither the name of the author nor the names of its contributors may be used 
+#    to endorse or promote products derived from this software without specific prior 
+#    written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+# SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+# DAMAGE.
+#
+# -------------------------------------------------------------------------------------
+#
+# This file is a basic example of a Python plug-in for GIMP.
+#
+# It can be executed by selecting the menu option: 'Filters/Test/Discolour layers'
+# or by writing the following lines in the Python console (that can be opened with the
+# menu option 'Filters/Python-Fu/Console'):
+# >>> image = gimp.image_list()[0]
+# >>> gimp.pdb.python_fu_test_discolour_layers(image, image.layers[0], False, "", True, 0, 0, 1)
+
+import fnmatch
+from functools import partial
+from gimpfu import *
+from fusamples.batch import parse_patterns
+from fusamples.instrument import count, error, instrumented
+from fusamples.pixels import discolour_buffer, pixel_format
+from fusamples.progress import Cancelled, Progress
+from fusamples.roi import get_roi
+from fusamples.scheduler import TileScheduler
+
+def pixel_layers(layers, parent=None, positions=None):
+    ''' Returns the layers of a list which have pixels, including the layers inside the
+    layer groups (recursively), from top to bottom.
+    
+    Parameters:
+    layers : list The layers (for example image.layers).
+    parent : layer The layer group which contains the layers (None for the layers of the image).
+    positions : dict A dictionary in which the parent and the position of each returned layer are stored, as {layer: (parent, position)}, or None.
+    '''
+    result = []
+    for position, layer in enumerate(layers):
+        if(hasattr(layer, "layers")):
+            result.extend(pixel_layers(layer.layers, layer, positions))
+        else:
+            result.append(layer)
+            if(positions is not None):
+                positions[layer] = (parent, position)
+    return result
+
+@instrumented
+def discolour_layers(img, layer, allImages, layerNames, inPlace, workers, queueDepth, tilesPerJob) :
+    ''' Converts all the layers of an image (or of all the open images), including the
+    layers inside layer groups, to gray scale, without modifying their type (RGB or 
+    RGBA). The tiles of all the layers are processed in the same pool of worker 
+    processes, with a single progress bar and a single undo group for each image. The
+    channels can have 8, 16 or 32 bits, or be floats.
+    
+    Parameters:
+    img : image The current image.
+    layer : layer The layer of the image that is selected (unused).
+    allImages : bool Indicates if the layers of all the open images must be processed, instead of only the ones of the current image.
+    layerNames : string The glob patterns of the names of the layers to process, separated by commas (empty for all the layers).
+    inPlace : bool Indicates if the results must be written in the shadow tiles of the layers, instead of in new layers.
+    workers : int The number of worker processes (0 for one per CPU).
+    queueDepth : int The maximum number of jobs being processed at the same time (0 for twice the number of workers).
+    tilesPerJob : int The number of tiles sent to a worker in each job.
+    '''
+    # Indicates that the process has started.
+    progress = Progress("Discolouring layers...")
+    
+    # Get the images to process.
+    images = gimp.image_list() if allImages else [img]
+
+    # Set up an undo group in each image, so the operation will be undone in one step.
+    for image in images:
+        pdb.gimp_image_undo_group_start(image)
+
+    # Convert the pixels to gray scale.
+    try:
+        patterns = parse_patterns(layerNames)
+        regions = {}
+        targets = []
+        for image in images:
+            # Iterate over the layers, including the ones inside layer groups (the list is
+            # generated before processing them, so it does not include the new layers).
+            # The tree of layers is walked once, so the parent and the position of each
+            # layer are known without calling the PDB.
+            positions = {}
+            inserted = {}
+            for srcLayer in pixel_layers(image.layers, None, positions):
+                # Skip the layers which are not RGB and the layers whose names do not match
+                # the patterns.
+                if(not srcLayer.is_rgb):
+                    continue
+                if(patterns and not [p for p in patterns if fnmatch.fnmatchcase(srcLayer.name, p)]):
+                    continue
+                
+                # Get the region to process (the part of the layer inside the selection bounds).
+                roi = get_roi(image, srcLayer)
+                if(roi is None):
+                    continue
+                
+                # Get the layer in which the results are saved (a copy of the layer, above
+                # it and in the same layer group, if they are not written in place).
+                dstLayer = srcLayer
+                if(not inPlace):
+                    dstLayer = srcLayer.copy()
+                    dstLayer.name = srcLayer.name + " temp"
+                    
+                    # The copies inserted above the previous layers of the same group 
+                    # have moved the layer down.
+                    parent, position = positions[srcLayer]
+                    position += inserted.get(parent, 0)
+                    inserted[parent] = inserted.get(parent, 0) + 1
+                    pdb.gimp_image_insert_layer(image, dstLayer, parent, position)
+                
+                # Get the pixel regions (the results are written in the shadow tiles, and
+                # GIMP blends them with the original pixels at the edges of the selection),
+                # grouped by the type of their channels.
+                srcRgn = srcLayer.get_pixel_rgn(roi.x, roi.y, roi.width, roi.height, False, False)
+                dstRgn = dstLayer.get_pixel_rgn(roi.x, roi.y, roi.width, roi.height, True, True)
+                regions.setdefault(pixel_format(srcLayer).typecode, []).append((srcRgn, dstRgn, roi.x, roi.y, roi.width, roi.height, srcLayer.bpp))
+                targets.append((image, srcLayer, dstLayer, roi))
+                
+                # Count the pixels to process.
+                count("pixels", roi.width * roi.height)
+        
+        # Process the tiles of all the layers, with a scheduler for each type of channels
+        # (the progress bar is updated when each tile is completed).
+        total = float(sum([roi.width * roi.height for image, srcLayer, dstLayer, roi in targets]))
+        done = 0
+        for typecode, typeRegions in sorted(regions.items()):
+            pixels = sum([region[4] * region[5] for region in typeRegions])
+            start = done / total
+            part = pixels / total
+            scheduler = TileScheduler(partial(discolour_buffer, typecode=typecode), int(workers), int(queueDepth), int(tilesPerJob))
+            scheduler.run_regions(typeRegions, gimp.tile_width(), gimp.tile_height(), progress.scaled(start, part))
+            done += pixels
+        
+        # Update the layers.
+        for image, srcLayer, dstLayer, roi in targets:
+            dstLayer.flush()
+            dstLayer.merge_shadow(True)
+            dstLayer.update(roi.x, roi.y, roi.width, roi.height)
+            
+            if(not inPlace):
+                # Remove the old layer, and change the name of the new layer (two layers
+                # can not have the same name).
+                layerName = srcLayer.name
+                image.remove_layer(srcLayer)
+                dstLayer.name = layerName
+        count("layers", len(targets))
+    except Cancelled:
+        # Discard the results (the shadow tiles are not merged, and the new layers are removed).
+        if(not inPlace):
+            for image, srcLayer, dstLayer, roi in targets:
+                image.remove_layer(dstLayer)
+    except Exception as err:
+        error(err)
+        gimp.message("Unexpected error: " + str(err))
+    
+    # Close the undo groups.
+    for image in images:
+        pdb.gimp_image_undo_group_end(image)
+    
+    # End progress.
+    progress.end()
+
+register(
+    "python_fu_test_discolour_layers",
+    "Discolour layers",
+    "Converts all the layers of an image (or of all the open images) to gray scale, processing the tiles of all the layers in a pool of worker processes.",
+    "JFM",
+    "Open source (BSD 3-clause license)",
+    "2013",
+    "<Image>/Filters/Test/Discolour layers",
+    "RGB, RGB*",
+    [
+        (PF_TOGGLE, "allImages", "All the open images", False),
+        (PF_STRING, "layerNames", "Layer names (like Shadow*,Text*)", ""),
+        (PF_TOGGLE, "inPlace", "Write in place (without new layers)", True),
+        (PF_SPINNER, "workers", "Workers (0 = one per CPU)", 0, (0, 64, 1)),
+        (PF_SPINNER, "queueDepth", "Queue depth (0 = automatic)", 0, (0, 1024, 1)),
+        (PF_SPINNER, "tilesPerJob", "Tiles per job", 1, (1, 256, 1))
+    ],
+    [],
+    discolour_layers)
+
+main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2013, Jose F. Maldonado
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+#
+#    - Redistributions of source code must retain the above copyright notice, this 
+#    list of conditions and the following disclaimer.
+#    - Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation and/or 
+#    other materials provided with the distribution.
+#    - Neither the name of the author nor the names of its contributors may be used 
+#    to endorse or promote products derived from this software without specific prior 
+#    written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+# SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+# DAMAGE.
+#
+# -------------------------------------------------------------------------------------
+#
+# This file is a basic example of a Python plug-in for GIMP.
+#
+# It can be executed by selecting the menu option: 'Filters/Test/Filter pipeline'
+# or by writing the following lines in the Python console (that can be opened with the
+# menu option 'Filters/Python-Fu/Console'):
+# >>> image = gimp.image_list()[0]
+# >>> layer = image.layers[0]
+# >>> gimp.pdb.python_fu_test_filter_pipeline(image, layer, "discolour|invert|split:R,G,B")
+
+from gimpfu import *
+from fusamples.instrument import count, error, instrumented
+from fusamples.pipeline import parse_pipeline
+from fusamples.pixels import has_8_bits, new_channel_layers
+from fusamples.progress import Cancelled, Progress
+from fusamples.roi import blend, get_roi
+from fusamples.scan import Scan
+
+@instrumented
+def filter_pipeline(img, layer, spec) :
+    ''' Applies a pipeline of filters (like "discolour|invert|split:R,G,B") to a layer.
+    The stages are fused, so each row of tiles is read only once, transformed by all
+    the stages in memory and written once, without intermediate layers. If the pipeline
+    ends with a split, a layer is created for each channel, otherwise the layer is 
+    modified in place.
+    
+    Parameters:
+    img : image The current image.
+    layer : layer The layer of the image that is selected.
+    spec : string The stages of the pipeline separated by '|' (discolour, invert, channel:<R|G|B> and split:<channels>).
+    '''
+    # Indicates that the process has started.
+    progress = Progress("Filtering " + layer.name + "...")
+
+    # Set up an undo group, so the operation will be undone in one step.
+    pdb.gimp_image_undo_group_start(img)
+
+    try:
+        # The stages use lookup tables of 256 values, so only 8 bits per channel are supported.
+        if(not has_8_bits(layer)):
+            raise ValueError("only the images with 8 bits per channel are supported")
+        
+        # Parse and fuse the stages.
+        pipeline = parse_pipeline(spec)
+        pipeline.prepare(layer.bpp)
+        
+        # Get the region to process (the part of the layer inside the selection bounds).
+        roi = get_roi(img, layer)
+        if(roi is None):
+            raise ValueError("the selection does not intersect the layer")
+        
+        # Count the pixels to process.
+        count("pixels", roi.width * roi.height)
+        srcRgn = layer.get_pixel_rgn(roi.x, roi.y, roi.width, roi.height, False, False)
+        
+        # Get the layers in which the results are saved. Without split, the results are 
+        # written in the shadow tiles of the layer (and GIMP blends them with the original 
+        # pixels at the edges of the selection). Otherwise a layer is created for each 
+        # channel.
+        if(pipeline.channels is None):
+            dstLayers = [layer]
+            dstRgns = [layer.get_pixel_rgn(roi.x, roi.y, roi.width, roi.height, True, True)]
+        else:
+            dstLayers = new_channel_layers(img, layer, pipeline.channels, roi)
+            dstRgns = [dstLayer.get_pixel_rgn(roi.x, roi.y, roi.width, roi.height, True, False) for dstLayer in dstLayers]
+        
+        # Iterate over the rows of tiles.
+        scan = Scan(roi, layer.bpp, gimp.tile_height())
+        for y, y2 in scan.bands():
+            # Update the progress bar.
+            progress.update(scan.progress(y))
+            
+            # Read the row, apply all the stages and write each output with a single 
+            # assignment (blending the new layers at the edges of the selection).
+            results = pipeline.process(scan.read(srcRgn, y, y2), layer.bpp)
+            mask = None if pipeline.channels is None else roi.mask(roi.x, y, roi.x2, y2)
+            for dstRgn, data in zip(dstRgns, results):
+                if(mask is not None):
+                    data = blend(data, scan.read(dstRgn, y, y2), mask, layer.bpp)
+                scan.write(dstRgn, y, y2, data)
+        
+        # Update the layers.
+        for dstLayer in dstLayers:
+            dstLayer.flush()
+            dstLayer.merge_shadow(True)
+            dstLayer.update(roi.x, roi.y, roi.width, roi.height)
+    except Cancelled:
+        # Discard the results (the shadow tiles are not merged, and the new layers are removed).
+        if(pipeline.channels is not None):
+            for dstLayer in dstLayers:
+                img.remove_layer(dstLayer)
+    except Exception as err:
+        error(err)
+        gimp.message("Unexpected error: " + str(err))
+    
+    # Close the undo group.
+    pdb.gimp_image_undo_group_end(img)
+    
+    # End progress.
+    progress.end()
+
+register(
+    "python_fu_test_filter_pipeline",
+    "Filter pipeline",
+    "Applies a pipeline of filters (like 'discolour|invert|split:R,G,B') to a layer, reading and writing each tile only once.",
+    "JFM",
+    "Open source (BSD 3-clause license)",
+    "2013",
+    "<Image>/Filters/Test/Filter pipeline",
+    "RGB, RGB*",
+    [
+        (PF_STRING, "spec", "Pipeline (discolour, invert, channel:R, split:R,G,B)", "discolour|invert")
+    ],
+    [],
+    filter_pipeline)
+
+main()
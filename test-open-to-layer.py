@@ -29,7 +29,10 @@
 # DAMAGE.
 
 from gimpfu import *
+from fusamples import formats
+from fusamples.instrument import error, instrumented
 
+@instrumented
 def open_to_layer(image, layer, file):
     ''' Save the current layer into a PNG file, a JPEG file and a BMP file.
     
@@ -42,16 +45,11 @@ def open_to_layer(image, layer, file):
     gimp.progress_init("Opening '" + file + "'...")
     
     try:
-        # Open file.
+        # Open file (his format is identified by his extension or by his first bytes).
         fileImage = None
-        if(file.lower().endswith(('.png'))):
-            fileImage = pdb.file_png_load(file, file)
-        if(file.lower().endswith(('.jpeg', '.jpg'))):
-            fileImage = pdb.file_jpeg_load(file, file)
-        if(file.lower().endswith(('.bmp'))):
-            fileImage = pdb.file_bmp_load(file, file)
-        if(file.lower().endswith(('.gif'))):
-            fileImage = pdb.file_gif_load(file, file)
+        fileFormat = formats.resolve(file, True)
+        if(fileFormat is not None and fileFormat.can_load()):
+            fileImage = fileFormat.load(file)
         
         if(fileImage is None):
             gimp.message("The image could not be opened since it is not an image file.")
@@ -71,6 +69,7 @@ def open_to_layer(image, layer, file):
             newLayer.update(0, 0, newLayer.width, newLayer.height)
         
     except Exception as err:
+        error(err)
         gimp.message("Unexpected error: " + str(err))
     
 register(
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+#
+# -------------------------------------------------------------------------------------
+#
+# Copyright (c) 2013, Jose F. Maldonado
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, 
+# are permitted provided that the following conditions are met:
+#
+#    - Redistributions of source code must retain the above copyright notice, this 
+#    list of conditions and the following disclaimer.
+#    - Redistributions in binary form must reproduce the above copyright notice, 
+#    this list of conditions and the following disclaimer in the documentation and/or 
+#    other materials provided with the distribution.
+#    - Neither the name of the author nor the names of its contributors may be used 
+#    to endorse or promote products derived from this software without specific prior 
+#    written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+# SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+# DAMAGE.
+#
+# -------------------------------------------------------------------------------------
+#
+# This file is a basic example of a Python plug-in for GIMP.
+#
+# It can be executed by selecting the menu option: 'Filters/Test/Point operation'
+# or by writing the following lines in the Python console (that can be opened with the
+# menu option 'Filters/Python-Fu/Console'):
+# >>> image = gimp.image_list()[0]
+# >>> layer = image.layers[0]
+# >>> gimp.pdb.python_fu_test_point_operation(image, layer, 0)
+
+from gimpfu import *
+from fusamples.instrument import count, error, instrumented
+from fusamples.lut import compile_op
+from fusamples.pixels import has_8_bits
+from fusamples.progress import Cancelled, Progress
+from fusamples.roi import get_roi
+from fusamples.scan import Scan
+
+# The operations of the menu (name and parameters of the point operation).
+OPERATIONS = [
+    ("discolour", {}),
+    ("invert", {}),
+    ("channel", { "channel": 0 }),
+    ("channel", { "channel": 1 }),
+    ("channel", { "channel": 2 }),
+    ("gray", { "luminance": "rec601" }),
+    ("gray", { "luminance": "rec709" }),
+    ("gray", { "luminance": "linear" }),
+]
+
+@instrumented
+def point_operation(img, layer, operation) :
+    ''' Applies a point operation (discolour, invert or the extraction of a channel) to 
+    a layer. The operation is compiled into lookup tables, which are applied to a row of
+    tiles at a time with str.translate() (or NumPy), so no Python code is executed for
+    each pixel.
+    
+    Parameters:
+    img : image The current image.
+    layer : layer The layer of the image that is selected.
+    operation : int The index of the operation (0 = discolour, 1 = invert, 2 = red channel, 3 = green channel, 4 = blue channel, 5 = Rec.601 gray, 6 = Rec.709 gray, 7 = linear light gray).
+    '''
+    # Indicates that the process has started.
+    progress = Progress("Processing " + layer.name + "...")
+
+    # Set up an undo group, so the operation will be undone in one step.
+    pdb.gimp_image_undo_group_start(img)
+
+    try:
+        # The lookup tables have 256 values, so only 8 bits per channel are supported.
+        if(not has_8_bits(layer)):
+            raise ValueError("only the images with 8 bits per channel are supported")
+        
+        # Get the lookup tables of the operation (they are compiled only once).
+        name, params = OPERATIONS[int(operation)]
+        op = compile_op(name, **params)
+        
+        # Get the region to process (the part of the layer inside the selection bounds).
+        roi = get_roi(img, layer)
+        if(roi is not None):
+            # Count the pixels to process.
+            count("pixels", roi.width * roi.height)
+            
+            # Get the pixel regions (the results are written in the shadow tiles, so the 
+            # operation can be undone without creating a new layer, and GIMP blends them
+            # with the original pixels at the edges of the selection).
+            srcRgn = layer.get_pixel_rgn(roi.x, roi.y, roi.width, roi.height, False, False)
+            dstRgn = layer.get_pixel_rgn(roi.x, roi.y, roi.width, roi.height, True, True)
+            
+            # Process the region by rows of tiles.
+            scan = Scan(roi, layer.bpp, gimp.tile_height())
+            for y1, y2 in scan.bands():
+                scan.write(dstRgn, y1, y2, op.apply(scan.read(srcRgn, y1, y2), layer.bpp))
+                progress.update(scan.progress(y2))
+            
+            # Update the layer.
+            layer.flush()
+            layer.merge_shadow(True)
+            layer.update(roi.x, roi.y, roi.width, roi.height)
+    except Cancelled:
+        # Discard the results (the shadow tiles are not merged with the layer).
+        pass
+    except Exception as err:
+        error(err)
+        gimp.message("Unexpected error: " + str(err))
+    
+    # Close the undo group.
+    pdb.gimp_image_undo_group_end(img)
+    
+    # End progress.
+    progress.end()
+
+register(
+    "python_fu_test_point_operation",
+    "Point operation",
+    "Applies a point operation (discolour, invert or extract a channel) to a layer, using precomputed lookup tables.",
+    "JFM",
+    "Open source (BSD 3-clause license)",
+    "2013",
+    "<Image>/Filters/Test/Point operation",
+    "RGB, RGB*",
+    [
+        (PF_OPTION, "operation", "Operation", 0, ["Discolour", "Invert", "Red channel", "Green channel", "Blue channel", "Gray (Rec.601)", "Gray (Rec.709)", "Gray (linear light)"])
+    ],
+    [],
+    point_operation)
+
+main()
@@ -29,41 +29,72 @@
 # DAMAGE.
 
 from gimpfu import *
+from fusamples.export import export_layer, parse_profiles
+from fusamples.instrument import error, instrumented
 
-def save_to_files(image, layer, outputFolder):
-    ''' Save the current layer into a PNG file, a JPEG file and a BMP file.
+# Profiles of the files saved by the original procedure.
+DEFAULT_PROFILES = "png,jpeg,bmp"
+
+@instrumented
+def save_to_files(image, layer, outputFolder, profiles):
+    ''' Save the current layer into several files (by default a PNG file, a JPEG file and a BMP file).
     
     Parameters:
     image : image The current image.
     layer : layer The layer of the image that is selected.
     outputFolder : string The folder in which to save the images.
+    profiles : string The encoder profiles to use, separated by commas (see fusamples/export.py).
     '''
     # Indicates that the process has started.
     gimp.progress_init("Saving to '" + outputFolder + "'...")
     
     try:
-        # Save as PNG
-        gimp.pdb.file_png_save(image, layer, outputFolder + "\\" + layer.name + ".png", "raw_filename", 0, 9, 0, 0, 0, 0, 0)
-        
-        # Save as JPEG
-        gimp.pdb.file_jpeg_save(image, layer, outputFolder + "\\" + layer.name + ".jpg", "raw_filename", 0.9, 0, 0, 0, "Creating with GIMP", 0, 0, 0, 0)
-        
-        # Save as BMP
-        gimp.pdb.file_bmp_save(image, layer, outputFolder + "\\" + layer.name + ".bmp", "raw_filename")
+        # Save the files and display the time and size of each one.
+        results = export_layer(image, layer, outputFolder, layer.name, parse_profiles(profiles))
+        gimp.message("; ".join([str(result) for result in results]))
     except Exception as err:
+        error(err)
         gimp.message("Unexpected error: " + str(err))
+
+def save_to_default_files(image, layer, outputFolder):
+    ''' Save the current layer into a PNG file, a JPEG file and a BMP file. This is the 
+    procedure of the original sample, which keeps his signature so the scripts that 
+    call it do not break.
+    
+    Parameters:
+    image : image The current image.
+    layer : layer The layer of the image that is selected.
+    outputFolder : string The folder in which to save the images.
+    '''
+    save_to_files(image, layer, outputFolder, DEFAULT_PROFILES)
     
 register(
     "python_fu_test_save_to_files",
     "Save to files",
-    "Save the current layer into a PNG file, a JPEG file and a BMP file.",
+    "Save the current layer into several files (a PNG file, a JPEG file and a BMP file).",
     "JFM",
     "Open source (BSD 3-clause license)",
     "2013",
     "<Image>/Filters/Test/Save to files",
     "*",
+    [
+        (PF_DIRNAME, "outputFolder", "Output directory", "")
+    ],
+    [],
+    save_to_default_files)
+
+register(
+    "python_fu_test_save_to_files_profiles",
+    "Save to files (profiles)",
+    "Save the current layer into several files, using encoder profiles (by default a PNG file, a JPEG file and a BMP file).",
+    "JFM",
+    "Open source (BSD 3-clause license)",
+    "2013",
+    "<Image>/Filters/Test/Save to files (profiles)",
+    "*",
     [
         (PF_DIRNAME, "outputFolder", "Output directory", ""),
+        (PF_STRING, "profiles", "Encoder profiles", DEFAULT_PROFILES),
     ],
     [],
     save_to_files)
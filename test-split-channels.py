@@ -38,106 +38,108 @@
 # >>> image = gimp.image_list()[0]
 # >>> layer = image.layers[0]
 # >>> gimp.pdb.python_fu_test_split_channels(image, layer)
+#
+# The channels to extract can be chosen in the menu option 'Filters/Test/Split channels
+# (options)', or by writing:
+# >>> gimp.pdb.python_fu_test_split_channels_options(image, layer, "R,G,B,A")
 
 from gimpfu import *
+from fusamples.instrument import count, error, instrumented
+from fusamples.pixels import CHANNELS, ChannelSplitter, new_channel_layers, pixel_format
+from fusamples.progress import Cancelled, Progress
+from fusamples.roi import blend, get_roi
+from fusamples.scan import Scan
 
-def split_channels(img, layer) :
-    ''' Creates three layers with the RGB channels of the selected layer.
+@instrumented
+def split_channels(img, layer, channels) :
+    ''' Creates a layer for each selected channel of the selected layer.
+    The source layer is read only once, one row of tiles at a time, and the
+    channels are separated with bulk operations over each row (as arrays of the
+    type of the channels, which can have 8, 16 or 32 bits or be floats).
     
     Parameters:
     img : image The current image.
     layer : layer The layer of the image that is selected.
+    channels : string The channels to extract, separated by commas (for example "R,G,B" or "A").
     '''
     # Indicates that the process has started.
-    gimp.progress_init("Discolouring " + layer.name + "...")
+    progress = Progress("Splitting " + layer.name + "...")
 
     # Set up an undo group, so the operation will be undone in one step.
     pdb.gimp_image_undo_group_start(img)
-
-    # Get the layer position.
-    pos = 0;
-    for i in range(len(img.layers)):
-        if(img.layers[i] == layer):
-            pos = i
-            
-    # Create the new layers.
-    layerR = gimp.Layer(img, layer.name + " Red", layer.width, layer.height, layer.type, layer.opacity, layer.mode)
-    layerG = gimp.Layer(img, layer.name + " Green", layer.width, layer.height, layer.type, layer.opacity, layer.mode)
-    layerB = gimp.Layer(img, layer.name + " Blue", layer.width, layer.height, layer.type, layer.opacity, layer.mode)
-    img.add_layer(layerR, pos)
-    img.add_layer(layerG, pos)
-    img.add_layer(layerB, pos)
-    
-    # Clear the new layers.
-    pdb.gimp_edit_clear(layerR)
-    layerR.flush()
-    pdb.gimp_edit_clear(layerG)
-    layerG.flush()
-    pdb.gimp_edit_clear(layerB)
-    layerB.flush()
     
+    # Get the region to process (the part of the layer inside the selection bounds).
+    roi = get_roi(img, layer)
+    if(roi is None):
+        gimp.message("The selection does not intersect the layer.")
+        pdb.gimp_image_undo_group_end(img)
+        progress.end()
+        return
+
     # Separate the channels.
+    newLayers = []
     try:
-        # Calculate the number of tiles.
-        tn = int(layer.width / 64)
-        if(layer.width % 64 > 0):
-            tn += 1
-        tm = int(layer.height / 64)
-        if(layer.height % 64 > 0):
-            tm += 1
+        # Parse the channels.
+        names = [name.strip().upper() for name in channels.split(",") if name.strip()]
+        for name in names:
+            if(name not in CHANNELS):
+                raise ValueError("unknown channel '" + name + "'")
+        typecode = pixel_format(layer).typecode
+        splitter = ChannelSplitter(layer.bpp, [CHANNELS[name] for name in names], typecode)
         
-        # Iterate over the tiles.
-        for i in range(tn):
-            for j in range(tm):
-                # Update the progress bar.
-                gimp.progress_update(float(i*tm + j) / float(tn*tm))
+        # Count the pixels to process.
+        count("pixels", roi.width * roi.height)
         
-                # Get the tiles.
-                tile = layer.get_tile(False, j, i)
-                tileR = layerR.get_tile(False, j, i)
-                tileG = layerG.get_tile(False, j, i)
-                tileB = layerB.get_tile(False, j, i)
+        # Create the new layers.
+        srcRgn = layer.get_pixel_rgn(roi.x, roi.y, roi.width, roi.height, False, False)
+        newLayers = new_channel_layers(img, layer, names, roi)
+        dstRgns = [newLayer.get_pixel_rgn(roi.x, roi.y, roi.width, roi.height, True, False) for newLayer in newLayers]
         
-                # Iterate over the pixels of each tile.
-                for x in range(tile.ewidth):
-                    for y in range(tile.eheight):
-                        # Get the pixel and separate his colors.
-                        pixel = tile[x,y]
-                        pixelR = pixel[0] + "\x00\x00"
-                        pixelG = "\x00" + pixel[1] + "\x00"
-                        pixelB = "\x00\x00" + pixel[2]
-                        
-                        # If the image has an alpha channel (or any other channel) copy his values.
-                        if(len(pixel) > 3):
-                            for k in range(len(pixel)-3):
-                                pixelR += pixel[k+3]
-                                pixelG += pixel[k+3]
-                                pixelB += pixel[k+3]
-                                
-                        # Save the value in the channel layers.
-                        tileR[x,y] = pixelR
-                        tileG[x,y] = pixelG
-                        tileB[x,y] = pixelB
+        # Iterate over the rows of tiles.
+        scan = Scan(roi, layer.bpp, gimp.tile_height())
+        for y, y2 in scan.bands():
+            # Update the progress bar.
+            progress.update(scan.progress(y))
+            
+            # Read the row and write each channel with a single assignment (blending it
+            # with the cleared layer at the edges of the selection).
+            results = splitter.split(scan.read(srcRgn, y, y2))
+            mask = roi.mask(roi.x, y, roi.x2, y2)
+            for dstRgn, data in zip(dstRgns, results):
+                if(mask is not None):
+                    data = blend(data, scan.read(dstRgn, y, y2), mask, layer.bpp, typecode)
+                scan.write(dstRgn, y, y2, data)
         
         # Update the new layers.
-        tileR.flush()
-        tileR.merge_shadow(True)
-        tileR.update(0, 0, tileR.width, tileR.height)
-        tileG.flush()
-        tileG.merge_shadow(True)
-        tileG.update(0, 0, tileG.width, tileG.height)
-        tileB.flush()
-        tileB.merge_shadow(True)
-        tileB.update(0, 0, tileB.width, tileB.height)
+        for newLayer in newLayers:
+            newLayer.flush()
+            newLayer.merge_shadow(True)
+            newLayer.update(0, 0, newLayer.width, newLayer.height)
         
+    except Cancelled:
+        # Discard the results (the new layers are removed).
+        for newLayer in newLayers:
+            img.remove_layer(newLayer)
     except Exception as err:
+        error(err)
         gimp.message("Unexpected error: " + str(err))
     
     # Close the undo group.
     pdb.gimp_image_undo_group_end(img)
     
     # End progress.
-    pdb.gimp_progress_end()
+    progress.end()
+
+def split_channels_rgb(img, layer) :
+    ''' Creates three layers with the RGB channels of the selected layer. This is the 
+    procedure of the original sample, which keeps his signature (without options) so 
+    the scripts that call it do not break.
+    
+    Parameters:
+    img : image The current image.
+    layer : layer The layer of the image that is selected.
+    '''
+    split_channels(img, layer, "R,G,B")
 
 register(
     "python_fu_test_split_channels",
@@ -150,6 +152,21 @@ register(
     "RGB, RGB*",
     [],
     [],
+    split_channels_rgb)
+
+register(
+    "python_fu_test_split_channels_options",
+    "Split channels (options)",
+    "Creates a layer for each selected channel (R, G, B or A) of the selected layer.",
+    "JFM",
+    "Open source (BSD 3-clause license)",
+    "2013",
+    "<Image>/Filters/Test/Split channels (options)",
+    "RGB, RGB*",
+    [
+        (PF_STRING, "channels", "Channels (R,G,B,A)", "R,G,B")
+    ],
+    [],
     split_channels)
 
 main()